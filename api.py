@@ -0,0 +1,193 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+
+from metrics import REGISTRY
+from subtitles import render
+
+UPLOAD_BLOCK_BYTES = 1 << 20
+# How often a waiting transcription checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 0.5
+
+MEDIA_TYPES = {"txt": "text/plain", "srt": "application/x-subrip", "vtt": "text/vtt"}
+
+
+# Body of a request (raw audio bytes, or the "file" field of a multipart form) streamed
+# to a temporary file, so large uploads never sit in memory whole. Caller removes it.
+async def save_upload(request):
+    tmp = tempfile.NamedTemporaryFile(prefix="upload-", delete=False)
+    try:
+        with tmp:
+            if request.headers.get("content-type", "").startswith("multipart/form-data"):
+                form = await request.form()
+                upload = form.get("file")
+                if upload is None or isinstance(upload, str):
+                    raise HTTPException(400, "multipart body needs a 'file' field")
+                # Starlette has already spooled the part to disk above 1 MB
+                shutil.copyfileobj(upload.file, tmp, UPLOAD_BLOCK_BYTES)
+            else:
+                async for chunk in request.stream():
+                    tmp.write(chunk)
+            if tmp.tell() == 0:
+                raise HTTPException(400, "request body is empty")
+    except BaseException:
+        os.remove(tmp.name)
+        raise
+    return tmp.name
+
+
+def format_segments(segments):
+    return [
+        {"id": s["id"], "start": s["start"], "end": s["end"], "text": s["text"].strip()}
+        for s in segments
+    ]
+
+
+def format_result(result):
+    translation = result.get("translation")
+    return {
+        "text": result["text"].strip(),
+        "language": result["language"],
+        "language_probs": result.get("language_probs"),
+        "segments": format_segments(result["segments"]),
+        "translation": None if translation is None else {
+            "text": translation["text"].strip(),
+            "segments": format_segments(translation["segments"]),
+        },
+        "audio_seconds": result["audio_seconds"],
+        "model": result.get("model"),
+        "latency_profile": result.get("latency_profile"),
+        "timings": result["timings"],
+        "decoding": result.get("decoding"),
+        "cascade": result.get("cascade"),
+        "profile": result.get("profile"),
+    }
+
+
+# Headless HTTP API over a TranscriptionService. Transcriptions go through the
+# service's job queue (short jobs first) and are cancelled if the client disconnects;
+# language detection runs on a bounded thread pool of max_concurrency (default: the
+# service's job workers). Beyond max_concurrency + max_queue requests in flight, new
+# ones get 429 with the current queue depth before their body is read, instead of
+# piling up uploads, threads and memory.
+def create_api(service, max_concurrency=None, max_queue=16):
+    max_concurrency = max_concurrency or service.jobs.workers
+    executor = ThreadPoolExecutor(max_concurrency, thread_name_prefix="api")
+    api = FastAPI(title="Speech to Text API")
+    # Only touched from the event loop, so no lock is needed
+    load = {"in_flight": 0, "rejected": 0}
+
+    def busy():
+        if load["in_flight"] < max_concurrency + max_queue:
+            return None
+        load["rejected"] += 1
+        return JSONResponse(
+            {
+                "error": "server busy, retry shortly",
+                "queue_position": load["in_flight"] - max_concurrency + 1,
+                "queue_limit": max_queue,
+            },
+            status_code=429,
+            headers={"Retry-After": "1"},
+        )
+
+    # Runs handle() holding an in-flight slot, taken before the upload is read so an
+    # overloaded server turns requests away without storing their bodies
+    async def bounded(handle):
+        rejected = busy()
+        if rejected is not None:
+            return rejected
+        load["in_flight"] += 1
+        try:
+            return await handle()
+        finally:
+            load["in_flight"] -= 1
+
+    async def run_in_pool(fn, *args):
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+
+    # submit() queues a jobs.Job; respond(result) builds the response once it is done
+    async def run_job(request, submit, respond):
+        try:
+            loop = asyncio.get_running_loop()
+            job = await loop.run_in_executor(executor, submit)
+            future = asyncio.wrap_future(job.future)
+            while not future.done():
+                await asyncio.wait({future}, timeout=DISCONNECT_POLL_SECONDS)
+                if not future.done() and await request.is_disconnected():
+                    service.jobs.cancel(job)
+                    future.cancel()
+                    # Nobody is listening any more ("client closed request")
+                    return Response(status_code=499)
+            return await loop.run_in_executor(executor, respond, future.result())
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+
+    # format=txt|srt|vtt downloads one track ("transcript" or "translation") as a
+    # file instead of JSON; translate=1 adds the English translation; latency_profile
+    # is realtime, balanced or accurate (default: the service's)
+    @api.post("/v1/transcribe")
+    async def transcribe(request: Request, model: str = None, language: str = None,
+                         profile: bool = False, translate: bool = False,
+                         format: str = "json", track: str = "transcript",
+                         latency_profile: str = None):
+        if format != "json" and format not in MEDIA_TYPES:
+            raise HTTPException(400, f"unknown format {format!r}; use json, txt, srt or vtt")
+        if track not in ("transcript", "translation"):
+            raise HTTPException(400, "track must be transcript or translation")
+        translate = translate or track == "translation"
+
+        def respond(result):
+            if format == "json":
+                return format_result(result)
+            return Response(
+                render(result, format, track),
+                media_type=f"{MEDIA_TYPES[format]}; charset=utf-8",
+                headers={"Content-Disposition": f'attachment; filename="{track}.{format}"'},
+            )
+
+        async def handle():
+            path = await save_upload(request)
+            try:
+                return await run_job(
+                    request,
+                    lambda: service.submit_file(path, model, language, profile, translate, latency_profile),
+                    respond,
+                )
+            finally:
+                os.remove(path)
+
+        return await bounded(handle)
+
+    @api.post("/v1/detect-language")
+    async def detect_language(request: Request, model: str = None):
+        async def handle():
+            path = await save_upload(request)
+            try:
+                return await run_in_pool(service.detect_language_file, path, model)
+            finally:
+                os.remove(path)
+
+        return await bounded(handle)
+
+    @api.get("/v1/health")
+    async def health():
+        return {
+            **service.health(),
+            "api": {**load, "max_concurrency": max_concurrency, "max_queue": max_queue},
+        }
+
+    # Prometheus scrape target
+    @api.get("/metrics")
+    async def metrics():
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+    return api
@@ -1,11 +1,19 @@
-import gradio as gr
-import whisper
+import argparse
+import shutil
 import tempfile
-import soundfile as sf
-import os
+import threading
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import gradio as gr
 
-print("Loading Whisper...")
-model = whisper.load_model("large")
+from cascade import CASCADE_LOGPROB
+from metrics import format_timings, start_metrics_server
+from models import MODEL_SIZES, PRECISIONS
+from profiles import DEFAULT_PROFILE, LATENCY_PROFILES
+from service import TranscriptionService
+from speculative import DRAFT_TOKENS
+from subtitles import write_outputs
 
 # Language map with Urdu prioritized
 LANG_MAP = {
@@ -17,37 +25,146 @@ LANG_MAP = {
     "fr": "French"
 }
 
-# Transcription function with Urdu priority
-def transcribe(audio):
-    try:
-        if audio is None:
-            return "", "", "⚠️ Please record or upload audio first."
+# Language choices for the hint dropdown; "auto" lets the model decide
+LANGUAGE_CHOICES = [("Auto-detect", "auto")] + [(name, code) for code, name in LANG_MAP.items()]
 
-        sample_rate, data = audio
 
-        # Save numpy audio to wav
-        tmp = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
-        sf.write(tmp.name, data, sample_rate)
+def format_language(language, probs=None):
+    label = f"{LANG_MAP[language]} ({language})" if language in LANG_MAP else language
+    if not probs:
+        return f"🌐 {label}"
+    scores = " • ".join(f"{code} {p:.0%}" for code, p in probs)
+    return f"🌐 {label}  —  {scores}"
 
-        result = model.transcribe(tmp.name)
-        text = result.get("text", "").strip()
-        detected_lang = result.get("language", "unknown")
 
-        os.remove(tmp.name)
+# How often a waiting transcription refreshes its queue position / progress
+PROGRESS_SECONDS = 0.5
+
+
+# Transcript and subtitle downloads of the last `keep` transcriptions, one directory
+# each under a root that is removed when the process exits. Gradio copies a file
+# into its own cache when it is served, so older directories are deleted as new
+# ones are written.
+class TranscriptFiles:
+    def __init__(self, keep=32):
+        self.keep = keep
+        self._root = None
+        self._dirs = deque()
+        self._lock = threading.Lock()
+
+    def write(self, result):
+        with self._lock:
+            if self._root is None:
+                self._root = tempfile.TemporaryDirectory(prefix="transcripts-")
+            directory = tempfile.mkdtemp(dir=self._root.name)
+            self._dirs.append(directory)
+            while len(self._dirs) > self.keep:
+                shutil.rmtree(self._dirs.popleft(), ignore_errors=True)
+        return write_outputs(result, directory)
 
-        if text == "":
-            return "", "", "🔍 No speech detected. Please speak clearly and try again."
 
-        # Urdu priority: if model detects urdu-like sounds, prefer Urdu label
-        if detected_lang in LANG_MAP:
-            language_display = f"🌐 {LANG_MAP[detected_lang]} ({detected_lang})"
+TRANSCRIPT_FILES = TranscriptFiles()
+
+
+def job_status(job, jobs):
+    if job.state == "queued":
+        position = jobs.position(job)
+        return f"⏳ Queued{f' (#{position} in line)' if position else ''}..."
+    return (
+        f"⏳ Transcribing... {job.fraction:.0%} "
+        f"({job.done_seconds:.0f} of {job.audio_seconds:.0f}s of audio)"
+    )
+
+
+# Transcription function with Urdu priority. Yields queue position and progress in
+# the status box while the job waits and runs, then the transcript, language, status,
+# English translation (when asked for) and the transcript/subtitle files to download.
+# If the client goes away Gradio closes the generator, which cancels the job.
+def transcribe(audio, service, model_name=None, language_hint="auto", show_timings=False,
+               translate=False, latency_profile=None):
+    if audio is None:
+        yield "", "", "⚠️ Please record or upload audio first.", "", None
+        return
+    job = None
+    try:
+        language = None if language_hint == "auto" else language_hint
+        if isinstance(audio, str):
+            # Uploads arrive as a file path and are decoded block by block
+            job = service.submit_file(
+                audio, model_name, language=language, translate=translate, latency_profile=latency_profile
+            )
         else:
-            language_display = f"🌐 {detected_lang}"
+            # In-memory 16 kHz audio, silence cut out by the VAD, straight to the model
+            sample_rate, data = audio
+            job = service.submit(
+                sample_rate, data, model_name, language=language, translate=translate,
+                latency_profile=latency_profile,
+            )
+
+        shown = None
+        while True:
+            try:
+                result = job.future.result(timeout=PROGRESS_SECONDS)
+                break
+            # Not the builtin TimeoutError before Python 3.11
+            except FutureTimeout:
+                message = job_status(job, service.jobs)
+                if message != shown:
+                    shown = message
+                    yield gr.update(), gr.update(), message, gr.update(), gr.update()
+
+        text = result.get("text", "").strip()
+        detected_lang = result.get("language") or "unknown"
 
-        return text, language_display, "✅ Transcription successful!"
+        if text == "":
+            yield "", "", "🔍 No speech detected. Please speak clearly and try again.", "", None
+            return
+
+        # Urdu priority was applied to the probabilities before decoding
+        language_display = format_language(detected_lang, result.get("language_probs"))
+        translation = result.get("translation")
+        files = TRANSCRIPT_FILES.write(result)
+
+        message = "✅ Transcription successful!"
+        skipped = result["audio_seconds"] - result["speech_seconds"]
+        if skipped >= 1:
+            message += f" (skipped {skipped:.1f}s of silence)"
+        cascade = result.get("cascade")
+        if cascade and cascade.get("audio_seconds"):
+            share = cascade["escalated_seconds"] / cascade["audio_seconds"]
+            message += f" ⚡ {cascade['fast_model']} first, {share:.0%} re-checked by {result['model']}"
+        if show_timings:
+            message += f"  ⏱️ {result['latency_profile']} · {format_timings(result['timings'], result.get('decoding'))}"
+        yield text, language_display, message, translation["text"] if translation else "", files
 
     except Exception as e:
-        return "", "", f"❌ Error: {str(e)}"
+        yield "", "", f"❌ Error: {str(e)}", "", None
+    finally:
+        if job is not None and not job.future.done():
+            service.jobs.cancel(job)
+
+# Language identification only, without transcribing
+def detect_language(audio, service, model_name=None):
+    try:
+        if audio is None:
+            return "", "⚠️ Please record or upload audio first."
+
+        if isinstance(audio, str):
+            result = service.detect_language_file(audio, model_name)
+        else:
+            sample_rate, data = audio
+            result = service.detect_language(sample_rate, data, model_name)
+        if result["language"] is None:
+            return "", "🔍 No speech detected. Please speak clearly and try again."
+
+        seconds = sum(result["timings"].values())
+        return (
+            format_language(result["language"], result["language_probs"]),
+            f"✅ Language detected in {seconds:.2f}s",
+        )
+
+    except Exception as e:
+        return "", f"❌ Error: {str(e)}"
 
 # EXTREMELY PROFESSIONAL CSS
 css = """
@@ -677,279 +794,537 @@ body {
 }
 """
 
-# Create the Gradio interface
-with gr.Blocks(css=css, title="Speech to Text Transcriber") as demo:
+# Build the Gradio app around a TranscriptionService; keyword arguments configure a
+# new service (see service.py) when one isn't passed in
+def create_app(service=None, show_timings=False, **service_options):
+    if service is None:
+        service = TranscriptionService(**service_options)
+    registry = service.registry
+    model_name = service.model_name
+    max_batch_size = service.max_batch_size
+
+    def run_transcription(audio, size, language_hint="auto", translate=False, latency_profile=None):
+        yield from transcribe(audio, service, size, language_hint, show_timings, translate, latency_profile)
+
+    def run_language_detection(audio, size):
+        return detect_language(audio, service, size)
+
+    # Live microphone chunks: update the transcript as stable segments are committed
+    def stream_chunk(chunk, stream, size, language_hint="auto"):
+        if chunk is None:
+            return gr.update(), gr.update(), stream
+        try:
+            if stream is None:
+                stream = service.stream(
+                    size, language=None if language_hint == "auto" else language_hint
+                )
+            text = stream.add_chunk(*chunk)
+        except Exception as e:
+            return gr.update(), f"❌ Error: {str(e)}", stream
+        message = "🎙️ Live transcription in progress..."
+        if stream.first_words_seconds is not None:
+            message += f" (first words after {stream.first_words_seconds:.1f}s)"
+        return text, message, stream
+
+    def stop_stream(stream):
+        if stream is None:
+            return gr.update(), gr.update(), None
+        try:
+            text = service.finish_stream(stream)
+        except Exception as e:
+            return gr.update(), f"❌ Error: {str(e)}", None
+        if text == "":
+            return "", "🔍 No speech detected. Please speak clearly and try again.", None
+        return text, "✅ Live transcription finished!", None
+
+    # Start loading a newly selected size in the background
+    def select_model(size):
+        try:
+            registry.loader(size)
+        except Exception as e:
+            return f"❌ Error: {str(e)}"
+        return registry.status(size)
+
+    # Create the Gradio interface
+    with gr.Blocks(css=css, title="Speech to Text Transcriber") as demo:
     
-    # Header with professional theme toggle
-    with gr.Column(elem_classes="header"):
-        gr.HTML("""
-        <div class="header-content">
-            <h1 class="header-title">
-                <span>🎤</span>
-                Speech Transcriber Pro
-            </h1>
-            <p class="header-subtitle">
-                Professional-grade audio transcription with multi-language support. 
-                Record, upload, and transform speech into accurate text instantly.
-            </p>
-        </div>
-        """)
+        # Header with professional theme toggle
+        with gr.Column(elem_classes="header"):
+            gr.HTML("""
+            <div class="header-content">
+                <h1 class="header-title">
+                    <span>🎤</span>
+                    Speech Transcriber Pro
+                </h1>
+                <p class="header-subtitle">
+                    Professional-grade audio transcription with multi-language support. 
+                    Record, upload, and transform speech into accurate text instantly.
+                </p>
+            </div>
+            """)
     
-    # Main content grid
-    with gr.Row(elem_classes="main-grid"):
-        # Left column - Audio Input
-        with gr.Column():
-            with gr.Group(elem_classes="card"):
-                gr.HTML("""
-                <div class="card-header">
-                    <div class="card-icon">🎤</div>
-                    <div>
-                        <h2 class="card-title">Audio Input</h2>
-                        <p class="card-subtitle">Record or upload your audio file</p>
+        # Main content grid
+        with gr.Row(elem_classes="main-grid"):
+            # Left column - Audio Input
+            with gr.Column():
+                with gr.Group(elem_classes="card"):
+                    gr.HTML("""
+                    <div class="card-header">
+                        <div class="card-icon">🎤</div>
+                        <div>
+                            <h2 class="card-title">Audio Input</h2>
+                            <p class="card-subtitle">Record or upload your audio file</p>
+                        </div>
                     </div>
-                </div>
-                """)
+                    """)
                 
-                # Audio controls guide
-                gr.HTML("""
-                <div class="audio-controls-grid">
-                    <div class="control-card">
-                        <div class="control-icon">🎤</div>
-                        <div class="control-info">
-                            <h4>Record Audio</h4>
-                            <p>Click to start recording</p>
+                    # Audio controls guide
+                    gr.HTML("""
+                    <div class="audio-controls-grid">
+                        <div class="control-card">
+                            <div class="control-icon">🎤</div>
+                            <div class="control-info">
+                                <h4>Record Audio</h4>
+                                <p>Click to start recording</p>
+                            </div>
                         </div>
-                    </div>
-                    <div class="control-card">
-                        <div class="control-icon">⏸️</div>
-                        <div class="control-info">
-                            <h4>Pause</h4>
-                            <p>Temporarily stop recording</p>
+                        <div class="control-card">
+                            <div class="control-icon">⏸️</div>
+                            <div class="control-info">
+                                <h4>Pause</h4>
+                                <p>Temporarily stop recording</p>
+                            </div>
                         </div>
-                    </div>
-                    <div class="control-card">
-                        <div class="control-icon">⏹️</div>
-                        <div class="control-info">
-                            <h4>Stop</h4>
-                            <p>Finish recording session</p>
+                        <div class="control-card">
+                            <div class="control-icon">⏹️</div>
+                            <div class="control-info">
+                                <h4>Stop</h4>
+                                <p>Finish recording session</p>
+                            </div>
                         </div>
-                    </div>
-                    <div class="control-card">
-                        <div class="control-icon">▶️</div>
-                        <div class="control-info">
-                            <h4>Playback</h4>
-                            <p>Listen to recorded audio</p>
+                        <div class="control-card">
+                            <div class="control-icon">▶️</div>
+                            <div class="control-info">
+                                <h4>Playback</h4>
+                                <p>Listen to recorded audio</p>
+                            </div>
                         </div>
                     </div>
-                </div>
-                """)
+                    """)
                 
-                # Audio component
-                audio = gr.Audio(
-                    sources=["microphone", "upload"],
-                    type="numpy",
-                    label="",
-                    elem_classes="audio-container"
-                )
+                    # Audio component
+                    audio = gr.Audio(
+                        sources=["microphone", "upload"],
+                        type="filepath",
+                        label="",
+                        elem_classes="audio-container"
+                    )
+
+                    # Model size, chosen per request
+                    model_choice = gr.Dropdown(
+                        choices=MODEL_SIZES,
+                        value=model_name,
+                        label="Model size (smaller is faster)"
+                    )
+
+                    # Language hint; forcing a language skips detection entirely
+                    language_choice = gr.Dropdown(
+                        choices=LANGUAGE_CHOICES,
+                        value="auto",
+                        label="Language"
+                    )
+
+                    # English translation from the same pass, shown next to the transcript
+                    translate_choice = gr.Checkbox(
+                        value=False,
+                        label="Also translate to English"
+                    )
+
+                    # Decoding strategy: realtime is greedy with fast weights, accurate uses beam search
+                    latency_choice = gr.Dropdown(
+                        choices=list(LATENCY_PROFILES),
+                        value=service.latency_profile,
+                        label="Latency profile (realtime is fastest)"
+                    )
+
+                    # Live microphone, transcribed while you speak
+                    live_audio = gr.Audio(
+                        sources=["microphone"],
+                        type="numpy",
+                        streaming=True,
+                        label="Live transcription",
+                        elem_classes="audio-container"
+                    )
+                    stream_state = gr.State(None)
                 
-                # Upload area
-                gr.HTML("""
-                <div class="upload-area">
-                    <div class="upload-icon">📁</div>
-                    <div class="upload-text">
-                        <h3>Upload Audio File</h3>
-                        <p>Drag & drop or click to browse files</p>
-                        <p class="mt-2 opacity-75">Supports: .wav .mp3 .m4a .flac .ogg</p>
-                        <p class="opacity-75">Maximum size: 100MB</p>
+                    # Upload area
+                    gr.HTML("""
+                    <div class="upload-area">
+                        <div class="upload-icon">📁</div>
+                        <div class="upload-text">
+                            <h3>Upload Audio File</h3>
+                            <p>Drag & drop or click to browse files</p>
+                            <p class="mt-2 opacity-75">Supports: .wav .mp3 .m4a .flac .ogg</p>
+                            <p class="opacity-75">Maximum size: 100MB</p>
+                        </div>
                     </div>
-                </div>
-                """)
+                    """)
                 
-                # Tips section
-                gr.HTML("""
-                <div class="mt-4">
-                    <h4 style="color: var(--text-primary); margin-bottom: 1rem;">🎯 Best Practices:</h4>
-                    <ul style="color: var(--text-secondary); padding-left: 1.5rem;">
-                        <li>Use a quality microphone for recording</li>
-                        <li>Speak clearly at a moderate pace</li>
-                        <li>Minimize background noise</li>
-                        <li>Optimal distance: 15-30cm from microphone</li>
-                        <li>Export high-quality files for upload</li>
-                    </ul>
-                </div>
-                """)
+                    # Tips section
+                    gr.HTML("""
+                    <div class="mt-4">
+                        <h4 style="color: var(--text-primary); margin-bottom: 1rem;">🎯 Best Practices:</h4>
+                        <ul style="color: var(--text-secondary); padding-left: 1.5rem;">
+                            <li>Use a quality microphone for recording</li>
+                            <li>Speak clearly at a moderate pace</li>
+                            <li>Minimize background noise</li>
+                            <li>Optimal distance: 15-30cm from microphone</li>
+                            <li>Export high-quality files for upload</li>
+                        </ul>
+                    </div>
+                    """)
         
-        # Right column - Results
-        with gr.Column():
-            with gr.Group(elem_classes="card"):
-                gr.HTML("""
-                <div class="card-header">
-                    <div class="card-icon">📝</div>
-                    <div>
-                        <h2 class="card-title">Transcription Results</h2>
-                        <p class="card-subtitle">View your transcribed text and detected language</p>
+            # Right column - Results
+            with gr.Column():
+                with gr.Group(elem_classes="card"):
+                    gr.HTML("""
+                    <div class="card-header">
+                        <div class="card-icon">📝</div>
+                        <div>
+                            <h2 class="card-title">Transcription Results</h2>
+                            <p class="card-subtitle">View your transcribed text and detected language</p>
+                        </div>
                     </div>
-                </div>
-                """)
+                    """)
                 
-                # Status indicator
-                status = gr.Textbox(
-                    label="",
-                    value="⏳ Ready to transcribe audio",
-                    interactive=False,
-                    elem_classes="status-indicator warning"
-                )
+                    # Status indicator
+                    status = gr.Textbox(
+                        label="",
+                        value="⏳ Ready to transcribe audio",
+                        interactive=False,
+                        elem_classes="status-indicator warning"
+                    )
+
+                    # Model readiness
+                    model_status = gr.Textbox(
+                        label="",
+                        value=registry.status(model_name),
+                        interactive=False,
+                        elem_classes="text-display"
+                    )
                 
-                # Transcription text
-                gr.HTML('<div class="text-display-label">Transcribed Text</div>')
-                transcript = gr.Textbox(
-                    label="",
-                    placeholder="Your transcribed text will appear here...",
-                    lines=12,
-                    elem_classes="text-display"
-                )
+                    # Transcription text
+                    gr.HTML('<div class="text-display-label">Transcribed Text</div>')
+                    transcript = gr.Textbox(
+                        label="",
+                        placeholder="Your transcribed text will appear here...",
+                        lines=12,
+                        elem_classes="text-display"
+                    )
                 
-                # Language detection
-                gr.HTML('<div class="text-display-label mt-4">Detected Language</div>')
-                language = gr.Textbox(
-                    label="",
-                    placeholder="Language will be automatically detected",
-                    interactive=False,
-                    elem_classes="text-display"
-                )
+                    # English translation, when requested
+                    gr.HTML('<div class="text-display-label mt-4">English Translation</div>')
+                    translation = gr.Textbox(
+                        label="",
+                        placeholder="Tick \"Also translate to English\" to get a translation",
+                        lines=6,
+                        elem_classes="text-display"
+                    )
+
+                    # Transcript, translation and subtitles as files
+                    downloads = gr.File(
+                        label="Downloads (.txt, .srt, .vtt)",
+                        file_count="multiple",
+                        interactive=False
+                    )
+
+                    # Language detection
+                    gr.HTML('<div class="text-display-label mt-4">Detected Language</div>')
+                    language = gr.Textbox(
+                        label="",
+                        placeholder="Language will be automatically detected",
+                        interactive=False,
+                        elem_classes="text-display"
+                    )
                 
-                # Supported languages
-                gr.HTML("""
-                <div class="languages-section">
-                    <h4 style="color: var(--text-primary); margin-bottom: 1rem;">🌍 Supported Languages:</h4>
-                    <div class="languages-grid">
-                        <div class="language-tag highlight">🇵🇰 Urdu (Priority)</div>
-                        <div class="language-tag">🇮🇳 Hindi</div>
-                        <div class="language-tag">🇺🇸 English</div>
-                        <div class="language-tag">🇯🇵 Japanese</div>
-                        <div class="language-tag">🇪🇸 Spanish</div>
-                        <div class="language-tag">🇫🇷 French</div>
-                        <div class="language-tag">🇩🇪 German</div>
-                        <div class="language-tag">🇨🇳 Chinese</div>
-                        <div class="language-tag">🇦🇪 Arabic</div>
-                        <div class="language-tag">🇷🇺 Russian</div>
-                        <div class="language-tag">🇵🇹 Portuguese</div>
-                        <div class="language-tag">🇮🇹 Italian</div>
+                    # Supported languages
+                    gr.HTML("""
+                    <div class="languages-section">
+                        <h4 style="color: var(--text-primary); margin-bottom: 1rem;">🌍 Supported Languages:</h4>
+                        <div class="languages-grid">
+                            <div class="language-tag highlight">🇵🇰 Urdu (Priority)</div>
+                            <div class="language-tag">🇮🇳 Hindi</div>
+                            <div class="language-tag">🇺🇸 English</div>
+                            <div class="language-tag">🇯🇵 Japanese</div>
+                            <div class="language-tag">🇪🇸 Spanish</div>
+                            <div class="language-tag">🇫🇷 French</div>
+                            <div class="language-tag">🇩🇪 German</div>
+                            <div class="language-tag">🇨🇳 Chinese</div>
+                            <div class="language-tag">🇦🇪 Arabic</div>
+                            <div class="language-tag">🇷🇺 Russian</div>
+                            <div class="language-tag">🇵🇹 Portuguese</div>
+                            <div class="language-tag">🇮🇹 Italian</div>
+                        </div>
                     </div>
-                </div>
-                """)
+                    """)
     
-    # Transcribe button
-    with gr.Row(elem_classes="transcribe-btn-wrapper"):
-        transcribe_btn = gr.Button(
-            "🚀 Transcribe Audio Now",
-            elem_classes="transcribe-btn"
-        )
+        # Transcribe button
+        with gr.Row(elem_classes="transcribe-btn-wrapper"):
+            transcribe_btn = gr.Button(
+                "🚀 Transcribe Audio Now",
+                elem_classes="transcribe-btn"
+            )
+            detect_btn = gr.Button(
+                "🔎 Detect Language Only",
+                elem_classes="transcribe-btn"
+            )
     
-    # Footer
-    gr.HTML("""
-    <div class="footer">
-        <div class="footer-brand">Speech Transcriber Pro</div>
-        <p class="footer-text">Powered by OpenAI Whisper • Professional Audio Transcription</p>
-        <p class="footer-text mt-2">High accuracy • Multi-language • Enterprise ready</p>
-    </div>
-    """)
+        # Footer
+        gr.HTML("""
+        <div class="footer">
+            <div class="footer-brand">Speech Transcriber Pro</div>
+            <p class="footer-text">Powered by OpenAI Whisper • Professional Audio Transcription</p>
+            <p class="footer-text mt-2">High accuracy • Multi-language • Enterprise ready</p>
+        </div>
+        """)
     
-    # Connect the button
-    transcribe_btn.click(
-        transcribe,
-        inputs=[audio],
-        outputs=[transcript, language, status]
-    )
+        # Connect the button
+        transcribe_btn.click(
+            run_transcription,
+            inputs=[audio, model_choice, language_choice, translate_choice, latency_choice],
+            outputs=[transcript, language, status, translation, downloads],
+            api_name="transcribe",
+            # Handlers only wait on the service's job queue, which orders and bounds the work
+            concurrency_limit=None
+        )
+        detect_btn.click(
+            run_language_detection,
+            inputs=[audio, model_choice],
+            outputs=[language, status],
+            api_name="detect_language",
+            concurrency_limit=max_batch_size
+        )
+
+        # Live transcription
+        live_audio.start_recording(lambda: None, outputs=[stream_state])
+        live_audio.stream(
+            stream_chunk,
+            inputs=[live_audio, stream_state, model_choice, language_choice],
+            outputs=[transcript, status, stream_state],
+            stream_every=0.5,
+            concurrency_limit=max_batch_size
+        )
+        live_audio.stop_recording(
+            stop_stream,
+            inputs=[stream_state],
+            outputs=[transcript, status, stream_state]
+        )
+
+        # Poll model readiness so the UI shows loading / warm-up / ready
+        model_choice.change(select_model, inputs=[model_choice], outputs=[model_status])
+        demo.load(registry.status, inputs=[model_choice], outputs=[model_status])
+        gr.Timer(2).tick(registry.status, inputs=[model_choice], outputs=[model_status])
+        health_json = gr.JSON(visible=False)
+        demo.load(service.health, outputs=[health_json], api_name="health")
     
-    # PROFESSIONAL THEME TOGGLE JAVASCRIPT
-    gr.HTML("""
-    <script>
-    // Theme management
-    function getCurrentTheme() {
-        return localStorage.getItem('appTheme') || 
-               (window.matchMedia('(prefers-color-scheme: dark)').matches ? 'dark' : 'light');
-    }
+        # PROFESSIONAL THEME TOGGLE JAVASCRIPT
+        gr.HTML("""
+        <script>
+        // Theme management
+        function getCurrentTheme() {
+            return localStorage.getItem('appTheme') || 
+                   (window.matchMedia('(prefers-color-scheme: dark)').matches ? 'dark' : 'light');
+        }
     
-    function applyTheme(theme) {
-        const isDark = theme === 'dark';
-        const body = document.body;
-        const gradioContainers = document.querySelectorAll('.gradio-container');
-        const themeLabel = document.getElementById('themeLabel');
+        function applyTheme(theme) {
+            const isDark = theme === 'dark';
+            const body = document.body;
+            const gradioContainers = document.querySelectorAll('.gradio-container');
+            const themeLabel = document.getElementById('themeLabel');
         
-        // Apply theme classes
-        body.classList.toggle('dark-mode', isDark);
-        gradioContainers.forEach(container => {
-            container.classList.toggle('dark-mode', isDark);
-        });
+            // Apply theme classes
+            body.classList.toggle('dark-mode', isDark);
+            gradioContainers.forEach(container => {
+                container.classList.toggle('dark-mode', isDark);
+            });
         
-        // Update label
-        themeLabel.textContent = isDark ? 'Dark Mode' : 'Light Mode';
+            // Update label
+            themeLabel.textContent = isDark ? 'Dark Mode' : 'Light Mode';
         
-        // Update slider position with animation
-        const slider = document.querySelector('.toggle-slider');
-        if (slider) {
-            slider.style.transform = isDark ? 'translateX(28px)' : 'translateX(2px)';
-            slider.innerHTML = isDark ? '🌙' : '☀️';
-        }
+            // Update slider position with animation
+            const slider = document.querySelector('.toggle-slider');
+            if (slider) {
+                slider.style.transform = isDark ? 'translateX(28px)' : 'translateX(2px)';
+                slider.innerHTML = isDark ? '🌙' : '☀️';
+            }
         
-        // Store preference
-        localStorage.setItem('appTheme', theme);
-    }
+            // Store preference
+            localStorage.setItem('appTheme', theme);
+        }
     
-    function toggleTheme() {
-        const currentTheme = getCurrentTheme();
-        const newTheme = currentTheme === 'dark' ? 'light' : 'dark';
-        applyTheme(newTheme);
-    }
+        function toggleTheme() {
+            const currentTheme = getCurrentTheme();
+            const newTheme = currentTheme === 'dark' ? 'light' : 'dark';
+            applyTheme(newTheme);
+        }
     
-    // Initialize theme on load
-    document.addEventListener('DOMContentLoaded', () => {
-        applyTheme(getCurrentTheme());
+        // Initialize theme on load
+        document.addEventListener('DOMContentLoaded', () => {
+            applyTheme(getCurrentTheme());
         
-        // Add smooth transition after load
-        setTimeout(() => {
-            document.body.style.transition = 'background-color 0.3s ease, color 0.3s ease';
-            document.querySelectorAll('.gradio-container').forEach(el => {
-                el.style.transition = 'background-color 0.3s ease';
-            });
-        }, 100);
+            // Add smooth transition after load
+            setTimeout(() => {
+                document.body.style.transition = 'background-color 0.3s ease, color 0.3s ease';
+                document.querySelectorAll('.gradio-container').forEach(el => {
+                    el.style.transition = 'background-color 0.3s ease';
+                });
+            }, 100);
         
-        // Listen for system theme changes
-        window.matchMedia('(prefers-color-scheme: dark)').addEventListener('change', (e) => {
-            if (!localStorage.getItem('appTheme')) {
-                applyTheme(e.matches ? 'dark' : 'light');
-            }
+            // Listen for system theme changes
+            window.matchMedia('(prefers-color-scheme: dark)').addEventListener('change', (e) => {
+                if (!localStorage.getItem('appTheme')) {
+                    applyTheme(e.matches ? 'dark' : 'light');
+                }
+            });
         });
-    });
     
-    // Audio status updates
-    function updateAudioStatus() {
-        const statusElement = document.querySelector('.status-indicator');
-        if (!statusElement) return;
+        // Audio status updates
+        function updateAudioStatus() {
+            const statusElement = document.querySelector('.status-indicator');
+            if (!statusElement) return;
         
-        // Check audio state
-        const audioElements = document.querySelectorAll('audio');
-        const isRecording = document.querySelector('button[title*="Record"], button[title*="Recording"]');
+            // Check audio state
+            const audioElements = document.querySelectorAll('audio');
+            const isRecording = document.querySelector('button[title*="Record"], button[title*="Recording"]');
         
-        if (audioElements.length > 0 && audioElements[0].src) {
-            statusElement.className = 'status-indicator success';
-            statusElement.querySelector('input').value = '✅ Audio loaded and ready for transcription';
-        } else if (isRecording) {
-            statusElement.className = 'status-indicator warning';
-            statusElement.querySelector('input').value = '🎤 Recording in progress... Speak clearly';
-        } else {
-            statusElement.className = 'status-indicator warning';
-            statusElement.querySelector('input').value = '⏳ Ready to record or upload audio';
+            if (audioElements.length > 0 && audioElements[0].src) {
+                statusElement.className = 'status-indicator success';
+                statusElement.querySelector('input').value = '✅ Audio loaded and ready for transcription';
+            } else if (isRecording) {
+                statusElement.className = 'status-indicator warning';
+                statusElement.querySelector('input').value = '🎤 Recording in progress... Speak clearly';
+            } else {
+                statusElement.className = 'status-indicator warning';
+                statusElement.querySelector('input').value = '⏳ Ready to record or upload audio';
+            }
         }
-    }
     
-    // Monitor audio changes
-    setInterval(updateAudioStatus, 1000);
+        // Monitor audio changes
+        setInterval(updateAudioStatus, 1000);
     
-    // Initial status update
-    setTimeout(updateAudioStatus, 2000);
-    </script>
-    """)
+        // Initial status update
+        setTimeout(updateAudioStatus, 2000);
+        </script>
+        """)
 
-demo.launch(share=True)
\ No newline at end of file
+    return demo
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Speech to Text Transcriber")
+    parser.add_argument("--model", default="large", help="default Whisper model")
+    parser.add_argument("--model-budget-mb", type=float, default=None,
+                        help="evict least-recently-used models above this much resident weight memory")
+    parser.add_argument("--precision", choices=PRECISIONS, default="fp32")
+    parser.add_argument("--max-batch-size", type=int, default=8, help="most requests decoded together")
+    parser.add_argument("--batch-wait-ms", type=float, default=20,
+                        help="how long to wait for more requests to fill a batch")
+    parser.add_argument("--job-workers", type=int, default=None,
+                        help="transcriptions run at once, shortest first (default: --max-batch-size)")
+    parser.add_argument("--job-max-wait", type=float, default=60,
+                        help="seconds a queued job may be overtaken by shorter ones before it runs next")
+    parser.add_argument("--cache-size", type=int, default=256, help="transcripts kept in memory")
+    parser.add_argument("--cache-dir", default=None, help="also keep transcripts on disk here")
+    parser.add_argument("--encoder-cache-mb", type=float, default=256,
+                        help="keep encoder outputs of recent clips so re-runs with another "
+                             "language or task skip the encoder (0 disables)")
+    parser.add_argument("--no-vad", action="store_true", help="send silence to the model too")
+    parser.add_argument("--chunk-workers", type=int, default=0,
+                        help="worker processes for parallel chunked transcription of long audio")
+    parser.add_argument("--long-audio-seconds", type=float, default=600,
+                        help="speech longer than this is transcribed in parallel chunks")
+    parser.add_argument("--inference-workers", type=int, default=0,
+                        help="run model passes in this many worker processes instead of the server process")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="torch threads per inference worker (default: CPUs / workers)")
+    parser.add_argument("--worker-affinity", action="store_true",
+                        help="pin each inference worker to its own CPUs")
+    parser.add_argument("--worker-timeout", type=float, default=600,
+                        help="restart an inference worker stuck on one batch for this many seconds")
+    parser.add_argument("--mmap-weights", action="store_true",
+                        help="memory-map converted weights (written on first load) so start-up is "
+                             "near-instant and worker processes share one copy")
+    parser.add_argument("--draft-model", default=None, choices=MODEL_SIZES[:2],
+                        help="decode speculatively: this model proposes tokens that the selected "
+                             "model verifies, giving the same transcript faster")
+    parser.add_argument("--draft-tokens", type=int, default=DRAFT_TOKENS,
+                        help="tokens the draft model proposes per verification pass")
+    parser.add_argument("--cascade-model", default=None, choices=MODEL_SIZES[:-1],
+                        help="transcribe with this model first and re-run only its low-confidence "
+                             "segments on the selected model")
+    parser.add_argument("--cascade-logprob", type=float, default=CASCADE_LOGPROB,
+                        help="escalate cascade segments with an average token log-probability below this")
+    parser.add_argument("--latency-profile", default=DEFAULT_PROFILE, choices=list(LATENCY_PROFILES),
+                        help="decoding strategy for requests that don't choose one")
+    parser.add_argument("--eager", action="store_true", help="load the model before starting the UI")
+    parser.add_argument("--no-share", action="store_true", help="don't open a public Gradio link")
+    parser.add_argument("--api", action="store_true",
+                        help="serve the HTTP API at /v1 next to the UI, locally (no share link)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7860)
+    parser.add_argument("--api-max-queue", type=int, default=16,
+                        help="API requests allowed to wait before answering 429")
+    parser.add_argument("--show-timings", action="store_true",
+                        help="add a per-stage timing summary to the status line")
+    parser.add_argument("--profile-dir", default=None,
+                        help="write cProfile (and with --profile-torch, torch profiler) traces of "
+                             "profiled requests here; the API takes ?profile=1")
+    parser.add_argument("--profile-sample-rate", type=float, default=0.0,
+                        help="fraction of requests to profile automatically, e.g. 0.01")
+    parser.add_argument("--profile-torch", action="store_true",
+                        help="also record a torch profiler Chrome trace of the model pass")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus /metrics on this local port (with --api it is also at /metrics)")
+    args = parser.parse_args()
+
+    service = TranscriptionService(
+        model_name=args.model,
+        lazy=not args.eager,
+        model_budget_mb=args.model_budget_mb,
+        precision=args.precision,
+        max_batch_size=args.max_batch_size,
+        batch_wait_ms=args.batch_wait_ms,
+        cache_size=args.cache_size,
+        cache_dir=args.cache_dir,
+        encoder_cache_mb=args.encoder_cache_mb,
+        vad=not args.no_vad,
+        chunk_workers=args.chunk_workers,
+        long_audio_seconds=args.long_audio_seconds,
+        profile_dir=args.profile_dir,
+        profile_sample_rate=args.profile_sample_rate,
+        profile_torch=args.profile_torch,
+        inference_workers=args.inference_workers,
+        threads_per_worker=args.threads_per_worker,
+        worker_affinity=args.worker_affinity,
+        worker_timeout=args.worker_timeout,
+        mmap_weights=args.mmap_weights,
+        job_workers=args.job_workers,
+        job_max_wait_seconds=args.job_max_wait,
+        draft_model=args.draft_model,
+        draft_tokens=args.draft_tokens,
+        cascade_model=args.cascade_model,
+        cascade_logprob=args.cascade_logprob,
+        latency_profile=args.latency_profile,
+    )
+    demo = create_app(service, show_timings=args.show_timings)
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    if args.api:
+        import uvicorn
+
+        from api import create_api
+
+        api = create_api(service, max_queue=args.api_max_queue)
+        uvicorn.run(gr.mount_gradio_app(api, demo, path="/"), host=args.host, port=args.port)
+    else:
+        demo.launch(share=not args.no_share, server_name=args.host, server_port=args.port)
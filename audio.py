@@ -0,0 +1,175 @@
+import math
+import subprocess
+
+import numpy as np
+import soundfile as sf
+
+# Whisper works on 16 kHz mono float32 in [-1, 1]
+SAMPLE_RATE = 16000
+
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".webm", ".mp4"}
+
+
+# Convert integer PCM to float32 in [-1, 1], keeping float input as-is
+def to_float32(data):
+    data = np.asarray(data)
+    if data.dtype.kind == "f":
+        return data.astype(np.float32, copy=False)
+    if data.dtype.kind == "u":
+        half = float(2 ** (8 * data.dtype.itemsize - 1))
+        return (data.astype(np.float32) - half) / half
+    if data.dtype.kind == "i":
+        scale = float(2 ** (8 * data.dtype.itemsize - 1))
+        return data.astype(np.float32) / scale
+    raise ValueError(f"Unsupported audio dtype: {data.dtype}")
+
+
+# Average channels; Gradio gives (samples, channels) for stereo
+def to_mono(data):
+    if data.ndim == 1:
+        return data
+    if data.ndim != 2:
+        raise ValueError(f"Unsupported audio shape: {data.shape}")
+    return data.mean(axis=1, dtype=np.float32)
+
+
+# Band-limited FFT resampling, fully vectorized
+def resample(data, orig_sr, target_sr=SAMPLE_RATE):
+    if orig_sr == target_sr or len(data) == 0:
+        return data.astype(np.float32, copy=False)
+
+    n_in = len(data)
+    n_out = int(round(n_in * target_sr / orig_sr))
+    spectrum = np.fft.rfft(data)
+    n_bins = n_out // 2 + 1
+    if n_bins <= len(spectrum):
+        spectrum = spectrum[:n_bins]
+    else:
+        spectrum = np.pad(spectrum, (0, n_bins - len(spectrum)))
+    out = np.fft.irfft(spectrum, n_out) * (n_out / n_in)
+    return out.astype(np.float32)
+
+
+# Streaming version of resample(). Each block is resampled together with pad_seconds
+# of real neighbouring audio on both sides, which is cut off again so block edges
+# don't pick up the FFT's wrap-around. Output lags input by pad_seconds until finish().
+class BlockResampler:
+    def __init__(self, orig_sr, target_sr=SAMPLE_RATE, pad_seconds=0.05):
+        self.orig_sr = orig_sr
+        self.target_sr = target_sr
+        # Work in whole units of in_unit input samples, which map to exactly out_unit outputs
+        g = math.gcd(orig_sr, target_sr)
+        self.in_unit, self.out_unit = orig_sr // g, target_sr // g
+        self.pad = max(1, round(pad_seconds * orig_sr / self.in_unit)) * self.in_unit
+        self._history = np.zeros(0, np.float32)
+        self._pending = np.zeros(0, np.float32)
+
+    def push(self, block):
+        if self.orig_sr == self.target_sr:
+            return block.astype(np.float32, copy=False)
+        self._pending = np.concatenate([self._pending, block])
+        ready = (len(self._pending) - self.pad) // self.in_unit * self.in_unit
+        if ready <= 0:
+            return np.zeros(0, np.float32)
+        return self._emit(ready, self._pending[:ready + self.pad])
+
+    def finish(self):
+        if self.orig_sr == self.target_sr or len(self._pending) == 0:
+            return np.zeros(0, np.float32)
+        return self._emit(len(self._pending), self._pending)
+
+    def _emit(self, ready, right):
+        out = resample(np.concatenate([self._history, right]), self.orig_sr, self.target_sr)
+        start = len(self._history) // self.in_unit * self.out_unit
+        n_out = int(round(ready * self.target_sr / self.orig_sr))
+        self._history = np.concatenate([self._history, self._pending[:ready]])[-self.pad:]
+        self._pending = self._pending[ready:]
+        return out[start:start + n_out]
+
+
+# Gradio (sample_rate, data) tuple -> 16 kHz mono float32 array for the model
+def prepare_audio(sample_rate, data):
+    samples = to_mono(to_float32(data))
+    return np.ascontiguousarray(resample(samples, sample_rate))
+
+
+# Audio file -> 16 kHz mono float32; soundfile when it can read the format, ffmpeg otherwise
+def load_file(path):
+    try:
+        data, sample_rate = sf.read(path, dtype="float32", always_2d=False)
+    except sf.LibsndfileError:
+        import whisper
+
+        return whisper.load_audio(path, SAMPLE_RATE)
+    return prepare_audio(sample_rate, data)
+
+
+# Length in seconds from the file header, or None when soundfile can't read it
+def file_duration(path):
+    try:
+        return sf.info(path).duration
+    except sf.LibsndfileError:
+        return None
+
+
+# Audio file -> 16 kHz mono float32 blocks of about block_seconds each, decoded
+# through one reused read buffer so memory stays flat however long the file is
+def iter_file_blocks(path, block_seconds=30.0):
+    try:
+        info = sf.info(path)
+    except sf.LibsndfileError:
+        yield from _ffmpeg_blocks(path, block_seconds)
+        return
+
+    resampler = BlockResampler(info.samplerate)
+    buffer = np.empty((int(block_seconds * info.samplerate), info.channels), np.float32)
+    with sf.SoundFile(path) as f:
+        while True:
+            data = f.read(dtype="float32", always_2d=True, out=buffer)
+            if len(data) == 0:
+                break
+            block = resampler.push(to_mono(data))
+            if len(block):
+                yield block
+    tail = resampler.finish()
+    if len(tail):
+        yield tail
+
+
+# ffmpeg decodes and resamples to 16 kHz; stdout is read block by block
+def _ffmpeg_blocks(path, block_seconds):
+    cmd = [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0", "-i", path,
+        "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+    ]
+    try:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise ValueError("Could not decode audio: unsupported format and ffmpeg is not installed")
+
+    buffer = bytearray(int(block_seconds * SAMPLE_RATE) * 4)
+    view = memoryview(buffer)
+    try:
+        while True:
+            filled = 0
+            while filled < len(buffer):
+                n = process.stdout.readinto(view[filled:])
+                if not n:
+                    break
+                filled += n
+            filled -= filled % 4
+            if filled:
+                yield np.frombuffer(buffer, np.float32, filled // 4).copy()
+            if filled < len(buffer) - 3:
+                break
+    except GeneratorExit:
+        # Consumer stopped early (e.g. language detection on the first block)
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        process.stdout.close()
+    stderr = process.stderr.read().decode(errors="ignore").strip().splitlines()
+    if process.wait() != 0:
+        raise ValueError(f"Could not decode audio: {stderr[-1] if stderr else 'ffmpeg failed'}")
+
@@ -0,0 +1,408 @@
+import argparse
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from contextlib import nullcontext
+
+import numpy as np
+import whisper
+
+from audio import SAMPLE_RATE
+from cache import active_encoder_cache
+from frontend import FRONTEND
+from metrics import DRAFT_TOKENS, FALLBACKS, StageTimer, active_timer, stage
+
+# Clips up to one Whisper window can share a batched encoder/decoder pass;
+# longer ones still go through model.transcribe's seek loop
+BATCH_WINDOW_SAMPLES = whisper.audio.N_SAMPLES
+
+# Same thresholds model.transcribe uses to decide a decode needs the temperature fallback
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+
+# Whisper timestamp tokens are 20 ms apart
+TIME_PRECISION = 0.02
+
+
+# Split decoded tokens at timestamp-token pairs into (start, end, text_tokens). Text
+# left open at the end of the window runs from the last timestamp to the clip's end.
+def split_segments(tokenizer, tokens, duration):
+    segments = []
+    start = None
+    last = 0.0
+    text_tokens = []
+    for token in tokens:
+        if token < tokenizer.timestamp_begin:
+            text_tokens.append(token)
+            continue
+        time = (token - tokenizer.timestamp_begin) * TIME_PRECISION
+        if start is not None and text_tokens:
+            segments.append((start, min(time, duration), text_tokens))
+            start, text_tokens = None, []
+        else:
+            start = time
+        last = min(time, duration)
+    if text_tokens:
+        segments.append((last if start is None else start, duration, text_tokens))
+    return segments
+
+
+# Log-mel of the first 30 s window of every clip, stacked into one batch in the
+# dtype the encoder expects. This is the window model.transcribe decodes first, and
+# its spectrogram is computed once per clip: see frontend.LogMelFrontend.
+def window_mels(model, batch):
+    with stage("mel"):
+        mels = FRONTEND.window_mels(batch, model.dims.n_mels, model.device)
+        return mels.to(model.encoder.conv1.weight.dtype)
+
+
+# Language probabilities ({code: p}) for the first window of every clip, in one pass
+def detect_language_batch(model, batch):
+    _, probs = model.detect_language(window_mels(model, batch))
+    return probs
+
+
+# Decode several short clips in one batched pass; returns model.transcribe-style dicts.
+# Each clip is split into timestamped segments like model.transcribe's, which subtitles
+# cue from; without_timestamps=True gives one segment per clip instead. The
+# batch is decoded at the first temperature; a clip that needs the fallback goes
+# through model.transcribe with the same options, unless there's nothing to fall
+# back to. condition_on_previous_text only matters to that fallback.
+def decode_batch(model, batch, language=None, task="transcribe", fp16=False,
+                 without_timestamps=False,
+                 temperature=(0.0, 0.2, 0.4, 0.6, 0.8, 1.0), beam_size=None, best_of=None,
+                 condition_on_previous_text=True):
+    temperatures = (temperature,) if isinstance(temperature, (int, float)) else tuple(temperature)
+    mels = window_mels(model, batch)
+    options = whisper.DecodingOptions(
+        task=task,
+        language=language,
+        without_timestamps=without_timestamps,
+        fp16=fp16 and model.device.type != "cpu",
+        temperature=temperatures[0],
+        # Same rule as model.transcribe: beams for greedy, candidates when sampling
+        beam_size=beam_size if temperatures[0] == 0 else None,
+        best_of=best_of if temperatures[0] > 0 else None,
+    )
+    decoded = model.decode(mels, options)
+
+    results = []
+    for samples, result in zip(batch, decoded):
+        silent = (
+            result.no_speech_prob > NO_SPEECH_THRESHOLD
+            and result.avg_logprob < LOGPROB_THRESHOLD
+        )
+        needs_fallback = (
+            result.compression_ratio > COMPRESSION_RATIO_THRESHOLD
+            or result.avg_logprob < LOGPROB_THRESHOLD
+        )
+        if needs_fallback and not silent and len(temperatures) > 1:
+            # Rare: let the regular loop walk the temperature ladder for this clip
+            results.append(model.transcribe(
+                samples, language=language, task=task, fp16=fp16, temperature=temperatures,
+                beam_size=beam_size, best_of=best_of, condition_on_previous_text=condition_on_previous_text,
+            ))
+            continue
+
+        duration = len(samples) / SAMPLE_RATE
+        if silent:
+            pieces = []
+        elif without_timestamps:
+            pieces = [(0.0, duration, result.tokens)]
+        else:
+            tokenizer = whisper.tokenizer.get_tokenizer(
+                model.is_multilingual,
+                num_languages=model.num_languages,
+                language=result.language,
+                task=task,
+            )
+            pieces = split_segments(tokenizer, result.tokens, duration)
+
+        segments = []
+        for start, end, tokens in pieces:
+            segments.append({
+                "id": len(segments),
+                "start": start,
+                "end": end,
+                "text": result.text if without_timestamps else tokenizer.decode(tokens),
+                "tokens": tokens,
+                "temperature": result.temperature,
+                "avg_logprob": result.avg_logprob,
+                "compression_ratio": result.compression_ratio,
+                "no_speech_prob": result.no_speech_prob,
+            })
+        results.append({
+            "text": "".join(segment["text"] for segment in segments).strip(),
+            "language": result.language,
+            "segments": segments,
+        })
+    return results
+
+
+# One model pass over a formed batch: language probabilities, batched decodes, or
+# model.transcribe for a single clip longer than one window. Shared by the scheduler
+# thread and the inference worker processes (see workers.InferencePool). With an
+# encoder_cache every encoder call of the pass goes through it (see cache.cache_encoder).
+def run_batch(model, kind, batch, options, encoder_cache=None):
+    lock = getattr(model, "inference_lock", None) or nullcontext()
+    with lock, active_encoder_cache(encoder_cache):
+        if kind == "language":
+            return detect_language_batch(model, batch)
+        if len(batch) == 1 and len(batch[0]) > BATCH_WINDOW_SAMPLES:
+            return [model.transcribe(batch[0], **options)]
+        return decode_batch(model, batch, **options)
+
+
+class _Request:
+    __slots__ = ("kind", "samples", "model_name", "options", "profile", "precision", "future", "enqueued")
+
+    def __init__(self, kind, samples, model_name, options, profile=None, precision=None):
+        self.kind = kind
+        self.samples = samples
+        self.model_name = model_name
+        self.options = options
+        self.profile = profile
+        self.precision = precision
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+    # Requests can share a batch only with the same kind, model, precision and decoding options;
+    # profiled requests always run alone so the profile covers only their own work.
+    # Language detection only looks at the first window, so any clip can be batched.
+    @property
+    def key(self):
+        short = self.kind == "language" or len(self.samples) <= BATCH_WINDOW_SAMPLES
+        batchable = short and self.profile is None
+        return (self.kind, self.model_name, self.precision, tuple(sorted(self.options.items())), batchable)
+
+
+# Collects requests arriving within max_wait_ms (up to max_batch_size) and runs
+# them as one batched pass. All inference goes through this one thread, since
+# Whisper's kv-cache hooks make concurrent decodes on one model unsafe. Requests for
+# a model that is still loading are held back (and queued again once it has loaded)
+# so they never stall batches for models that are ready. With an
+# encoder_cache (cache.EncoderCache), windows seen recently skip the encoder. With a
+# pool (workers.InferencePool) batches are formed here but run in worker processes,
+# several at once, and this process never loads a model.
+class BatchScheduler:
+    def __init__(self, registry, max_batch_size=8, max_wait_ms=20, encoder_cache=None, pool=None):
+        self.registry = registry
+        self.encoder_cache = encoder_cache
+        self.pool = pool
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+        self.requests = 0
+        self.batches = 0
+        self.batch_sizes = Counter()
+        self.queue_seconds = 0.0
+        self.busy_seconds = 0.0
+
+    # profile is a profiling.ProfileSession to run the model pass under; precision
+    # overrides the registry's for this request (None: the registry's own)
+    def submit(self, samples, model_name, kind="transcribe", profile=None, precision=None, **options):
+        request = _Request(kind, samples, model_name, options, profile, precision)
+        self._queue.put(request)
+        return request.future
+
+    def transcribe(self, samples, model_name, profile=None, precision=None, **options):
+        return self.submit(samples, model_name, profile=profile, precision=precision, **options).result()
+
+    # Language probabilities from the first 30 s window, batched like transcriptions.
+    # Takes the whole clip: the window is cut from the clip's spectrogram, which the
+    # transcription that follows reuses.
+    def detect_language(self, samples, model_name, profile=None, precision=None):
+        return self.submit(samples, model_name, kind="language", profile=profile, precision=precision).result()
+
+    # Object with a model.transcribe-compatible method bound to one model size
+    def model(self, model_name, profile=None, precision=None):
+        return _BatchedModel(self, model_name, profile, precision)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0].enqueued + self.max_wait
+            # Once the window has passed, still take whatever is already queued
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._dispatch(batch)
+            except Exception as e:
+                # This is the only scheduler thread: fail what's left of the batch, keep going
+                self._fail(batch, e)
+
+    # Runs each group of requests that can share a batch. A request that can't be
+    # grouped (e.g. an unhashable option) or a group that can't be run fails on its own.
+    def _dispatch(self, batch):
+        groups = {}
+        for request in batch:
+            try:
+                groups.setdefault(request.key, []).append(request)
+            except Exception as e:
+                self._fail([request], e)
+        for key, requests in groups.items():
+            try:
+                loader = self._loading(requests[0])
+                if loader is not None:
+                    loader.add_done_callback(lambda requests=requests: self._requeue(requests))
+                    continue
+                if key[-1]:
+                    self._run_batch(requests)
+                else:
+                    for request in requests:
+                        self._run_batch([request])
+            except Exception as e:
+                self._fail(requests, e)
+
+    @staticmethod
+    def _fail(requests, error):
+        for request in requests:
+            try:
+                request.future.set_exception(error)
+            except InvalidStateError:
+                # Already answered
+                pass
+
+    # Loader of the request's model while it is still loading, else None. Pool workers
+    # load their own models, and unknown names fail in _run_batch.
+    def _loading(self, request):
+        if self.pool is not None:
+            return None
+        try:
+            loader = self.registry.loader(request.model_name, precision=request.precision)
+        except ValueError:
+            return None
+        return None if loader.done else loader
+
+    def _requeue(self, requests):
+        for request in requests:
+            self._queue.put(request)
+
+    def _run_batch(self, requests):
+        start = time.perf_counter()
+        self.requests += len(requests)
+        self.batches += 1
+        self.batch_sizes[len(requests)] += 1
+        self.queue_seconds += sum(start - r.enqueued for r in requests)
+
+        head = requests[0]
+        batch = [r.samples for r in requests]
+        if self.pool is not None:
+            # Runs in a worker process; this thread goes straight back to batching
+            future = self.pool.submit(
+                head.kind, head.model_name, batch, head.options, profile=head.profile is not None,
+                precision=head.precision,
+            )
+            future.add_done_callback(lambda f: self._finish(requests, start, f))
+            return
+
+        timer = StageTimer()
+        future = Future()
+        try:
+            model = self.registry.get(head.model_name, precision=head.precision)
+            with active_timer(timer), head.profile.model() if head.profile else nullcontext():
+                results = run_batch(model, head.kind, batch, head.options, self.encoder_cache)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result((results, timer.stages, timer.counts, None))
+        self._finish(requests, start, future)
+
+    # future holds (results, stages, counts, cProfile stats or None) for the batch
+    def _finish(self, requests, start, future):
+        head = requests[0]
+        try:
+            results, stages, counts, profile_stats = future.result()
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+        else:
+            FALLBACKS.inc(counts.get("fallbacks", 0), model=head.model_name)
+            if counts.get("draft_proposed"):
+                accepted = counts.get("draft_accepted", 0)
+                DRAFT_TOKENS.inc(accepted, model=head.model_name, outcome="accepted")
+                DRAFT_TOKENS.inc(counts["draft_proposed"] - accepted, model=head.model_name, outcome="rejected")
+            if profile_stats is not None and head.profile is not None:
+                head.profile.add_stats(profile_stats)
+            for request, result in zip(requests, results):
+                if head.kind != "language":
+                    # Shared by every request in the batch
+                    result["model_stats"] = {"stages": stages, "counts": counts}
+                request.future.set_result(result)
+        finally:
+            with self._lock:
+                self.busy_seconds += time.perf_counter() - start
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "mean_queue_ms": 1000 * self.queue_seconds / self.requests if self.requests else 0.0,
+            "requests_per_busy_second": self.requests / self.busy_seconds if self.busy_seconds else 0.0,
+        }
+
+
+class _BatchedModel:
+    def __init__(self, scheduler, model_name, profile=None, precision=None):
+        self.scheduler = scheduler
+        self.model_name = model_name
+        self.profile = profile
+        self.precision = precision
+
+    def transcribe(self, samples, **options):
+        return self.scheduler.transcribe(samples, self.model_name, self.profile, self.precision, **options)
+
+    def detect_language(self, samples):
+        return self.scheduler.detect_language(samples, self.model_name, self.profile, self.precision)
+
+
+# Throughput vs batch size and queue delay: fire N concurrent short clips at the scheduler
+if __name__ == "__main__":
+    from models import ModelRegistry
+
+    parser = argparse.ArgumentParser(description="Measure batched transcription throughput")
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=5.0, help="length of each clip")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--wait-ms", type=float, nargs="+", default=[10, 50])
+    args = parser.parse_args()
+
+    registry = ModelRegistry()
+    registry.get(args.model)
+    rng = np.random.default_rng(0)
+    clips = [
+        (0.05 * rng.standard_normal(int(args.seconds * SAMPLE_RATE))).astype(np.float32)
+        for _ in range(args.requests)
+    ]
+
+    print(f"{'batch':>5} {'wait_ms':>7} {'req/s':>8} {'mean_batch':>10} {'queue_ms':>9}")
+    for max_wait_ms in args.wait_ms:
+        for max_batch_size in args.batch_sizes:
+            scheduler = BatchScheduler(registry, max_batch_size, max_wait_ms)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(args.requests) as pool:
+                list(pool.map(lambda clip: scheduler.transcribe(clip, args.model), clips))
+            elapsed = time.perf_counter() - start
+            stats = scheduler.stats()
+            print(
+                f"{max_batch_size:>5} {max_wait_ms:>7.0f} {args.requests / elapsed:>8.2f} "
+                f"{stats['mean_batch_size']:>10.2f} {stats['mean_queue_ms']:>9.1f}"
+            )
@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import subprocess
+import time
+
+import numpy as np
+
+from audio import AUDIO_EXTENSIONS, SAMPLE_RATE, load_file
+from evaluation import load_test_set, peak_rss_mb, word_error_rate
+from pipeline import transcribe_audio
+from profiles import LATENCY_PROFILES, resolve_profile
+
+DURATIONS = [5, 30, 120]
+SAMPLE_RATES = [16000, 44100, 48000]
+CHANNELS = [1, 2]
+
+
+# Stands in for a Whisper model so preprocessing, VAD and I/O around the model can be
+# benchmarked in CI without downloading weights
+class StubModel:
+    def transcribe(self, samples, **options):
+        duration = len(samples) / SAMPLE_RATE
+        return {
+            "text": " stub",
+            "language": options.get("language") or "en",
+            "segments": [{"id": 0, "start": 0.0, "end": duration, "text": " stub"}],
+        }
+
+    def detect_language(self, samples):
+        return {"en": 1.0}
+
+
+# Speech-like test signal: syllable-rate modulated harmonics with short pauses,
+# as int16 like the Gradio microphone/upload component delivers
+def synthetic_audio(seconds, sample_rate, channels, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 120 + 30 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) * (np.sin(2 * np.pi * 0.2 * t) > -0.5)
+    signal = 0.3 * voice * envelope + 0.003 * rng.standard_normal(len(t))
+    pcm = (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+    return pcm if channels == 1 else np.repeat(pcm[:, None], channels, axis=1)
+
+
+def cases(fixtures=None):
+    for seconds in DURATIONS:
+        for sample_rate in SAMPLE_RATES:
+            for channels in CHANNELS:
+                name = f"synthetic-{seconds}s-{sample_rate // 1000}k-{channels}ch"
+                yield name, sample_rate, synthetic_audio(seconds, sample_rate, channels)
+    if fixtures:
+        for file in sorted(os.listdir(fixtures)):
+            if os.path.splitext(file)[1].lower() in AUDIO_EXTENSIONS:
+                yield f"fixture-{file}", SAMPLE_RATE, load_file(os.path.join(fixtures, file))
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q))
+
+
+# With a reference transcript the case also reports the word error rate
+def run_case(model, name, sample_rate, data, repeats, detector=None, reference=None, **options):
+    audio_seconds = len(data) / sample_rate
+    latencies = []
+    stages = {}
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = transcribe_audio(sample_rate, data, model, detector=detector, **options)
+        latencies.append(time.perf_counter() - start)
+        for stage, seconds in result["timings"].items():
+            stages.setdefault(stage, []).append(seconds)
+    total = sum(latencies)
+    quality = {} if reference is None else {"wer": word_error_rate(reference, result["text"])}
+    return {
+        "case": name,
+        "audio_seconds": audio_seconds,
+        "repeats": repeats,
+        "p50_ms": 1000 * percentile(latencies, 50),
+        "p95_ms": 1000 * percentile(latencies, 95),
+        "p99_ms": 1000 * percentile(latencies, 99),
+        "real_time_factor": total / (audio_seconds * repeats),
+        "requests_per_second": repeats / total,
+        "stage_p50_ms": {stage: 1000 * percentile(s, 50) for stage, s in stages.items()},
+        **quality,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_label(result):
+    profile = result.get("latency_profile")
+    return result["model"] if profile is None else f"{result['model']}/{profile}"
+
+
+# Print p50 change per (model, latency profile, case) against an earlier report
+def compare(report, baseline):
+    before = {(run_label(r), r["case"]): r for r in baseline["results"]}
+    print(f"\nvs {baseline.get('commit') or 'baseline'}:")
+    for r in report["results"]:
+        old = before.get((run_label(r), r["case"]))
+        if old is None:
+            continue
+        change = (r["p50_ms"] - old["p50_ms"]) / old["p50_ms"] if old["p50_ms"] else 0.0
+        flag = "  ⚠️" if change > 0.1 else ""
+        print(f"{run_label(r):>8} {r['case']:<32} {old['p50_ms']:>9.1f} -> {r['p50_ms']:>9.1f} ms "
+              f"({change:+.0%}){flag}")
+
+
+# Speed/quality trade-off of each latency profile: median latency and RTF over all
+# cases, and mean WER over the fixtures that have reference transcripts
+def summarize_profiles(results):
+    runs = {}
+    for r in results:
+        runs.setdefault(run_label(r), []).append(r)
+    summary = {}
+    for label, rs in runs.items():
+        wers = [r["wer"] for r in rs if "wer" in r]
+        summary[label] = {
+            "p50_ms": percentile([r["p50_ms"] for r in rs], 50),
+            "real_time_factor": sum(r["real_time_factor"] * r["audio_seconds"] for r in rs)
+            / sum(r["audio_seconds"] for r in rs),
+            "wer": sum(wers) / len(wers) if wers else None,
+            "wer_cases": len(wers),
+        }
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark transcription latency, RTF and memory")
+    parser.add_argument("--models", nargs="+", default=["stub"],
+                        help="Whisper sizes to benchmark; 'stub' needs no weights")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--fixtures", help="directory of extra audio files to include")
+    parser.add_argument("--language", default=None, help="force a language (skips detection)")
+    parser.add_argument("--no-vad", action="store_true")
+    parser.add_argument("--profiles", nargs="+", choices=list(LATENCY_PROFILES),
+                        help="run every model under each of these latency profiles and compare them; "
+                             "fixtures with a .txt transcript next to them add a word error rate")
+    parser.add_argument("-o", "--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="earlier JSON report to diff against")
+    args = parser.parse_args(argv)
+
+    references = {}
+    if args.fixtures:
+        references = {
+            f"fixture-{os.path.basename(path)}": text for path, text in load_test_set(args.fixtures)
+        }
+
+    report = {"commit": git_commit(), "created": time.time(), "results": [], "models": {}}
+    registry = None
+    for model_name in args.models:
+        for profile in args.profiles or [None]:
+            options, precision = {}, "fp32"
+            if profile is not None:
+                from models import default_device
+
+                options, precision = resolve_profile(profile, default_device(), precision)
+            if model_name == "stub":
+                model = StubModel()
+                detector = model.detect_language
+            else:
+                from batching import detect_language_batch
+                from models import ModelRegistry
+
+                # One registry, so a profile sharing another's precision reuses its model
+                registry = registry or ModelRegistry()
+                model = registry.get(model_name, precision=precision)
+                detector = lambda samples, model=model: detect_language_batch(model, [samples])[0]
+
+            label = run_label({"model": model_name, "latency_profile": profile})
+            start = time.perf_counter()
+            audio_seconds = 0.0
+            for name, sample_rate, data in cases(args.fixtures):
+                result = run_case(
+                    model, name, sample_rate, data, args.repeats, detector=detector,
+                    reference=references.get(name), vad=not args.no_vad, language=args.language,
+                    **options,
+                )
+                result["model"] = model_name
+                if profile is not None:
+                    result["latency_profile"] = profile
+                report["results"].append(result)
+                audio_seconds += result["audio_seconds"] * args.repeats
+                wer = f"  WER {result['wer']:.1%}" if "wer" in result else ""
+                print(f"{label:>8} {name:<32} p50 {result['p50_ms']:>9.1f} ms  "
+                      f"p95 {result['p95_ms']:>9.1f} ms  p99 {result['p99_ms']:>9.1f} ms  "
+                      f"RTF {result['real_time_factor']:.4f}{wer}")
+            elapsed = time.perf_counter() - start
+            # Peak RSS is process-wide, so later models include earlier ones' high-water mark
+            report["models"][label] = {
+                "peak_rss_mb": peak_rss_mb(),
+                "audio_seconds_per_second": audio_seconds / elapsed,
+            }
+            print(f"{label:>8} peak RSS {peak_rss_mb():.0f} MB, "
+                  f"{audio_seconds / elapsed:.1f} audio seconds per second")
+
+    if args.profiles:
+        report["profiles"] = summarize_profiles(report["results"])
+        print("\nLatency profiles:")
+        for label, summary in report["profiles"].items():
+            wer = "n/a" if summary["wer"] is None else f"{summary['wer']:.1%} over {summary['wer_cases']} fixtures"
+            print(f"{label:>16}  p50 {summary['p50_ms']:>9.1f} ms  RTF {summary['real_time_factor']:.4f}  "
+                  f"WER {wer}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
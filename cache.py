@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import numpy as np
+import torch
+from whisper.audio import N_FRAMES
+
+
+# Transcripts keyed by a hash of the normalized 16 kHz PCM, model name, precision and
+# decoding options. An in-memory LRU sits in front of an optional on-disk tier that survives
+# restarts, and identical requests already in flight share one computation.
+class TranscriptionCache:
+    def __init__(self, max_entries=256, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.shared = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(samples, model_name, precision, options):
+        digest = hashlib.sha256(samples.tobytes())
+        digest.update(model_name.encode())
+        digest.update(str(precision).encode())
+        digest.update(json.dumps(options, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    # Cached result for key, computing it at most once across concurrent callers
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self.shared += 1
+        if not owner:
+            return future.result()
+
+        try:
+            result = self._read_disk(key)
+            if result is not None:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+                result = compute()
+                # Model timings describe this computation only, not later hits on the entry
+                stored = {k: v for k, v in result.items() if k != "model_stats"}
+                self._write_disk(key, stored)
+                self._remember(key, stored)
+                future.set_result(stored)
+                return result
+            self._remember(key, result)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._memory[key] = result
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    # Write to a temp file and rename so a crash never leaves a half-written entry
+    def _write_disk(self, key, result):
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, default=float)
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Could not write transcription cache entry: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    # Wrap a model handle so its transcribe() goes through the cache
+    def wrap(self, model, model_name, precision=None):
+        return _CachedModel(self, model, model_name, precision)
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.shared + self.misses
+        return {
+            "entries": len(self._memory),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "shared_in_flight": self.shared,
+            "misses": self.misses,
+            "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0,
+        }
+
+
+class _CachedModel:
+    def __init__(self, cache, model, model_name, precision=None):
+        self.cache = cache
+        self.model = model
+        self.model_name = model_name
+        self.precision = precision
+
+    def transcribe(self, samples, **options):
+        key = self.cache.key(samples, self.model_name, self.precision, options)
+        return self.cache.get_or_compute(key, lambda: self.model.transcribe(samples, **options))
+
+
+# Encoder outputs for recent 30 s windows, keyed by a hash of the window's log-mel and
+# the model's (name, device, precision), and bounded to max_mb. cache_encoder installs
+# it under a model's decode() and detect_language(), which skip the encoder when handed
+# these features, so while a cache is active (active_encoder_cache) batched decodes,
+# every window of model.transcribe and its temperature fallbacks reuse them. Re-running
+# a clip with another language or task (or translating after transcribing) only runs
+# the decoder for the windows already seen, even after the model was reloaded.
+class EncoderCache:
+    def __init__(self, max_mb=256):
+        self.max_bytes = int(max_mb * 2**20)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(mel, model_key):
+        data = mel.detach().cpu().contiguous().numpy()
+        return (hashlib.sha256(data).hexdigest(), tuple(mel.shape), model_key)
+
+    # (len(mels), n_audio_ctx, n_audio_state) features for a batch of window mels;
+    # encode(mels) runs the encoder for the windows that aren't cached
+    def features(self, model_key, mels, encode):
+        keys = [self.key(mel, model_key) for mel in mels]
+        found = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[i] = self._entries[key]
+            self.hits += len(found)
+            self.misses += len(mels) - len(found)
+
+        missing = [i for i in range(len(mels)) if i not in found]
+        if missing:
+            encoded = encode(mels[missing])
+            with self._lock:
+                for i, features in zip(missing, encoded):
+                    # Copied so an entry doesn't keep the whole batch's output alive
+                    found[i] = features = features.clone()
+                    self._add(keys[i], features)
+        return torch.stack([found[i] for i in range(len(mels))])
+
+    def _add(self, key, features):
+        if features.nbytes > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.nbytes
+        self._entries[key] = features
+        self._bytes += features.nbytes
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "mb": round(self._bytes / 2**20, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# The encoder cache used by models on the thread running inference, i.e. the batch
+# being decoded (like metrics.active_timer)
+_local = threading.local()
+
+
+@contextmanager
+def active_encoder_cache(cache):
+    previous = getattr(_local, "encoder_cache", None)
+    _local.encoder_cache = cache
+    try:
+        yield cache
+    finally:
+        _local.encoder_cache = previous
+
+
+# Wraps decode() and detect_language() so the window mels they're given are swapped
+# for encoder features from the active cache, encoding only the windows it misses.
+# model_key identifies the weights: (name, device, precision). Encoder features and
+# mels of other shapes pass straight through, as does everything with no cache active.
+def cache_encoder(model, model_key):
+    window = (model.dims.n_mels, N_FRAMES)
+
+    def encode(mels):
+        with torch.no_grad():
+            return model.encoder(mels.to(model.encoder.conv1.weight.dtype))
+
+    def cached(fn):
+        def wrapper(mel, *args, **kwargs):
+            cache = getattr(_local, "encoder_cache", None)
+            if cache is None or tuple(mel.shape[-2:]) != window:
+                return fn(mel, *args, **kwargs)
+            features = cache.features(model_key, mel.reshape(-1, *window), encode)
+            return fn(features.reshape(*mel.shape[:-2], *features.shape[-2:]), *args, **kwargs)
+
+        return wrapper
+
+    model.decode = cached(model.decode)
+    model.detect_language = cached(model.detect_language)
+    return model
@@ -0,0 +1,180 @@
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from whisper.audio import N_SAMPLES
+
+from audio import SAMPLE_RATE
+from jobs import estimate_cost
+
+# A fast-model segment is escalated when its average token log-probability is below
+# CASCADE_LOGPROB, its text compresses better than CASCADE_COMPRESSION (repetition)
+# or the model thought it likely wasn't speech. These are the signals model.transcribe
+# uses for its temperature fallback, with stricter thresholds.
+CASCADE_LOGPROB = -0.5
+CASCADE_COMPRESSION = 2.0
+CASCADE_NO_SPEECH = 0.5
+# Escalated spans decoded at once, so short ones share a batch on the scheduler
+MAX_PARALLEL_SPANS = 8
+
+
+def needs_escalation(segment, logprob_threshold=CASCADE_LOGPROB):
+    return (
+        segment.get("avg_logprob", 0.0) < logprob_threshold
+        or segment.get("compression_ratio", 0.0) > CASCADE_COMPRESSION
+        or segment.get("no_speech_prob", 0.0) > CASCADE_NO_SPEECH
+    )
+
+
+# (start, end) seconds to re-run for the flagged segments: each reaches from the end
+# of the previous segment to the start of the next, so it covers the gaps around it
+# without overlapping a kept segment, and neighbouring flagged segments merge
+def escalation_spans(segments, flagged, duration):
+    spans = []
+    for i, segment in enumerate(segments):
+        if not flagged[i]:
+            continue
+        start = min(segments[i - 1]["end"] if i else 0.0, segment["start"])
+        end = max(segments[i + 1]["start"] if i + 1 < len(segments) else duration, segment["end"])
+        if spans and start <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], max(end, spans[-1][1]))
+        else:
+            spans.append((start, end))
+    return spans
+
+
+def _add_model_stats(total, result):
+    stats = result.get("model_stats")
+    if not stats:
+        return total
+    total = total or {"stages": {}, "counts": {}}
+    for key in ("stages", "counts"):
+        for name, value in stats[key].items():
+            total[key][name] = total[key].get(name, 0) + value
+    return total
+
+
+# model.transcribe-compatible cascade: the fast model transcribes everything, then
+# only the spans around segments it wasn't confident about are transcribed again by
+# the accurate model and replace its segments there. The result carries a "cascade"
+# summary (audio and segments escalated, and cost in jobs.estimate_cost units next
+# to what the accurate model alone would have cost).
+class CascadeModel:
+    def __init__(self, fast, accurate, fast_name, accurate_name, logprob_threshold=CASCADE_LOGPROB):
+        self.fast = fast
+        self.accurate = accurate
+        self.fast_name = fast_name
+        self.accurate_name = accurate_name
+        self.logprob_threshold = logprob_threshold
+
+    def transcribe(self, samples, **options):
+        duration = len(samples) / SAMPLE_RATE
+        # Escalation works on segments, so even a clip of one window needs them timestamped
+        options = {**options, "without_timestamps": False}
+        # Copied because cached results are shared between requests
+        result = copy.deepcopy(self.fast.transcribe(samples, **options))
+        model_stats = _add_model_stats(None, result)
+        segments = result["segments"]
+        flagged = [needs_escalation(segment, self.logprob_threshold) for segment in segments]
+        spans = escalation_spans(segments, flagged, duration)
+
+        if spans:
+            # Same language for every span: short spans are poor for detecting it
+            span_options = {**options, "language": options.get("language") or result["language"]}
+
+            def run(span):
+                start, end = (int(t * SAMPLE_RATE) for t in span)
+                return copy.deepcopy(self.accurate.transcribe(samples[start:end], **span_options))
+
+            with ThreadPoolExecutor(min(len(spans), MAX_PARALLEL_SPANS)) as pool:
+                escalated = list(pool.map(run, spans))
+
+            kept = [segment for segment, flag in zip(segments, flagged) if not flag]
+            for (start, _), span_result in zip(spans, escalated):
+                model_stats = _add_model_stats(model_stats, span_result)
+                for segment in span_result["segments"]:
+                    segment["start"] += start
+                    segment["end"] += start
+                    for word in segment.get("words", []):
+                        word["start"] += start
+                        word["end"] += start
+                    kept.append(segment)
+            segments = sorted(kept, key=lambda segment: segment["start"])
+            for i, segment in enumerate(segments):
+                segment["id"] = i
+
+        escalated_seconds = sum(end - start for start, end in spans)
+        return {
+            "text": "".join(segment["text"] for segment in segments).strip(),
+            "segments": segments,
+            "language": result["language"],
+            **({"model_stats": model_stats} if model_stats else {}),
+            "cascade": {
+                "audio_seconds": duration,
+                "escalated_seconds": escalated_seconds,
+                "segments": len(flagged),
+                "escalated_segments": sum(flagged),
+                "cost": (
+                    estimate_cost(duration, self.fast_name)
+                    + estimate_cost(escalated_seconds, self.accurate_name)
+                ),
+                "full_cost": estimate_cost(duration, self.accurate_name),
+            },
+        }
+
+
+# Language detection for a cascade, on its fast model. Each call's first 30 s window
+# is counted so add_cost can put it into a cascade summary: at the fast model's rate
+# in cost, and at the accurate model's in full_cost, which would have detected alone.
+class CascadeDetector:
+    def __init__(self, detect, fast_name, accurate_name):
+        self.detect = detect
+        self.fast_name = fast_name
+        self.accurate_name = accurate_name
+        self.seconds = 0.0
+
+    def __call__(self, samples):
+        self.seconds += min(len(samples), N_SAMPLES) / SAMPLE_RATE
+        return self.detect(samples)
+
+    def add_cost(self, summary):
+        if not self.seconds:
+            return summary
+        return {
+            **summary,
+            "cost": summary.get("cost", 0.0) + estimate_cost(self.seconds, self.fast_name),
+            "full_cost": summary.get("full_cost", 0.0) + estimate_cost(self.seconds, self.accurate_name),
+        }
+
+
+# Cascade totals across requests, for /metrics and the health API
+class CascadeStats:
+    def __init__(self):
+        self.requests = 0
+        self.totals = dict.fromkeys(
+            ("audio_seconds", "escalated_seconds", "segments", "escalated_segments", "cost", "full_cost"), 0.0
+        )
+        self._lock = threading.Lock()
+
+    def record(self, cascade):
+        with self._lock:
+            self.requests += 1
+            for name in self.totals:
+                self.totals[name] += cascade.get(name, 0.0)
+
+    def summary(self):
+        with self._lock:
+            requests, totals = self.requests, dict(self.totals)
+        return {
+            "requests": requests,
+            "audio_seconds": round(totals["audio_seconds"], 1),
+            "escalated_seconds": round(totals["escalated_seconds"], 1),
+            "escalated_fraction": (
+                totals["escalated_seconds"] / totals["audio_seconds"] if totals["audio_seconds"] else 0.0
+            ),
+            "escalated_segments": int(totals["escalated_segments"]),
+            "segments": int(totals["segments"]),
+            "mean_cost": totals["cost"] / requests if requests else 0.0,
+            "mean_full_cost": totals["full_cost"] / requests if requests else 0.0,
+            "cost": totals["cost"],
+        }
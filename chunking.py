@@ -0,0 +1,244 @@
+import argparse
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from audio import SAMPLE_RATE
+from models import init_worker, worker_registry
+from speculative import DRAFT_TOKENS
+from pipeline import transcribe_audio
+
+CHUNK_SECONDS = 120.0
+OVERLAP_SECONDS = 2.0
+# How far from the nominal boundary to look for a quiet spot to cut at
+SEARCH_SECONDS = 5.0
+FRAME_SECONDS = 0.02
+
+
+# Cut points near every chunk_seconds, moved to the quietest 20 ms frame within
+# search_seconds so boundaries fall in pauses rather than mid-word
+def silence_cuts(samples, chunk_seconds=CHUNK_SECONDS, search_seconds=SEARCH_SECONDS):
+    frame = int(FRAME_SECONDS * SAMPLE_RATE)
+    n_frames = len(samples) // frame
+    energy = np.mean(samples[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1)
+
+    cuts = [0]
+    step = int(chunk_seconds / FRAME_SECONDS)
+    search = int(search_seconds / FRAME_SECONDS)
+    target = step
+    while target < n_frames - search:
+        lo, hi = target - search, min(target + search, n_frames)
+        cut = lo + int(np.argmin(energy[lo:hi]))
+        cuts.append(cut * frame)
+        target = cut + step
+    cuts.append(len(samples))
+    return cuts
+
+
+# Overlapping (start, end, owned_start, owned_end) sample ranges. Each chunk is
+# decoded with overlap on both sides but only keeps segments centred in its owned range.
+def plan_chunks(samples, chunk_seconds=CHUNK_SECONDS, overlap_seconds=OVERLAP_SECONDS):
+    cuts = silence_cuts(samples, chunk_seconds)
+    overlap = int(overlap_seconds * SAMPLE_RATE)
+    return [
+        (max(owned_start - overlap, 0), min(owned_end + overlap, len(samples)), owned_start, owned_end)
+        for owned_start, owned_end in zip(cuts[:-1], cuts[1:])
+    ]
+
+
+# Merge per-chunk results: shift timestamps onto the full timeline and drop the
+# duplicate copies of segments decoded twice in an overlap
+def stitch(chunks, results):
+    segments = []
+    languages = {}
+    for (start, _, owned_start, owned_end), result in zip(chunks, results):
+        offset = start / SAMPLE_RATE
+        lo, hi = owned_start / SAMPLE_RATE, owned_end / SAMPLE_RATE
+        for segment in result.get("segments", []):
+            segment = dict(segment, start=segment["start"] + offset, end=segment["end"] + offset)
+            if not lo <= (segment["start"] + segment["end"]) / 2 < hi:
+                continue
+            for word in segment.get("words", []):
+                word["start"] += offset
+                word["end"] += offset
+            segment["id"] = len(segments)
+            segments.append(segment)
+        language = result.get("language")
+        if language:
+            languages[language] = languages.get(language, 0) + (owned_end - owned_start)
+
+    return {
+        "text": "".join(segment["text"] for segment in segments).strip(),
+        "segments": segments,
+        "language": max(languages, key=languages.get) if languages else None,
+    }
+
+
+# Transcribe 16 kHz blocks (e.g. audio.iter_file_blocks) one window at a time, so
+# memory stays at about `parallel` windows however long the recording is. Windows end
+# at the quietest spot near every window_seconds, like plan_chunks; the language found
+# in the first window with speech is kept for the rest. Returns a transcribe_audio
+# style result for the whole recording, with time spent reading blocks as "decode".
+# progress(audio_seconds_done) is called before each window and after each merge, so
+# raising from it stops the recording between windows.
+def transcribe_blocks(blocks, model, window_seconds=CHUNK_SECONDS, vad=True, detector=None,
+                      parallel=1, progress=None, **options):
+    window = int(window_seconds * SAMPLE_RATE)
+    search = int(SEARCH_SECONDS * SAMPLE_RATE)
+    merged = {
+        "text": "", "segments": [], "language": None, "audio_seconds": 0.0,
+        "speech_seconds": 0.0, "timings": {"decode": 0.0}, "decoding": {"tokens": 0, "fallbacks": 0},
+    }
+
+    def merge(offset, future):
+        result = future.result()
+        shift = offset / SAMPLE_RATE
+        tracks = [(result, merged)]
+        if "translation" in result:
+            tracks.append((result["translation"], merged.setdefault("translation", {"segments": []})))
+        for source, target in tracks:
+            for segment in source["segments"]:
+                segment["start"] += shift
+                segment["end"] += shift
+                for word in segment.get("words", []):
+                    word["start"] += shift
+                    word["end"] += shift
+                segment["id"] = len(target["segments"])
+                target["segments"].append(segment)
+        if result["language"] and merged["language"] is None:
+            merged["language"] = result["language"]
+            if result.get("language_probs") is not None:
+                merged["language_probs"] = result["language_probs"]
+            options["language"] = options.get("language") or result["language"]
+        merged["audio_seconds"] += result["audio_seconds"]
+        merged["speech_seconds"] += result["speech_seconds"]
+        for name, seconds in result["timings"].items():
+            merged["timings"][name] = merged["timings"].get(name, 0.0) + seconds
+        for name, n in result["decoding"].items():
+            merged["decoding"][name] += n
+        if "cascade" in result:
+            cascade = merged.setdefault("cascade", {})
+            for name, value in result["cascade"].items():
+                cascade[name] = cascade.get(name, 0) + value
+        if progress is not None:
+            progress(merged["audio_seconds"])
+
+    inflight = deque()
+
+    def submit(chunk, offset):
+        if progress is not None:
+            progress(merged["audio_seconds"])
+        inflight.append((offset, executor.submit(
+            transcribe_audio, SAMPLE_RATE, chunk, model, vad=vad, detector=detector, **options
+        )))
+        # Until a language is known, later windows wait for it
+        while inflight and (len(inflight) >= parallel or options.get("language") is None):
+            merge(*inflight.popleft())
+
+    with ThreadPoolExecutor(parallel, thread_name_prefix="window") as executor:
+        pending = np.zeros(0, np.float32)
+        offset = 0
+        blocks = iter(blocks)
+        while True:
+            start = time.perf_counter()
+            block = next(blocks, None)
+            merged["timings"]["decode"] += time.perf_counter() - start
+            if block is None:
+                break
+            pending = np.concatenate([pending, block])
+            while len(pending) >= window + 2 * search:
+                cut = silence_cuts(pending[:window + 2 * search], window_seconds)[1]
+                submit(pending[:cut], offset)
+                offset += cut
+                pending = pending[cut:]
+        if len(pending) or offset == 0:
+            submit(pending, offset)
+        while inflight:
+            merge(*inflight.popleft())
+
+    for track in (merged, merged.get("translation")):
+        if track is not None:
+            track["text"] = "".join(segment["text"] for segment in track["segments"]).strip()
+    return merged
+
+
+def _transcribe_chunk(samples, model_name, options, precision=None):
+    model = worker_registry().get(model_name, precision=precision)
+    return model.transcribe(samples, **options)
+
+
+# Transcribes long audio as overlapping chunks across a pool of model worker processes
+class ChunkedTranscriber:
+    def __init__(self, workers=2, threads_per_worker=None, chunk_seconds=CHUNK_SECONDS,
+                 overlap_seconds=OVERLAP_SECONDS, preload=(), precision="fp32", mmap_weights=False,
+                 draft_model=None, draft_tokens=DRAFT_TOKENS):
+        self.workers = workers
+        self.chunk_seconds = chunk_seconds
+        self.overlap_seconds = overlap_seconds
+        threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(threads, tuple(preload), precision, mmap_weights, draft_model, draft_tokens),
+        )
+
+    # Spawn every worker (loading the preload models) ahead of the first request
+    def start(self):
+        for future in [self._pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+        return self
+
+    # precision overrides the workers' own (None: theirs)
+    def transcribe(self, samples, model_name, precision=None, **options):
+        chunks = plan_chunks(samples, self.chunk_seconds, self.overlap_seconds)
+        futures = [
+            self._pool.submit(_transcribe_chunk, samples[start:end], model_name, options, precision)
+            for start, end, _, _ in chunks
+        ]
+        return stitch(chunks, [future.result() for future in futures])
+
+    # Object with a model.transcribe-compatible method bound to one model size
+    def model(self, model_name, precision=None):
+        return _ChunkedModel(self, model_name, precision)
+
+    def shutdown(self):
+        self._pool.shutdown(cancel_futures=True)
+
+
+class _ChunkedModel:
+    def __init__(self, chunked, model_name, precision=None):
+        self.chunked = chunked
+        self.model_name = model_name
+        self.precision = precision
+
+    def transcribe(self, samples, **options):
+        return self.chunked.transcribe(samples, self.model_name, self.precision, **options)
+
+
+# Wall-clock time for one long recording at a given worker count
+if __name__ == "__main__":
+    from audio import load_file
+
+    parser = argparse.ArgumentParser(description="Transcribe a long recording in parallel chunks")
+    parser.add_argument("audio")
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chunk-seconds", type=float, default=CHUNK_SECONDS)
+    args = parser.parse_args()
+
+    samples = load_file(args.audio)
+    duration = len(samples) / SAMPLE_RATE
+
+    for workers in args.workers:
+        chunked = ChunkedTranscriber(workers, chunk_seconds=args.chunk_seconds, preload=[args.model])
+        chunked.start()
+        start = time.perf_counter()
+        chunked.transcribe(samples, args.model)
+        elapsed = time.perf_counter() - start
+        chunked.shutdown()
+        print(f"workers={workers} wall={elapsed:.1f}s real-time factor={elapsed / duration:.3f}")
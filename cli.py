@@ -0,0 +1,150 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from audio import AUDIO_EXTENSIONS, iter_file_blocks
+from batching import detect_language_batch
+from chunking import transcribe_blocks
+from models import MODEL_SIZES, PRECISIONS, init_worker, worker_registry
+from speculative import DRAFT_TOKENS
+
+
+# Audio files under a directory, or the paths listed in a manifest
+# (one path per line, or JSON lines with a "path" field)
+def collect_inputs(source):
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(
+                os.path.abspath(os.path.join(root, name)) for name in files
+                if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS
+            )
+        return sorted(paths)
+
+    base = os.path.dirname(os.path.abspath(source))
+    paths = []
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            path = json.loads(line)["path"] if line.startswith("{") else line
+            paths.append(path if os.path.isabs(path) else os.path.join(base, path))
+    return paths
+
+
+# Paths already transcribed successfully in an earlier run
+def completed_paths(output):
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn last line from a crash
+            if "error" not in record:
+                done.add(record["path"])
+    return done
+
+
+def _transcribe_file(path, model_name, vad, options):
+    start = time.perf_counter()
+    try:
+        model = worker_registry().get(model_name)
+        result = transcribe_blocks(
+            iter_file_blocks(path), model, vad=vad,
+            detector=lambda s: detect_language_batch(model, [s])[0], **options
+        )
+    except Exception as e:
+        return {"path": path, "error": str(e)}
+    return {
+        "path": path,
+        "model": model_name,
+        "text": result["text"].strip(),
+        "language": result["language"],
+        "language_probs": result.get("language_probs"),
+        "segments": [
+            {"start": round(s["start"], 2), "end": round(s["end"], 2), "text": s["text"].strip()}
+            for s in result["segments"]
+        ],
+        "audio_seconds": result["audio_seconds"],
+        "processing_seconds": time.perf_counter() - start,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Transcribe a directory or manifest of audio files to JSON lines"
+    )
+    parser.add_argument("source", help="directory of audio files, or a manifest file")
+    parser.add_argument("-o", "--output", default="transcripts.jsonl")
+    parser.add_argument("--model", default="large", choices=MODEL_SIZES)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes, each holding a model")
+    parser.add_argument("--threads-per-worker", type=int, default=None)
+    parser.add_argument("--precision", choices=PRECISIONS, default="fp32")
+    parser.add_argument("--mmap-weights", action="store_true",
+                        help="memory-map converted weights so workers share one copy")
+    parser.add_argument("--draft-model", default=None, choices=MODEL_SIZES[:2],
+                        help="decode speculatively with this model proposing tokens")
+    parser.add_argument("--draft-tokens", type=int, default=DRAFT_TOKENS)
+    parser.add_argument("--language", default=None, help="force a language, e.g. ur")
+    parser.add_argument("--no-vad", action="store_true")
+    args = parser.parse_args(argv)
+
+    paths = collect_inputs(args.source)
+    done = completed_paths(args.output)
+    todo = [path for path in paths if path not in done]
+    print(f"{len(paths)} files, {len(paths) - len(todo)} already done, {len(todo)} to go")
+    if not todo:
+        return 0
+
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+    options = {"language": args.language} if args.language else {}
+    start = time.perf_counter()
+    audio_seconds = 0.0
+    failures = 0
+
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(
+            threads, (args.model,), args.precision, args.mmap_weights, args.draft_model, args.draft_tokens
+        ),
+    ) as pool, open(args.output, "a", encoding="utf-8") as out:
+        futures = [
+            pool.submit(_transcribe_file, path, args.model, not args.no_vad, options)
+            for path in todo
+        ]
+        for n, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            if "error" in record:
+                failures += 1
+                print(f"[{n}/{len(todo)}] ❌ {record['path']}: {record['error']}", file=sys.stderr)
+                continue
+            audio_seconds += record["audio_seconds"]
+            print(
+                f"[{n}/{len(todo)}] {record['path']} "
+                f"({record['audio_seconds']:.1f}s audio in {record['processing_seconds']:.1f}s)"
+            )
+
+    elapsed = time.perf_counter() - start
+    done_now = len(todo) - failures
+    print(
+        f"Done: {done_now} files ({failures} failed) in {elapsed:.1f}s • "
+        f"{done_now / elapsed * 3600:.0f} files/hour • "
+        f"real-time factor {elapsed / audio_seconds if audio_seconds else 0:.3f}"
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
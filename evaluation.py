@@ -0,0 +1,47 @@
+import os
+import resource
+
+from whisper.normalizers import BasicTextNormalizer
+
+from audio import AUDIO_EXTENSIONS
+
+_normalize = BasicTextNormalizer()
+
+
+# Word error rate after Whisper's basic (language-agnostic) text normalization
+def word_error_rate(reference, hypothesis):
+    ref = _normalize(reference).split()
+    hyp = _normalize(hypothesis).split()
+    if not ref:
+        return 0.0 if not hyp else 1.0
+
+    # Levenshtein distance over words, one row at a time
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word),
+            ))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+# (audio_path, reference_text) pairs: every audio file in a directory that has a
+# transcript with the same name and a .txt extension next to it
+def load_test_set(directory):
+    pairs = []
+    for name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(name)
+        reference = os.path.join(directory, stem + ".txt")
+        if ext.lower() in AUDIO_EXTENSIONS and os.path.exists(reference):
+            with open(reference, encoding="utf-8") as f:
+                pairs.append((os.path.join(directory, name), f.read().strip()))
+    return pairs
+
+
+# Peak resident set size of this process so far
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
@@ -0,0 +1,177 @@
+import hashlib
+import importlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+import torch
+from whisper.audio import HOP_LENGTH, N_FFT, N_FRAMES, N_SAMPLES, mel_filters
+
+
+@lru_cache(maxsize=None)
+def hann_window(device):
+    return torch.hann_window(N_FFT, device=device)
+
+
+@lru_cache(maxsize=None)
+def filterbank(n_mels, device):
+    return mel_filters(device, n_mels)
+
+
+# Log-mel spectrograms of whole clips, exactly as whisper.transcribe computes them:
+# the clip padded with 30 s of silence, one STFT over all of its windows, normalized
+# over the whole clip. Language detection and batched decodes take the first window
+# of the same spectrogram that model.transcribe slices its windows from (once
+# install_transcribe_hook has run), so each clip's mel is computed once. The Hann
+# window and filterbank are built once per device, padded audio and mel projections
+# are written into grow-only buffers per (n_mels, device), and on GPU short clips
+# share one batched STFT.
+#
+# The last cache_mb of spectrograms are kept, keyed by a hash of the audio, so the
+# cache holds no reference to the audio itself.
+class LogMelFrontend:
+    def __init__(self, cache_mb=64):
+        self.max_bytes = int(cache_mb * 2**20)
+        self._cache = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # (n_mels, device) -> (padded audio, mel projection), reused by every compute
+        self._buffers = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(samples, n_mels):
+        samples = np.ascontiguousarray(samples, np.float32)
+        return (hashlib.sha256(samples).hexdigest(), len(samples), n_mels)
+
+    # (n_mels, frames) for a whole clip, like whisper.log_mel_spectrogram(samples,
+    # n_mels, padding=N_SAMPLES); on the device it was first computed on
+    def clip_mel(self, samples, n_mels, device="cpu"):
+        return self._clip_mels([samples], n_mels, torch.device(device))[0]
+
+    # (len(batch), n_mels, N_FRAMES) float32 on device: the first window of each clip
+    def window_mels(self, batch, n_mels, device):
+        mels = self._clip_mels(batch, n_mels, device)
+        return torch.stack([mel[:, :N_FRAMES].to(device) for mel in mels])
+
+    def _clip_mels(self, batch, n_mels, device):
+        keys = [self._key(samples, n_mels) for samples in batch]
+        with self._lock:
+            found = {i: self._cache[key] for i, key in enumerate(keys) if key in self._cache}
+            for i in found:
+                self._cache.move_to_end(keys[i])
+            self.hits += len(found)
+            self.misses += len(batch) - len(found)
+            missing = [i for i in range(len(batch)) if i not in found]
+            if missing:
+                for i, mel in zip(missing, self._compute([batch[i] for i in missing], n_mels, device)):
+                    found[i] = mel
+                    self._add(keys[i], mel)
+        return [found[i] for i in range(len(batch))]
+
+    def _add(self, key, mel):
+        nbytes = mel.numel() * mel.element_size()
+        if nbytes > self.max_bytes:
+            return
+        old = self._cache.pop(key, None)
+        if old is not None:
+            self._bytes -= old.numel() * old.element_size()
+        self._cache[key] = mel
+        self._bytes += nbytes
+        while self._bytes > self.max_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._bytes -= evicted.numel() * evicted.element_size()
+
+    # Scratch space for one compute (callers hold _lock): a float32 audio array of
+    # audio_size and an (n_mels, frames) tensor on device, both views of buffers that
+    # only grow, so clips of sizes seen before allocate neither
+    def _scratch(self, n_mels, device, audio_size, frames):
+        audio, mel = self._buffers.get((n_mels, device), (None, None))
+        if audio is None or len(audio) < audio_size:
+            audio = np.empty(audio_size, np.float32)
+        if mel is None or mel.numel() < n_mels * frames:
+            mel = torch.empty(n_mels * frames, device=device)
+        self._buffers[(n_mels, device)] = audio, mel
+        return audio[:audio_size], mel[:n_mels * frames].view(n_mels, frames)
+
+    def _compute(self, batch, n_mels, device):
+        filters = filterbank(n_mels, device)
+        lengths = [len(samples) for samples in batch]
+        # Frames of the clip padded with 30 s of silence, the last STFT frame dropped
+        frames = [(n + N_SAMPLES) // HOP_LENGTH for n in lengths]
+
+        if device.type != "cpu" and max(lengths) <= N_SAMPLES:
+            # One batched STFT over a shared length. Past each clip its row is silence,
+            # which leaves the clip's frames and its peak exactly as computed alone.
+            width = 2 * N_SAMPLES + N_FFT
+            audio, _ = self._scratch(n_mels, device, len(batch) * width, 0)
+            audio = audio.reshape(len(batch), width)
+            audio.fill(0)
+            for row, samples in zip(audio, batch):
+                row[:len(samples)] = samples
+            mels = log_compress(filters @ _power_spectrum(torch.from_numpy(audio).to(device), device))
+            # Copied so an entry doesn't keep the whole batch's spectrogram alive
+            return [mel[:, :n].clone() for mel, n in zip(mels, frames)]
+
+        # On CPU one batched STFT is slower than clip by clip: its intermediates for a
+        # whole batch don't fit in cache. Each clip is padded into the audio buffer and
+        # projected into the mel buffer; log_compress then returns the new tensor kept.
+        mels = []
+        for samples, n in zip(batch, frames):
+            audio, mel = self._scratch(n_mels, device, len(samples) + N_SAMPLES, n)
+            audio[:len(samples)] = samples
+            audio[len(samples):] = 0
+            power = _power_spectrum(torch.from_numpy(audio).to(device), device)
+            torch.matmul(filters, power, out=mel)
+            mels.append(log_compress(mel))
+        return mels
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._cache),
+            "mb": round(self._bytes / 2**20, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# |z|^2 of the STFT without its last frame. Squaring the real and imaginary parts is
+# much cheaper than abs() ** 2 on CPU.
+def _power_spectrum(audio, device):
+    stft = torch.stft(audio, N_FFT, HOP_LENGTH, window=hann_window(device), return_complex=True)
+    parts = torch.view_as_real(stft[..., :-1])
+    return parts[..., 0] ** 2 + parts[..., 1] ** 2
+
+
+# Whisper's log scaling with an 80 dB dynamic range per clip, in place
+def log_compress(mel):
+    mel = mel.clamp_(min=1e-10).log10_()
+    peak = mel.amax(dim=(-2, -1), keepdim=True)
+    return torch.maximum(mel, peak - 8.0).add_(4.0).div_(4.0)
+
+
+# Shared by everything that runs inference in this process
+FRONTEND = LogMelFrontend()
+
+
+# model.transcribe computes the log-mel of the whole clip with whisper's
+# log_mel_spectrogram. install_transcribe_hook routes that call through FRONTEND so
+# it reuses the spectrogram language detection already computed for the clip (and the
+# next pass reuses it too). It patches whisper.transcribe for the whole process, so it
+# is installed by whoever loads models to serve (models.ModelLoader), not on import.
+_transcribe_module = importlib.import_module("whisper.transcribe")
+_log_mel_spectrogram = _transcribe_module.log_mel_spectrogram
+
+
+def _transcribe_log_mel(audio, n_mels=80, padding=0, device=None):
+    if padding != N_SAMPLES or device is not None or not isinstance(audio, np.ndarray) or audio.ndim != 1:
+        return _log_mel_spectrogram(audio, n_mels, padding, device)
+    return FRONTEND.clip_mel(audio, n_mels)
+
+
+def install_transcribe_hook():
+    _transcribe_module.log_mel_spectrogram = _transcribe_log_mel
@@ -0,0 +1,160 @@
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+# Rough decoding cost per second of audio relative to tiny, by model size
+MODEL_COST = {"tiny": 1.0, "base": 2.0, "small": 5.0, "medium": 12.0, "large": 24.0}
+
+
+# Cost of a transcription in tiny-model audio seconds; translation decodes twice
+def estimate_cost(audio_seconds, model_name, translate=False):
+    per_second = next(
+        (cost for size, cost in MODEL_COST.items() if model_name.startswith(size)), MODEL_COST["large"]
+    )
+    return audio_seconds * per_second * (2 if translate else 1)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# One queued transcription. run(progress) does the work and calls progress with the
+# audio seconds done so far; progress raises JobCancelled once the job is cancelled.
+class Job:
+    _ids = itertools.count(1)
+
+    def __init__(self, run, audio_seconds, cost):
+        self.id = next(self._ids)
+        self.run = run
+        self.audio_seconds = audio_seconds
+        self.cost = cost
+        self.state = "queued"
+        self.done_seconds = 0.0
+        self.submitted = time.monotonic()
+        self.started = None
+        self.future = Future()
+        self._cancelled = threading.Event()
+
+    def progress(self, done_seconds):
+        if self._cancelled.is_set():
+            raise JobCancelled(f"job {self.id} was cancelled")
+        self.done_seconds = done_seconds
+
+    @property
+    def fraction(self):
+        if not self.audio_seconds:
+            return 0.0
+        return min(self.done_seconds / self.audio_seconds, 1.0)
+
+
+# Transcription jobs run by a fixed set of worker threads, cheapest first, so a short
+# voice note never waits behind a long upload. A job that has waited max_wait_seconds
+# goes next whatever its cost, so long jobs can't starve under a stream of short ones.
+# Cancelled jobs leave the queue at once (their future is cancelled), or stop at
+# their next progress call (their future raises JobCancelled).
+class JobQueue:
+    def __init__(self, workers=4, max_wait_seconds=60):
+        self.workers = workers
+        self.max_wait_seconds = max_wait_seconds
+        self._pending = []
+        self._cond = threading.Condition()
+        self.running = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.promoted = 0
+        self.wait_seconds = 0.0
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"job-{i}", daemon=True).start()
+
+    def submit(self, run, audio_seconds, cost):
+        job = Job(run, audio_seconds, cost)
+        with self._cond:
+            self._pending.append(job)
+            self._cond.notify()
+        return job
+
+    def cancel(self, job):
+        with self._cond:
+            job._cancelled.set()
+            if job not in self._pending:
+                return
+            self._pending.remove(job)
+            job.state = "cancelled"
+            self.cancelled += 1
+        job.future.cancel()
+
+    # 1-based place in the order jobs would start now, or None once started
+    def position(self, job):
+        with self._cond:
+            pending = list(self._pending)
+        for n in range(len(pending)):
+            nxt = self._pick(pending)
+            if nxt is job:
+                return n + 1
+            pending.remove(nxt)
+        return None
+
+    def _pick(self, pending):
+        oldest = min(pending, key=lambda job: job.submitted)
+        if time.monotonic() - oldest.submitted >= self.max_wait_seconds:
+            return oldest
+        return min(pending, key=lambda job: (job.cost, job.submitted))
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                job = self._pick(self._pending)
+                if job is not min(self._pending, key=lambda job: (job.cost, job.submitted)):
+                    self.promoted += 1
+                self._pending.remove(job)
+                if not job.future.set_running_or_notify_cancel():
+                    # Future cancelled directly by whoever was waiting on it
+                    job.state = "cancelled"
+                    self.cancelled += 1
+                    continue
+                job.state = "running"
+                job.started = time.monotonic()
+                self.running += 1
+                self.started += 1
+                self.wait_seconds += job.started - job.submitted
+
+            try:
+                result = job.run(job.progress)
+            except JobCancelled as e:
+                self._finish(job, "cancelled")
+                job.future.set_exception(e)
+            except Exception as e:
+                self._finish(job, "failed")
+                job.future.set_exception(e)
+            else:
+                self._finish(job, "done")
+                job.future.set_result(result)
+
+    def _finish(self, job, state):
+        with self._cond:
+            job.state = state
+            self.running -= 1
+            if state == "done":
+                self.completed += 1
+            elif state == "failed":
+                self.failed += 1
+            else:
+                self.cancelled += 1
+
+    def stats(self):
+        with self._cond:
+            queued = len(self._pending)
+        return {
+            "queued": queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "starvation_promotions": self.promoted,
+            "mean_wait_seconds": self.wait_seconds / self.started if self.started else 0.0,
+        }
@@ -0,0 +1,16 @@
+# Hindi and Urdu sound the same when spoken, so Whisper splits its probability
+# between them. Urdu wins unless Hindi is clearly ahead.
+URDU_PRIORITY_RATIO = 0.5
+
+
+# Most likely language from a {code: probability} dict, with Urdu priority applied
+def pick_language(probs):
+    language = max(probs, key=probs.get)
+    if language == "hi" and probs.get("ur", 0.0) >= URDU_PRIORITY_RATIO * probs["hi"]:
+        return "ur"
+    return language
+
+
+def top_languages(probs, k=5):
+    ranked = sorted(probs.items(), key=lambda item: item[1], reverse=True)[:k]
+    return [(code, float(p)) for code, p in ranked]
@@ -0,0 +1,250 @@
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+# Wall-clock time per pipeline stage (plus event counts) for one request or batch
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            counts, total, n = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, n + 1)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, n) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    labels = _format_labels(self.labels, key, [("le", bound)])
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labels, key, [("le", "+Inf")])
+                lines.append(f"{self.name}_bucket{labels} {n}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {n}")
+        return lines
+
+
+# Metrics plus collector callbacks for values owned elsewhere (cache, scheduler, ...).
+# A collector returns (name, help, type, [(labels_dict, value), ...]) tuples.
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collect):
+        self._collectors.append(collect)
+
+    # Prometheus text exposition format
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for name, help, kind, samples in collect():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+REQUESTS = REGISTRY.counter("stt_requests_total", "Requests received", ("endpoint",))
+ERRORS = REGISTRY.counter("stt_errors_total", "Requests that failed", ("endpoint",))
+AUDIO_SECONDS = REGISTRY.counter("stt_audio_seconds_total", "Seconds of audio processed")
+DECODED_TOKENS = REGISTRY.counter("stt_decoded_tokens_total", "Tokens decoded", ("model",))
+FALLBACKS = REGISTRY.counter(
+    "stt_temperature_fallbacks_total", "Decodes retried at a higher temperature", ("model",)
+)
+DRAFT_TOKENS = REGISTRY.counter(
+    "stt_draft_tokens_total", "Tokens proposed by the speculative decoding draft model", ("model", "outcome")
+)
+LATENCY_PROFILE_REQUESTS = REGISTRY.counter(
+    "stt_latency_profile_requests_total", "Transcriptions by latency profile", ("profile",)
+)
+STAGE_SECONDS = REGISTRY.histogram("stt_stage_seconds", "Time spent per pipeline stage", ("stage",))
+
+
+# Model internals (mel, encoder, decoder, fallbacks) are timed into the timer that is
+# active on the thread running inference, i.e. the batch being decoded
+_local = threading.local()
+
+
+@contextmanager
+def active_timer(timer):
+    previous = getattr(_local, "timer", None)
+    _local.timer = timer
+    try:
+        yield timer
+    finally:
+        _local.timer = previous
+
+
+@contextmanager
+def stage(name):
+    timer = getattr(_local, "timer", None)
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def count(name, n=1):
+    timer = getattr(_local, "timer", None)
+    if timer is not None:
+        timer.count(name, n)
+
+
+# Forward hooks timing the encoder and decoder, and a decode() wrapper counting
+# temperature fallbacks into the timer (the scheduler adds them to FALLBACKS per
+# batch). Costs two perf_counter calls per forward when no timer is active.
+def instrument_model(model):
+    for name, module in (("encoder", model.encoder), ("decoder", model.decoder)):
+        starts = threading.local()
+
+        def before(module, args, starts=starts):
+            starts.value = time.perf_counter()
+
+        def after(module, args, output, name=name, starts=starts):
+            timer = getattr(_local, "timer", None)
+            if timer is not None:
+                timer.add(name, time.perf_counter() - starts.value)
+
+        module.register_forward_pre_hook(before)
+        module.register_forward_hook(after)
+
+    decode = model.decode
+
+    def decode_with_metrics(mel, options=None, **kwargs):
+        if options is not None and options.temperature > 0:
+            count("fallbacks")
+        if options is None:
+            return decode(mel, **kwargs)
+        return decode(mel, options, **kwargs)
+
+    model.decode = decode_with_metrics
+    return model
+
+
+# Per-request counters and stage histograms from a finished pipeline result
+def record_result(result, model_name):
+    AUDIO_SECONDS.inc(result["audio_seconds"])
+    DECODED_TOKENS.inc(result.get("decoding", {}).get("tokens", 0), model=model_name)
+    LATENCY_PROFILE_REQUESTS.inc(profile=result["latency_profile"])
+    for name, seconds in result["timings"].items():
+        STAGE_SECONDS.observe(seconds, stage=name)
+
+
+# Compact one-line summary for the status box, e.g. "vad 4ms · model 1.21s (encoder 310ms ...)"
+MODEL_STAGES = ("mel", "encoder", "decoder", "draft")
+
+
+def format_timings(timings, decoding=None):
+    def fmt(seconds):
+        return f"{seconds * 1000:.0f}ms" if seconds < 1 else f"{seconds:.2f}s"
+
+    outer = [f"{name} {fmt(s)}" for name, s in timings.items() if name not in MODEL_STAGES]
+    inner = [f"{name} {fmt(timings[name])}" for name in MODEL_STAGES if name in timings]
+    if decoding and decoding.get("fallbacks"):
+        inner.append(f"{decoding['fallbacks']} fallbacks")
+    summary = " · ".join(outer)
+    if inner:
+        summary += f" ({' · '.join(inner)})"
+    return summary
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Serve /metrics on its own local port, for when the HTTP API isn't running
+def start_metrics_server(port, host="127.0.0.1"):
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,332 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import torch
+import whisper
+
+from audio import SAMPLE_RATE
+from cache import cache_encoder
+from frontend import install_transcribe_hook
+from metrics import instrument_model
+from quantization import load_quantized
+from speculative import DRAFT_TOKENS, enable_speculative
+from weights import load_mmapped
+
+# Process start, used to report cold-start time to the first served request
+PROCESS_START = time.perf_counter()
+
+# Sizes offered in the UI and API, smallest first
+MODEL_SIZES = ["tiny", "base", "small", "medium", "large"]
+# int8 is dynamically quantized and CPU-only
+PRECISIONS = ["fp32", "fp16", "int8"]
+
+
+# Index of a model's size in MODEL_SIZES, so variants like "large-v3" or "base.en"
+# compare by size; names of no known size rank with the largest
+def model_size_rank(model_name):
+    return next(
+        (rank for rank, size in enumerate(MODEL_SIZES) if model_name.startswith(size)), len(MODEL_SIZES) - 1
+    )
+
+
+def default_device():
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+# Bytes held by a model's weights; the state dict also covers quantized packed weights
+def model_nbytes(model):
+    total = 0
+    for value in model.state_dict().values():
+        for tensor in value if isinstance(value, tuple) else (value,):
+            if isinstance(tensor, torch.Tensor):
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+# Loads a Whisper model on a background thread, warms it up and reports readiness.
+# With mmap_weights, fp32/fp16 weights are memory-mapped from a converted copy of the
+# checkpoint (see weights.py), shared with every other process using the same model.
+# With a draft (a callable returning a smaller model), greedy decodes are speculative:
+# the draft proposes tokens and this model verifies them (see speculative.py).
+class ModelLoader:
+    def __init__(self, model_name="large", device=None, precision="fp32", mmap_weights=False,
+                 draft=None, draft_tokens=DRAFT_TOKENS):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+        self.model_name = model_name
+        self.device = "cpu" if precision == "int8" else device or default_device()
+        if precision == "fp16" and self.device == "cpu":
+            # Half-precision weights can't run on CPU: warm-up fails with "mixed dtype"
+            print(f"⚠️ fp16 needs a GPU; loading Whisper '{model_name}' in fp32 on CPU")
+            precision = "fp32"
+        self.precision = precision
+        self.mmap_weights = mmap_weights and precision != "int8"
+        self.draft = draft
+        self.draft_tokens = draft_tokens
+        self.model = None
+        self.nbytes = 0
+        self.error = None
+        self.stage = "idle"
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.first_request_seconds = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._callbacks = []
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._load, name=f"load-{self.model_name}", daemon=True
+                )
+                self._thread.start()
+        return self
+
+    def _load(self):
+        try:
+            self.stage = "loading"
+            start = time.perf_counter()
+            if self.precision == "int8":
+                model = load_quantized(self.model_name)
+            elif self.mmap_weights:
+                model = load_mmapped(self.model_name, self.precision, self.device)
+            else:
+                model = whisper.load_model(self.model_name, device=self.device)
+                if self.precision == "fp16":
+                    model = model.half()
+            self.nbytes = model_nbytes(model)
+            self.load_seconds = time.perf_counter() - start
+            # Whisper's kv-cache hooks make concurrent decodes on one model unsafe, and
+            # besides the thread serving it a model can be decoded as another model's
+            # draft, e.g. on that model's loader thread while it warms up. Whoever runs
+            # it holds this; speculative decodes take the model's lock, then the draft's.
+            model.inference_lock = threading.RLock()
+            instrument_model(model)
+            cache_encoder(model, (self.model_name, self.device, self.precision))
+            # model.transcribe's spectrograms come from the shared frontend
+            install_transcribe_hook()
+            if self.draft is not None:
+                enable_speculative(model, self.draft, self.draft_tokens)
+
+            # One short decode so the first real request doesn't pay for lazy init
+            self.stage = "warming up"
+            start = time.perf_counter()
+            with model.inference_lock:
+                model.transcribe(
+                    np.zeros(SAMPLE_RATE, dtype=np.float32), temperature=0.0, fp16=self.fp16
+                )
+            self.warmup_seconds = time.perf_counter() - start
+
+            self.model = model
+            self.stage = "ready"
+            print(
+                f"Whisper '{self.model_name}' ready: load {self.load_seconds:.1f}s, "
+                f"warm-up {self.warmup_seconds:.1f}s"
+            )
+        except Exception as e:
+            self.error = e
+            self.stage = "failed"
+            print(f"Failed to load Whisper '{self.model_name}': {e}")
+        finally:
+            with self._lock:
+                self._ready.set()
+                callbacks, self._callbacks = self._callbacks, []
+            for callback in callbacks:
+                callback()
+
+    @property
+    def ready(self):
+        return self.model is not None
+
+    # Loading has finished, successfully or not
+    @property
+    def done(self):
+        return self._ready.is_set()
+
+    # Call callback() once loading has finished, or right away if it already has
+    def add_done_callback(self, callback):
+        with self._lock:
+            if not self._ready.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    # Decode option matching the loaded weights; fp16 decoding only works on GPU
+    @property
+    def fp16(self):
+        return self.precision == "fp16" and self.device != "cpu"
+
+    # Block until the model is loaded; raises if loading failed
+    def get(self, timeout=None):
+        self.start()
+        if not self._ready.wait(timeout):
+            raise TimeoutError(f"Model '{self.model_name}' is still {self.stage}")
+        if self.error is not None:
+            raise RuntimeError(f"Model '{self.model_name}' failed to load: {self.error}")
+        if self.model is None:
+            raise RuntimeError(f"Model '{self.model_name}' was evicted")
+        return self.model
+
+    # Drop our reference so the weights can be freed once in-flight requests finish
+    def release(self):
+        self.model = None
+        self.stage = "evicted"
+
+    # Record cold-start time the first time a request is served
+    def mark_served(self):
+        if self.first_request_seconds is None:
+            self.first_request_seconds = time.perf_counter() - PROCESS_START
+            print(f"Cold start to first served request: {self.first_request_seconds:.1f}s")
+
+    def health(self):
+        return {
+            "model": self.model_name,
+            "device": self.device,
+            "precision": self.precision,
+            "mmap_weights": self.mmap_weights,
+            "speculative": self.draft is not None,
+            "resident_mb": round(self.nbytes / 2**20, 1),
+            "stage": self.stage,
+            "ready": self.ready,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "first_request_seconds": self.first_request_seconds,
+            "error": None if self.error is None else str(self.error),
+        }
+
+    def status(self):
+        if self.stage == "failed":
+            return f"❌ Model '{self.model_name}' failed to load: {self.error}"
+        if not self.ready:
+            return f"⏳ Model '{self.model_name}' {self.stage}..."
+        message = (
+            f"🟢 Model '{self.model_name}' ready "
+            f"(load {self.load_seconds:.1f}s, warm-up {self.warmup_seconds:.1f}s)"
+        )
+        if self.first_request_seconds is not None:
+            message += f" • cold start {self.first_request_seconds:.1f}s"
+        return message
+
+
+# Models keyed by (name, device, precision), loaded on first use and evicted
+# least-recently-used once the resident weights exceed budget_mb. With a draft_model
+# every other model decodes speculatively with it as the draft, loaded alongside.
+class ModelRegistry:
+    def __init__(self, budget_mb=None, device=None, precision="fp32", mmap_weights=False,
+                 draft_model=None, draft_tokens=DRAFT_TOKENS):
+        if draft_model is not None and draft_model not in whisper.available_models():
+            raise ValueError(f"Unknown draft model '{draft_model}'")
+        self.budget_bytes = None if budget_mb is None else int(budget_mb * 2**20)
+        self.device = device or default_device()
+        if precision == "fp16" and self.device == "cpu":
+            print("⚠️ fp16 needs a GPU; serving fp32 on CPU")
+            precision = "fp32"
+        self.precision = precision
+        self.mmap_weights = mmap_weights
+        self.draft_model = draft_model
+        self.draft_tokens = draft_tokens
+        self.evictions = 0
+        self._loaders = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def fp16(self):
+        return self.precision == "fp16" and self.device != "cpu"
+
+    def key(self, model_name, device=None, precision=None):
+        precision = precision or self.precision
+        device = "cpu" if precision == "int8" else device or self.device
+        if precision == "fp16" and device == "cpu":
+            precision = "fp32"
+        return (model_name, device, precision)
+
+    # Loader for a model, created and started in the background if needed
+    def loader(self, model_name, device=None, precision=None):
+        if model_name not in whisper.available_models():
+            raise ValueError(f"Unknown model '{model_name}'")
+        key = self.key(model_name, device, precision)
+        draft = None
+        if self.draft_model is not None and model_name != self.draft_model:
+            draft = lambda: self.get(self.draft_model, device, precision)
+        with self._lock:
+            loader = self._loaders.get(key)
+            created = loader is None or loader.stage in ("failed", "evicted")
+            if created:
+                loader = ModelLoader(
+                    *key, mmap_weights=self.mmap_weights, draft=draft, draft_tokens=self.draft_tokens
+                )
+                self._loaders[key] = loader
+            self._loaders.move_to_end(key)
+        if created and draft is not None:
+            # Load the draft at the same time rather than on the first decode
+            self.loader(self.draft_model, device, precision)
+        return loader.start()
+
+    # Loaded model, blocking until it is ready
+    def get(self, model_name, device=None, precision=None):
+        loader = self.loader(model_name, device, precision)
+        model = loader.get()
+        self._evict(keep=loader)
+        return model
+
+    def mark_served(self, model_name, device=None, precision=None):
+        loader = self._loaders.get(self.key(model_name, device, precision))
+        if loader is not None:
+            loader.mark_served()
+
+    def status(self, model_name, device=None, precision=None):
+        loader = self._loaders.get(self.key(model_name, device, precision))
+        if loader is None:
+            return f"💤 Model '{model_name}' not loaded (loads on first use)"
+        return loader.status()
+
+    # Drop least-recently-used ready models until we are back under budget.
+    # In-flight requests keep their own reference, so eviction never breaks them.
+    def _evict(self, keep):
+        if self.budget_bytes is None:
+            return
+        with self._lock:
+            total = sum(loader.nbytes for loader in self._loaders.values() if loader.ready)
+            for key, loader in list(self._loaders.items()):
+                if total <= self.budget_bytes:
+                    break
+                if loader is keep or not loader.ready:
+                    continue
+                del self._loaders[key]
+                loader.release()
+                total -= loader.nbytes
+                self.evictions += 1
+                print(f"Evicted Whisper '{key[0]}' ({key[1]}, {key[2]}) to stay under the memory budget")
+
+    def health(self):
+        with self._lock:
+            loaders = list(self._loaders.values())
+        return {
+            "budget_mb": None if self.budget_bytes is None else self.budget_bytes / 2**20,
+            "resident_mb": round(sum(l.nbytes for l in loaders if l.ready) / 2**20, 1),
+            "evictions": self.evictions,
+            "models": [loader.health() for loader in loaders],
+        }
+
+
+# One registry per pool worker process, with torch threads split between workers
+_worker_registry = None
+
+
+def init_worker(threads, preload=(), precision="fp32", mmap_weights=False, draft_model=None,
+                draft_tokens=DRAFT_TOKENS):
+    global _worker_registry
+    torch.set_num_threads(threads)
+    _worker_registry = ModelRegistry(
+        precision=precision, mmap_weights=mmap_weights, draft_model=draft_model, draft_tokens=draft_tokens
+    )
+    for model_name in preload:
+        _worker_registry.get(model_name)
+
+
+def worker_registry():
+    return _worker_registry
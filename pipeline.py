@@ -0,0 +1,149 @@
+import copy
+import threading
+from collections import defaultdict
+
+from whisper.audio import N_SAMPLES
+
+from audio import SAMPLE_RATE, prepare_audio
+from language import pick_language, top_languages
+from metrics import StageTimer
+from vad import detect_speech
+
+
+# Stage time and audio totals across requests
+class StageStats:
+    def __init__(self):
+        self.requests = 0
+        self.audio_seconds = 0.0
+        self.speech_seconds = 0.0
+        self.stage_seconds = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def record(self, result):
+        with self._lock:
+            self.requests += 1
+            self.audio_seconds += result["audio_seconds"]
+            self.speech_seconds += result["speech_seconds"]
+            for name, seconds in result["timings"].items():
+                self.stage_seconds[name] += seconds
+
+    def summary(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "audio_seconds": round(self.audio_seconds, 1),
+                "silence_skipped_seconds": round(self.audio_seconds - self.speech_seconds, 1),
+                "stage_seconds": {name: round(s, 3) for name, s in self.stage_seconds.items()},
+            }
+
+
+# Language identification only: first 30 s of speech through detector (samples -> probs)
+def identify_language(sample_rate, data, detector, vad=True, top_k=5):
+    timer = StageTimer()
+    with timer.stage("preprocess"):
+        samples = prepare_audio(sample_rate, data)
+    if vad:
+        with timer.stage("vad"):
+            speech = detect_speech(samples)
+            if not speech:
+                return {"language": None, "language_probs": [], "timings": timer.stages}
+            samples = speech.compact(samples)
+    with timer.stage("language"):
+        # Nothing is transcribed afterwards, so there's no spectrogram to share
+        probs = detector(samples[:N_SAMPLES])
+    return {
+        "language": pick_language(probs),
+        "language_probs": top_languages(probs, top_k),
+        "timings": timer.stages,
+    }
+
+
+# One request: normalize audio, drop silence, run the model and map timestamps back.
+# Silent clips return without touching the model; speech longer than long_audio_seconds
+# goes to long_model (parallel chunked transcription) when one is given. Unless a
+# language is forced, detector picks it up front so Urdu priority applies to the
+# probabilities and the model skips its own detection. With translate=True the same
+# prepared audio is also run with Whisper's translate task and the English result is
+# added as "translation". That second pass reuses the clip's mel spectrogram, and with
+# an encoder cache the encoder output of every 30 s window that starts where one of
+# the first pass did: the first window always, all of a clip up to 30 s. Windows of
+# longer clips are placed by what each pass decoded, so later ones are encoded again.
+# progress(audio_seconds_done) is called between steps and may raise to abandon the
+# request (see jobs.JobQueue).
+def transcribe_audio(sample_rate, data, model, vad=True, long_model=None,
+                     long_audio_seconds=600, detector=None, translate=False, progress=None,
+                     **options):
+    timer = StageTimer()
+    with timer.stage("preprocess"):
+        samples = prepare_audio(sample_rate, data)
+    audio_seconds = len(samples) / SAMPLE_RATE
+
+    speech = None
+    if vad:
+        with timer.stage("vad"):
+            speech = detect_speech(samples)
+            if speech:
+                samples = speech.compact(samples)
+
+    silent = speech is not None and not speech
+    language_probs = None
+    fallbacks = 0
+    cascade = None
+
+    def run(stage, **task_options):
+        nonlocal fallbacks, cascade
+        with timer.stage(stage):
+            # Copied because cached results are shared between requests
+            result = copy.deepcopy(model.transcribe(samples, **{**options, **task_options}))
+        # Mel/encoder/decoder time of the batch this request was decoded in
+        model_stats = result.pop("model_stats", None)
+        if model_stats:
+            for name, seconds in model_stats["stages"].items():
+                timer.add(name, seconds)
+            fallbacks += model_stats["counts"].get("fallbacks", 0)
+        # Escalation and cost of a cascade model (see cascade.CascadeModel), over both tasks
+        summary = result.pop("cascade", None)
+        if summary:
+            cascade = {name: (cascade or {}).get(name, 0) + value for name, value in summary.items()}
+        if speech is not None:
+            speech.remap(result)
+        return result
+
+    if silent:
+        result = {"text": "", "segments": [], "language": None}
+    else:
+        if detector is not None and options.get("language") is None:
+            with timer.stage("language"):
+                probs = detector(samples)
+            options["language"] = pick_language(probs)
+            language_probs = top_languages(probs)
+        if long_model is not None and len(samples) > long_audio_seconds * SAMPLE_RATE:
+            model = long_model
+        if progress is not None:
+            progress(0.0)
+        result = run("model")
+
+    if translate:
+        if progress is not None:
+            progress(audio_seconds / 2)
+        if silent or result["language"] == "en":
+            translation = {"text": result["text"], "segments": copy.deepcopy(result["segments"])}
+        else:
+            translated = run("translate", task="translate", language=result["language"])
+            translation = {"text": translated["text"], "segments": translated["segments"]}
+        result["translation"] = translation
+
+    if language_probs is not None:
+        result["language_probs"] = language_probs
+    if cascade is not None:
+        result["cascade"] = cascade
+    result["audio_seconds"] = audio_seconds
+    result["speech_seconds"] = 0.0 if silent else len(samples) / SAMPLE_RATE
+    result["timings"] = timer.stages
+    result["decoding"] = {
+        "tokens": sum(len(segment.get("tokens", ())) for segment in result["segments"]),
+        "fallbacks": fallbacks,
+    }
+    if progress is not None:
+        progress(audio_seconds)
+    return result
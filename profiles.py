@@ -0,0 +1,51 @@
+# Named decoding strategies trading accuracy for latency, chosen per request. options
+# go to model.transcribe (and the batched decode of short clips); fast_weights runs
+# the model in fp16 on GPU or int8 on CPU; cost scales the job queue's estimate.
+LATENCY_PROFILES = {
+    # One greedy pass per window: no temperature fallback, no conditioning on the
+    # previous window's text, so latency tracks audio length
+    "realtime": {
+        "options": {"temperature": 0.0, "condition_on_previous_text": False},
+        "fast_weights": True,
+        "cost": 0.5,
+    },
+    # Whisper's default decoding, as every request got before profiles existed:
+    # greedy, with the full fallback ladder for windows that come out repetitive or
+    # unlikely
+    "balanced": {
+        "options": {
+            "temperature": (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+            "condition_on_previous_text": True,
+        },
+        "fast_weights": False,
+        "cost": 1.0,
+    },
+    # Whisper's reference settings: beam search, the full ladder sampling 5 candidates
+    "accurate": {
+        "options": {
+            "temperature": (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+            "beam_size": 5,
+            "best_of": 5,
+            "condition_on_previous_text": True,
+        },
+        "fast_weights": False,
+        "cost": 3.0,
+    },
+}
+DEFAULT_PROFILE = "balanced"
+
+
+def get_profile(name=None):
+    name = name or DEFAULT_PROFILE
+    if name not in LATENCY_PROFILES:
+        raise ValueError(f"Unknown latency profile '{name}', expected one of {list(LATENCY_PROFILES)}")
+    return LATENCY_PROFILES[name]
+
+
+# Decode options (with fp16 matching the weights) and the precision to load the model
+# in, for a profile served on device by a service running at precision
+def resolve_profile(name, device, precision):
+    profile = get_profile(name)
+    if profile["fast_weights"]:
+        precision = "int8" if device == "cpu" else "fp16"
+    return {**profile["options"], "fp16": precision == "fp16" and device != "cpu"}, precision
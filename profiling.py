@@ -0,0 +1,114 @@
+import cProfile
+import os
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import torch
+
+
+# Opt-in cProfile / torch profiler traces for single requests, either asked for
+# explicitly or sampled at sample_rate. Services without a profiler never touch
+# this module, so there's no cost while it's off.
+class RequestProfiler:
+    def __init__(self, output_dir, sample_rate=0.0, torch_trace=False):
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.torch_trace = torch_trace
+        os.makedirs(output_dir, exist_ok=True)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def sample(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def session(self, model_name, audio_seconds):
+        with self._lock:
+            self._count += 1
+            n = self._count
+        length = "unknown" if audio_seconds is None else f"{audio_seconds:.1f}s"
+        stem = f"{time.strftime('%Y%m%d-%H%M%S')}-{n:04d}-{model_name}-{length}"
+        return ProfileSession(os.path.join(self.output_dir, stem), self.torch_trace)
+
+
+# One profiled request. The request thread (decoding, VAD, ...) and the inference
+# thread each run their own cProfile; save() merges them into one .pstats file and
+# writes the torch profiler's Chrome trace (open in chrome://tracing or Perfetto).
+class ProfileSession:
+    def __init__(self, path_stem, torch_trace=False):
+        self.path_stem = path_stem
+        self.torch_trace = torch_trace
+        self.paths = []
+        self._profiles = []
+        self._torch = None
+
+    @contextmanager
+    def _cprofile(self):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active cProfile per process; skip rather than fail
+            yield
+            return
+        self._profiles.append(profile)
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    # Around the whole request, on the calling thread. Saved whether or not the request
+    # succeeds, since a failing request is often the one worth looking at.
+    @contextmanager
+    def request(self):
+        try:
+            with self._cprofile():
+                yield
+        finally:
+            self.save()
+
+    # Around the model pass, on whichever thread runs inference
+    @contextmanager
+    def model(self):
+        if not self.torch_trace:
+            with self._cprofile():
+                yield
+            return
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        with torch.profiler.profile(activities=activities) as prof:
+            with self._cprofile():
+                yield
+        self._torch = prof
+
+    # cProfile stats from the model pass in an inference worker process
+    def add_stats(self, stats):
+        self._profiles.append(_RemoteStats(stats))
+
+    def save(self):
+        stats = None
+        for profile in self._profiles:
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        if stats is not None:
+            stats.dump_stats(f"{self.path_stem}.pstats")
+            self.paths.append(f"{self.path_stem}.pstats")
+        if self._torch is not None:
+            self._torch.export_chrome_trace(f"{self.path_stem}.trace.json")
+            self.paths.append(f"{self.path_stem}.trace.json")
+        print(f"📈 Profile written: {', '.join(self.paths)}")
+        return self.paths
+
+
+# pstats.Stats takes any object with create_stats() and a .stats dict
+class _RemoteStats:
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
@@ -0,0 +1,159 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+import torch
+import whisper
+from torch import nn
+from whisper.model import ModelDimensions, Whisper
+
+from weights import skip_init
+
+QUANTIZED_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "whisper-int8")
+
+
+# Dynamic int8 quantization of every linear layer (attention projections and MLPs).
+# Whisper's Linear subclass only casts weights to the input dtype, which is a no-op
+# in fp32, and quantize_dynamic matches exact module types, so swap it for nn.Linear.
+def quantize_dynamic_int8(model):
+    model = model.cpu().float()
+    for module in model.modules():
+        if isinstance(module, whisper.model.Linear):
+            module.__class__ = nn.Linear
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+# What cached int8 weights were made from: the checkpoint (whisper's download URL
+# carries its SHA-256) and the libraries whose quantized layout they depend on
+def cache_key(model_name):
+    return {
+        "checkpoint": whisper._MODELS.get(model_name, model_name),
+        "torch": str(torch.__version__),
+        "whisper": whisper.__version__,
+    }
+
+
+# Int8 model with the structure quantize_dynamic_int8 produces, ready for the cached
+# state dict. Linear weights are zeroed rather than left uninitialized, since
+# quantizing garbage memory can fail on NaNs.
+def _quantized_model(dims):
+    with skip_init():
+        model = Whisper(ModelDimensions(**dims))
+    for module in model.modules():
+        if isinstance(module, nn.Linear):
+            module.weight.data.zero_()
+    return quantize_dynamic_int8(model)
+
+
+# Int8 model, quantized once and then loaded from the on-disk cache on later starts.
+# The cache holds tensors only (loaded with weights_only, so a cache file can't run
+# code) and is quantized again when its key doesn't match the current checkpoint and
+# library versions.
+def load_quantized(model_name, cache_dir=None):
+    cache_dir = cache_dir or QUANTIZED_CACHE_DIR
+    path = os.path.join(cache_dir, f"{model_name}-int8.pt")
+    key = cache_key(model_name)
+    if os.path.exists(path):
+        try:
+            saved = torch.load(path, weights_only=True, map_location="cpu")
+        except Exception:
+            # Unreadable, or an older cache format that needs full unpickling
+            saved = None
+        if isinstance(saved, dict) and saved.get("key") == key:
+            model = _quantized_model(saved["dims"])
+            model.load_state_dict(saved["state"])
+            for name, (buffer, sparse) in saved["buffers"].items():
+                owner, _, leaf = name.rpartition(".")
+                module = model.get_submodule(owner) if owner else model
+                module.register_buffer(leaf, buffer.to_sparse() if sparse else buffer, persistent=False)
+            return model
+        print(f"Quantizing '{model_name}' again: cached int8 weights are from another checkpoint or version")
+
+    model = quantize_dynamic_int8(whisper.load_model(model_name, device="cpu"))
+    state = model.state_dict()
+    # Non-persistent buffers the constructor doesn't rebuild as loaded (alignment heads)
+    buffers = {
+        name: (buffer.to_dense(), buffer.is_sparse)
+        for name, buffer in model.named_buffers() if name not in state
+    }
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    torch.save({"key": key, "dims": vars(model.dims), "state": state, "buffers": buffers}, tmp)
+    os.replace(tmp, path)
+    return model
+
+
+# Load one precision, transcribe the test set and report; run in a fresh process so
+# peak RSS belongs to that precision alone
+def _measure(model_name, precision, test_set, language):
+    from audio import SAMPLE_RATE, load_file
+    from evaluation import peak_rss_mb, word_error_rate
+
+    start = time.perf_counter()
+    if precision == "int8":
+        model = load_quantized(model_name)
+    else:
+        model = whisper.load_model(model_name, device="cpu")
+    load_seconds = time.perf_counter() - start
+
+    latencies, errors, audio_seconds = [], [], 0.0
+    for path, reference in test_set:
+        samples = load_file(path)
+        audio_seconds += len(samples) / SAMPLE_RATE
+        start = time.perf_counter()
+        result = model.transcribe(samples, language=language, fp16=False)
+        latencies.append(time.perf_counter() - start)
+        errors.append(word_error_rate(reference, result["text"]))
+
+    return {
+        "precision": precision,
+        "load_seconds": load_seconds,
+        "mean_latency_seconds": sum(latencies) / len(latencies),
+        "real_time_factor": sum(latencies) / audio_seconds,
+        "peak_rss_mb": peak_rss_mb(),
+        "wer": sum(errors) / len(errors),
+    }
+
+
+# fp32 vs int8 on a local test set: latency, peak RSS and word error rate
+if __name__ == "__main__":
+    from evaluation import load_test_set
+
+    parser = argparse.ArgumentParser(description="Compare int8 dynamic quantization against fp32")
+    parser.add_argument("test_set", help="directory of audio files with matching .txt transcripts")
+    parser.add_argument("--model", default="small")
+    parser.add_argument("--language", default=None)
+    parser.add_argument("--json", help="also write the report here")
+    args = parser.parse_args()
+
+    test_set = load_test_set(args.test_set)
+    if not test_set:
+        parser.error(f"no audio files with .txt transcripts in {args.test_set}")
+
+    # Quantize (and cache) up front so the int8 run measures a normal cached start
+    load_quantized(args.model)
+
+    context = multiprocessing.get_context("spawn")
+    reports = []
+    for precision in ("fp32", "int8"):
+        with context.Pool(1) as pool:
+            reports.append(pool.apply(_measure, (args.model, precision, test_set, args.language)))
+
+    print(f"{args.model} on {len(test_set)} files")
+    print(f"{'precision':>9} {'load_s':>7} {'latency_s':>9} {'rtf':>6} {'peak_rss_mb':>11} {'wer':>6}")
+    for r in reports:
+        print(
+            f"{r['precision']:>9} {r['load_seconds']:>7.1f} {r['mean_latency_seconds']:>9.2f} "
+            f"{r['real_time_factor']:>6.3f} {r['peak_rss_mb']:>11.0f} {r['wer']:>6.1%}"
+        )
+    fp32, int8 = reports
+    print(
+        f"int8: {fp32['mean_latency_seconds'] / int8['mean_latency_seconds']:.2f}x faster, "
+        f"{fp32['peak_rss_mb'] - int8['peak_rss_mb']:.0f} MB less peak RSS, "
+        f"WER {int8['wer'] - fp32['wer']:+.1%}"
+    )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "files": len(test_set), "reports": reports}, f, indent=2)
@@ -0,0 +1,343 @@
+import os
+from contextlib import nullcontext
+
+import numpy as np
+import whisper
+
+from audio import SAMPLE_RATE, file_duration, iter_file_blocks
+from batching import BatchScheduler
+from cache import EncoderCache, TranscriptionCache
+from cascade import CASCADE_LOGPROB, CascadeDetector, CascadeModel, CascadeStats
+from chunking import ChunkedTranscriber, transcribe_blocks
+from frontend import FRONTEND
+from jobs import JobQueue, estimate_cost
+from metrics import ERRORS, REGISTRY, REQUESTS, record_result
+from models import ModelRegistry, default_device, model_size_rank
+from pipeline import StageStats, identify_language, transcribe_audio
+from profiles import DEFAULT_PROFILE, get_profile, resolve_profile
+from profiling import RequestProfiler
+from speculative import DRAFT_TOKENS
+from streaming import StreamingStats, StreamingTranscriber
+from workers import InferencePool
+
+
+# Everything behind the UI and the HTTP API: model registry, batching scheduler,
+# transcript cache, optional chunked long-audio pool and the stats they report.
+#
+# With lazy=True the default model loads and warms up in the background. Other sizes
+# load on first use and are evicted LRU once model_budget_mb is exceeded. Concurrent
+# requests are gathered for up to batch_wait_ms into batches of max_batch_size.
+# Repeated audio is answered from a cache of cache_size entries, persisted under
+# cache_dir if set. With chunk_workers > 0, speech longer than long_audio_seconds
+# is split across worker processes. With profile_dir set, requests asking for it (and a
+# profile_sample_rate fraction of the rest) are profiled there, bypassing the cache.
+# Encoder outputs of recent 30 s windows are kept up to encoder_cache_mb, so re-running
+# a clip with another language or task only runs the decoder. With inference_workers > 0
+# batches run in that many worker processes (see workers.InferencePool) instead of
+# this one, each with threads_per_worker torch threads and its own encoder cache.
+# mmap_weights memory-maps converted weights so all processes share one copy.
+# With a draft_model (tiny/base) greedy decodes of every other model are speculative:
+# the draft proposes draft_tokens tokens per pass and the model verifies them.
+# With a cascade_model, every larger model only re-transcribes the segments the
+# cascade model was unsure of (average log-probability below cascade_logprob, ...),
+# and the cascade model detects the language.
+# Each request runs under a latency profile (see profiles.py), latency_profile unless
+# it names another; the realtime one loads fp16/int8 weights next to the others.
+# submit()/submit_file() queue work on job_workers threads (default max_batch_size),
+# cheapest first with job_max_wait_seconds as the starvation limit.
+class TranscriptionService:
+    def __init__(self, model_name="large", lazy=True, model_budget_mb=None, precision="fp32",
+                 max_batch_size=8, batch_wait_ms=20, cache_size=256, cache_dir=None, vad=True,
+                 chunk_workers=0, long_audio_seconds=600, profile_dir=None,
+                 profile_sample_rate=0.0, profile_torch=False, encoder_cache_mb=256,
+                 inference_workers=0, threads_per_worker=None, worker_affinity=False,
+                 worker_timeout=600, mmap_weights=False, job_workers=None, job_max_wait_seconds=60,
+                 draft_model=None, draft_tokens=DRAFT_TOKENS, cascade_model=None,
+                 cascade_logprob=CASCADE_LOGPROB, latency_profile=DEFAULT_PROFILE):
+        get_profile(latency_profile)
+        self.model_name = model_name
+        self.precision = precision
+        self.latency_profile = latency_profile
+        self.cascade_model = cascade_model
+        self.cascade_logprob = cascade_logprob
+        self.max_batch_size = max_batch_size
+        self.vad = vad
+        self.long_audio_seconds = long_audio_seconds
+
+        self.pool = None
+        self.encoder_cache = None
+        if inference_workers:
+            self.pool = InferencePool(
+                inference_workers, threads_per_worker, worker_affinity, preload=(model_name,),
+                precision=precision, job_timeout=worker_timeout, encoder_cache_mb=encoder_cache_mb,
+                mmap_weights=mmap_weights, draft_model=draft_model, draft_tokens=draft_tokens,
+            )
+            self.registry = self.pool
+            self.registry.loader(model_name)
+            if not lazy:
+                self.pool.wait_ready()
+        else:
+            self.registry = ModelRegistry(
+                budget_mb=model_budget_mb, precision=precision, mmap_weights=mmap_weights,
+                draft_model=draft_model, draft_tokens=draft_tokens,
+            )
+            self.registry.loader(model_name)
+            if not lazy:
+                self.registry.get(model_name)
+            self.encoder_cache = EncoderCache(encoder_cache_mb) if encoder_cache_mb else None
+        self.scheduler = BatchScheduler(
+            self.registry, max_batch_size=max_batch_size, max_wait_ms=batch_wait_ms,
+            encoder_cache=self.encoder_cache, pool=self.pool,
+        )
+        self.cache = TranscriptionCache(max_entries=cache_size, disk_dir=cache_dir)
+        self.chunked = None
+        if chunk_workers:
+            self.chunked = ChunkedTranscriber(
+                chunk_workers, precision=precision, mmap_weights=mmap_weights,
+                draft_model=draft_model, draft_tokens=draft_tokens,
+            )
+        self.jobs = JobQueue(job_workers or max_batch_size, job_max_wait_seconds)
+        self.stage_stats = StageStats()
+        self.streaming_stats = StreamingStats()
+        self.cascade_stats = CascadeStats()
+        self.profiler = None
+        if profile_dir:
+            self.profiler = RequestProfiler(profile_dir, profile_sample_rate, profile_torch)
+        REGISTRY.register_collector(self._collect_metrics)
+
+    # Full transcription of one clip; language=None detects it (with Urdu priority).
+    # profile=True writes a profile of this request (needs profile_dir); translate=True
+    # adds an English "translation" from a second pass over the same preprocessed audio
+    # (see pipeline.transcribe_audio).
+    # latency_profile names the decoding strategy (None: the service default).
+    def transcribe(self, sample_rate, data, model_name=None, language=None, profile=False,
+                   translate=False, progress=None, latency_profile=None):
+        def run(model, long_model, detector, **options):
+            return transcribe_audio(
+                sample_rate, data, model,
+                vad=self.vad,
+                long_model=long_model,
+                long_audio_seconds=self.long_audio_seconds,
+                detector=detector,
+                translate=translate,
+                progress=progress,
+                language=language,
+                **options,
+            )
+
+        return self._transcribe(run, model_name, profile, len(data) / sample_rate, latency_profile)
+
+    # Same for an audio file on disk, decoded and transcribed window by window so
+    # memory per request stays bounded however long the file is. With chunk workers,
+    # windows of files longer than long_audio_seconds run on the pool in parallel.
+    def transcribe_file(self, path, model_name=None, language=None, profile=False,
+                        translate=False, progress=None, latency_profile=None):
+        def run(model, long_model, detector, **options):
+            duration = file_duration(path)
+            parallel = 1
+            if long_model is not None and (duration or 0) > self.long_audio_seconds:
+                model, parallel = long_model, self.chunked.workers
+            return transcribe_blocks(
+                iter_file_blocks(path), model,
+                vad=self.vad,
+                detector=detector,
+                parallel=parallel,
+                progress=progress,
+                translate=translate,
+                language=language,
+                **options,
+            )
+
+        return self._transcribe(run, model_name, profile, file_duration(path), latency_profile)
+
+    # Same as transcribe(), queued as a jobs.Job: short jobs go first, job.fraction
+    # tracks progress and service.jobs.cancel(job) stops it
+    def submit(self, sample_rate, data, model_name=None, language=None, profile=False,
+               translate=False, latency_profile=None):
+        audio_seconds = len(data) / sample_rate
+        return self.jobs.submit(
+            lambda progress: self.transcribe(
+                sample_rate, data, model_name, language, profile, translate, progress, latency_profile
+            ),
+            audio_seconds,
+            self._cost(audio_seconds, model_name, translate, latency_profile),
+        )
+
+    def submit_file(self, path, model_name=None, language=None, profile=False, translate=False,
+                    latency_profile=None):
+        audio_seconds = file_duration(path)
+        if audio_seconds is None:
+            # Formats without a readable header: guess from the size at 128 kbit/s
+            audio_seconds = os.path.getsize(path) / 16000
+        return self.jobs.submit(
+            lambda progress: self.transcribe_file(
+                path, model_name, language, profile, translate, progress, latency_profile
+            ),
+            audio_seconds,
+            self._cost(audio_seconds, model_name, translate, latency_profile),
+        )
+
+    # Also rejects an unknown latency profile before the job is queued
+    def _cost(self, audio_seconds, model_name, translate, latency_profile):
+        scale = get_profile(latency_profile or self.latency_profile)["cost"]
+        return scale * estimate_cost(audio_seconds, model_name or self.model_name, translate)
+
+    def _transcribe(self, run, model_name, profile, audio_seconds, latency_profile=None):
+        model_name = model_name or self.model_name
+        latency_profile = latency_profile or self.latency_profile
+        options, precision = resolve_profile(latency_profile, default_device(), self.precision)
+        REQUESTS.inc(endpoint="transcribe")
+        if model_name not in whisper.available_models():
+            # Checked up front: a cascade would otherwise run its fast model first
+            ERRORS.inc(endpoint="transcribe")
+            raise ValueError(f"Unknown model '{model_name}'")
+        session = None
+        if self.profiler is not None and (profile or self.profiler.sample()):
+            session = self.profiler.session(model_name, audio_seconds)
+        elif profile:
+            ERRORS.inc(endpoint="transcribe")
+            raise ValueError("profiling is off; start the service with a profile directory")
+
+        def models(name):
+            if session is not None:
+                # Profiled requests always run the model, on the scheduler (or one pool worker)
+                return self.scheduler.model(name, profile=session, precision=precision), None
+            long_model = None
+            if self.chunked:
+                long_model = self.cache.wrap(self.chunked.model(name, precision), name, precision)
+            return self.cache.wrap(self.scheduler.model(name, precision=precision), name, precision), long_model
+
+        model, long_model = models(model_name)
+        detector = self.scheduler.model(model_name, profile=session, precision=precision).detect_language
+        # Only worth it for models larger than the cascade model
+        cascade = (
+            self.cascade_model is not None
+            and model_size_rank(model_name) > model_size_rank(self.cascade_model)
+        )
+        if cascade:
+            detector = CascadeDetector(
+                self.scheduler.model(self.cascade_model, profile=session, precision=precision).detect_language,
+                self.cascade_model, model_name,
+            )
+            fast, fast_long = models(self.cascade_model)
+            model = CascadeModel(fast, model, self.cascade_model, model_name, self.cascade_logprob)
+            if long_model is not None:
+                long_model = CascadeModel(
+                    fast_long, long_model, self.cascade_model, model_name, self.cascade_logprob
+                )
+        try:
+            with session.request() if session else nullcontext():
+                result = run(model, long_model, detector, **options)
+        except Exception:
+            ERRORS.inc(endpoint="transcribe")
+            raise
+        result["model"] = model_name
+        result["latency_profile"] = latency_profile
+        if cascade:
+            # Silent audio never reaches the models and escalates nothing
+            summary = detector.add_cost(result.get("cascade", {}))
+            self.cascade_stats.record(summary)
+            result["cascade"] = {"fast_model": self.cascade_model, **summary}
+        if session is not None:
+            result["profile"] = session.paths
+        self.stage_stats.record(result)
+        record_result(result, model_name)
+        self.registry.mark_served(model_name, precision=precision)
+        return result
+
+    def detect_language(self, sample_rate, data, model_name=None):
+        model_name = model_name or self.model_name
+        REQUESTS.inc(endpoint="detect_language")
+        detector = self.scheduler.model(model_name).detect_language
+        try:
+            return identify_language(sample_rate, data, detector, vad=self.vad)
+        except Exception:
+            ERRORS.inc(endpoint="detect_language")
+            raise
+
+    # Language of an audio file from its first block only
+    def detect_language_file(self, path, model_name=None):
+        blocks = iter_file_blocks(path)
+        try:
+            block = next(blocks, np.zeros(0, np.float32))
+        finally:
+            blocks.close()
+        return self.detect_language(SAMPLE_RATE, block, model_name)
+
+    # New live-microphone session
+    def stream(self, model_name=None, language=None):
+        return StreamingTranscriber(
+            self.scheduler.model(model_name or self.model_name),
+            fp16=self.registry.fp16,
+            language=language,
+        )
+
+    def finish_stream(self, stream):
+        text = stream.finish()
+        self.streaming_stats.record(stream)
+        return text
+
+    # Cache, batching and model-memory figures for /metrics
+    def _collect_metrics(self):
+        cache = self.cache.stats()
+        batching = self.scheduler.stats()
+        yield ("stt_cache_lookups_total", "Transcript cache lookups by outcome", "counter", [
+            ({"result": name}, cache[name])
+            for name in ("hits", "disk_hits", "shared_in_flight", "misses")
+        ])
+        yield ("stt_batches_total", "Batched model passes", "counter", [({}, batching["batches"])])
+        yield ("stt_batched_requests_total", "Requests run through the batch scheduler",
+               "counter", [({}, batching["requests"])])
+        jobs = self.jobs.stats()
+        yield ("stt_jobs", "Transcription jobs waiting or running", "gauge", [
+            ({"state": name}, jobs[name]) for name in ("queued", "running")
+        ])
+        yield ("stt_jobs_finished_total", "Transcription jobs by outcome", "counter", [
+            ({"outcome": name}, jobs[name]) for name in ("completed", "failed", "cancelled")
+        ])
+        health = self.registry.health()
+        models = health["models"]
+        # One series per worker process when an inference pool is running
+        labels = [
+            {"model": m["model"], "precision": m["precision"],
+             **({"worker": m["worker"]} if "worker" in m else {})}
+            for m in models
+        ]
+        yield ("stt_model_resident_megabytes", "Parameter memory of loaded models", "gauge", [
+            (l, m["resident_mb"]) for l, m in zip(labels, models) if m["ready"]
+        ])
+        yield ("stt_model_ready", "Whether a model is loaded and warmed up", "gauge", [
+            (l, int(m["ready"])) for l, m in zip(labels, models)
+        ])
+        if self.cascade_model is not None:
+            cascade = self.cascade_stats.summary()
+            yield ("stt_cascade_requests_total", "Requests transcribed in cascade mode", "counter",
+                   [({}, cascade["requests"])])
+            yield ("stt_cascade_audio_seconds_total",
+                   "Audio through the cascade, by whether it was escalated to the larger model",
+                   "counter", [
+                       ({"outcome": "kept"}, cascade["audio_seconds"] - cascade["escalated_seconds"]),
+                       ({"outcome": "escalated"}, cascade["escalated_seconds"]),
+                   ])
+            yield ("stt_cascade_escalated_ratio", "Fraction of cascade audio escalated to the larger model",
+                   "gauge", [({}, cascade["escalated_fraction"])])
+            yield ("stt_cascade_cost_total", "Cascade model cost in tiny-model audio seconds", "counter",
+                   [({}, cascade["cost"])])
+            yield ("stt_cascade_request_cost", "Mean cascade cost per request in tiny-model audio seconds",
+                   "gauge", [({}, cascade["mean_cost"])])
+        if self.pool is not None:
+            yield ("stt_worker_restarts_total", "Inference workers restarted after a crash or hang",
+                   "counter", [({"worker": w["worker"]}, w["restarts"]) for w in health["workers"]])
+
+    def health(self):
+        return {
+            **self.registry.health(),
+            "batching": self.scheduler.stats(),
+            "jobs": self.jobs.stats(),
+            "cache": self.cache.stats(),
+            "mel_cache": FRONTEND.stats(),
+            "encoder_cache": self.encoder_cache.stats() if self.encoder_cache else None,
+            "streaming": self.streaming_stats.summary(),
+            "cascade": self.cascade_stats.summary() if self.cascade_model else None,
+            "stages": self.stage_stats.summary(),
+        }
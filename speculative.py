@@ -0,0 +1,386 @@
+import argparse
+import dataclasses
+import json
+import time
+from contextlib import nullcontext
+from functools import lru_cache
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+import whisper
+from whisper.audio import mel_filters
+from whisper.decoding import DecodingOptions, DecodingResult, DecodingTask
+from whisper.tokenizer import get_tokenizer
+from whisper.utils import compression_ratio
+
+from frontend import log_compress
+from metrics import count, stage
+
+# Tokens the draft model proposes per pass of the verifying model's decoder
+DRAFT_TOKENS = 4
+
+
+# Maps one mel filterbank onto another through a least-squares estimate of the power
+# spectrum, so an 80-bin draft can follow a 128-bin model such as large-v3
+@lru_cache(maxsize=None)
+def _mel_projection(n_from, n_to, device):
+    return mel_filters(device, n_to) @ torch.linalg.pinv(mel_filters(device, n_from))
+
+
+# The draft model's log-mel for a window, from the verifying model's. Only the
+# draft's proposals depend on it, never the output, so an approximation is enough.
+def convert_mel(mel, n_mels):
+    if mel.shape[-2] == n_mels:
+        return mel
+    power = 10 ** (mel.float() * 4 - 4)
+    return log_compress(_mel_projection(mel.shape[-2], n_mels, mel.device) @ power)
+
+
+# Draft-to-model and model-to-draft token ids. Text tokens are the same in every
+# multilingual model; special tokens (languages, tasks, timestamps) are matched by
+# name, since large-v3's extra language shifts them. A draft token the model lacks
+# maps to -1 (never accepted); a model token the draft lacks maps to the draft's EOT.
+@lru_cache(maxsize=None)
+def _token_maps(multilingual, draft_languages, model_languages):
+    draft = get_tokenizer(multilingual, num_languages=draft_languages)
+    model = get_tokenizer(multilingual, num_languages=model_languages)
+
+    def mapping(source, target, missing):
+        ids = list(range(source.eot)) + [missing] * (source.encoding.n_vocab - source.eot)
+        for name, token in source.special_tokens.items():
+            ids[token] = target.special_tokens.get(name, missing)
+        return ids
+
+    return mapping(draft, model, -1), mapping(model, draft, draft.eot)
+
+
+def _map_tokens(tokens, mapping):
+    if tokens is None or isinstance(tokens, str):
+        return tokens
+    return [mapping[token] for token in tokens]
+
+
+def _attention(attn, q, k, v, offset=None):
+    q = q.view(*q.shape[:2], attn.n_head, -1).permute(0, 2, 1, 3)
+    k = k.view(*k.shape[:2], attn.n_head, -1).permute(0, 2, 1, 3)
+    v = v.view(*v.shape[:2], attn.n_head, -1).permute(0, 2, 1, 3)
+    n_ctx = q.shape[2]
+    mask = None
+    if offset and n_ctx > 1:
+        # Causal mask shifted past the cached positions
+        mask = torch.ones(n_ctx, offset + n_ctx, dtype=torch.bool, device=q.device).tril(offset)
+    causal = offset == 0 and n_ctx > 1
+    out = F.scaled_dot_product_attention(q, k, v, attn_mask=mask, is_causal=causal)
+    return out.permute(0, 2, 1, 3).flatten(start_dim=2)
+
+
+# Whisper's text decoder over one sequence with its own key/value cache. Unlike the
+# model's kv-cache hooks it takes several new tokens at once, with the causal mask
+# offset past the cached ones, and can drop rejected tokens from the cache again.
+class _IncrementalDecoder:
+    def __init__(self, model, audio_features):
+        self.decoder = model.decoder
+        self.audio_features = audio_features
+        n_layer = len(self.decoder.blocks)
+        self.keys = [None] * n_layer
+        self.values = [None] * n_layer
+        self.cross = [None] * n_layer
+        self.length = 0
+
+    # (len(tokens), n_vocab) logits for the position after each token
+    def forward(self, tokens):
+        decoder = self.decoder
+        offset = self.length
+        x = decoder.token_embedding(torch.tensor([tokens], device=self.audio_features.device))
+        x = (x + decoder.positional_embedding[offset:offset + len(tokens)]).to(self.audio_features.dtype)
+        for i, block in enumerate(decoder.blocks):
+            h = block.attn_ln(x)
+            k, v = block.attn.key(h), block.attn.value(h)
+            if offset:
+                k = torch.cat([self.keys[i], k], dim=1)
+                v = torch.cat([self.values[i], v], dim=1)
+            self.keys[i], self.values[i] = k, v
+            x = x + block.attn.out(_attention(block.attn, block.attn.query(h), k, v, offset))
+            if block.cross_attn:
+                if self.cross[i] is None:
+                    features = self.audio_features
+                    self.cross[i] = (block.cross_attn.key(features), block.cross_attn.value(features))
+                h = block.cross_attn_ln(x)
+                x = x + block.cross_attn.out(_attention(block.cross_attn, block.cross_attn.query(h), *self.cross[i]))
+            x = x + block.mlp(block.mlp_ln(x))
+        x = decoder.ln(x)
+        self.length += len(tokens)
+        return (x @ torch.transpose(decoder.token_embedding.weight.to(x.dtype), 0, 1)).float()[0]
+
+    def truncate(self, length):
+        if length >= self.length:
+            return
+        self.keys = [k[:, :length] for k in self.keys]
+        self.values = [v[:, :length] for v in self.values]
+        self.length = length
+
+
+# Greedy decoding where a small draft model (tiny/base) proposes up to draft_tokens
+# tokens and the model checks them all in one decoder pass, keeping the proposals it
+# agrees with plus its own next token. Every kept token is the model's own argmax
+# under the same logit filters, so the output is the model's plain greedy decode;
+# the draft only decides how many tokens each pass of the big decoder yields.
+#
+# Installed as the model's decode() (see enable_speculative). Decodes at temperature
+# 0 from a mel go through the draft; sampling at fallback temperatures, beam search,
+# unknown language and cached encoder features go to the regular decode. draft is a
+# callable returning the draft model, so a registry can evict and reload it.
+class SpeculativeDecoder:
+    def __init__(self, model, draft, draft_tokens=DRAFT_TOKENS):
+        self.model = model
+        self.draft = draft
+        self.draft_tokens = draft_tokens
+        self._decode = model.decode
+        self.decodes = 0
+        self.passes = 0
+        self.tokens = 0
+        self.proposed = 0
+        self.accepted = 0
+
+    def __call__(self, mel, options=DecodingOptions(), **kwargs):
+        if kwargs:
+            options = dataclasses.replace(options, **kwargs)
+        dims = self.model.dims
+        if (
+            options.temperature > 0
+            or options.beam_size is not None
+            or options.language is None
+            or mel.shape[-2:] == (dims.n_audio_ctx, dims.n_audio_state)
+        ):
+            return self._decode(mel, options)
+
+        draft = self.draft()
+        try:
+            draft_options = dataclasses.replace(options, fp16=options.fp16 and draft.device.type != "cpu")
+            tasks = self._tasks(draft, options, draft_options)
+        except ValueError:
+            # The draft can't write this language (or has another vocabulary)
+            return self._decode(mel, options)
+        single = mel.ndim == 2
+        # The draft is a model of its own, maybe decoding on another thread right now
+        with getattr(draft, "inference_lock", None) or nullcontext():
+            results = self._decode_speculative(draft, tasks, mel[None] if single else mel, options)
+        return results[0] if single else results
+
+    def _tasks(self, draft, options, draft_options):
+        if draft.is_multilingual != self.model.is_multilingual:
+            raise ValueError("draft and model have different vocabularies")
+        to_model, to_draft = _token_maps(self.model.is_multilingual, draft.num_languages, self.model.num_languages)
+        draft_options = dataclasses.replace(
+            draft_options,
+            prompt=_map_tokens(options.prompt, to_draft),
+            prefix=_map_tokens(options.prefix, to_draft),
+        )
+        return DecodingTask(self.model, options), DecodingTask(draft, draft_options), to_model, to_draft
+
+    @torch.no_grad()
+    def _decode_speculative(self, draft, tasks, mel, options):
+        task = tasks[0]
+        features = self.model.encoder(mel.to(self.model.encoder.conv1.weight.dtype))
+        draft_mel = convert_mel(mel, draft.dims.n_mels).to(draft.device, draft.encoder.conv1.weight.dtype)
+        draft_features = draft.encoder(draft_mel)
+
+        results = []
+        for i in range(len(features)):
+            tokens, sum_logprob, no_speech_prob = self._generate(
+                _IncrementalDecoder(self.model, features[i:i + 1]),
+                _IncrementalDecoder(draft, draft_features[i:i + 1]),
+                *tasks,
+            )
+            text = task.tokenizer.decode(tokens).strip()
+            results.append(DecodingResult(
+                audio_features=features[i],
+                language=options.language,
+                tokens=tokens,
+                text=text,
+                avg_logprob=float(sum_logprob / np.float32(len(tokens) + 1)),
+                no_speech_prob=no_speech_prob,
+                temperature=options.temperature,
+                compression_ratio=compression_ratio(text),
+            ))
+        self.decodes += len(results)
+        return results
+
+    # Sampled tokens (without EOT), their summed log-probability and the no-speech
+    # probability, exactly as DecodingTask computes them for greedy decoding
+    def _generate(self, decoder, draft_decoder, task, draft_task, to_model, to_draft):
+        tokenizer = task.tokenizer
+        eot = tokenizer.eot
+        sequence = list(task.initial_tokens)
+        draft_sequence = list(draft_task.initial_tokens)
+        sum_logprob = np.float32(0.0)
+        no_speech_prob = np.nan
+        generated = 0
+
+        # Both caches hold every token but the last, which the next pass feeds
+        if len(sequence) > 1:
+            with stage("decoder"):
+                logits = decoder.forward(sequence[:-1])
+            with stage("draft"):
+                draft_decoder.forward(draft_sequence[:-1])
+            if task.sot_index < len(sequence) - 1 and tokenizer.no_speech is not None:
+                no_speech_prob = logits[task.sot_index].softmax(dim=-1)[tokenizer.no_speech].item()
+
+        while True:
+            # The draft's guesses, capped so the pass stays within the text context
+            draft_ids = []
+            limit = min(self.draft_tokens, task.sample_len - generated - 1, task.n_ctx - len(sequence))
+            with stage("draft"):
+                inputs = draft_sequence[draft_decoder.length:]
+                while len(draft_ids) < limit:
+                    logits = draft_decoder.forward(inputs)[-1:]
+                    prefix = torch.tensor([draft_sequence + draft_ids], device=logits.device)
+                    for logit_filter in draft_task.logit_filters:
+                        logit_filter.apply(logits, prefix)
+                    token = logits.argmax(dim=-1).item()
+                    if to_model[token] < 0:
+                        break
+                    draft_ids.append(token)
+                    if token == draft_task.tokenizer.eot:
+                        break
+                    inputs = [token]
+            proposals = [to_model[token] for token in draft_ids]
+
+            # One pass over the last token and all proposals
+            start = decoder.length
+            with stage("decoder"):
+                logits = decoder.forward(sequence[start:] + proposals)
+            if start == task.sot_index and tokenizer.no_speech is not None:
+                no_speech_prob = logits[0].softmax(dim=-1)[tokenizer.no_speech].item()
+
+            accepted = 0
+            done = False
+            for j in range(len(proposals) + 1):
+                row = logits[j:j + 1]
+                prefix = torch.tensor([sequence], device=row.device)
+                for logit_filter in task.logit_filters:
+                    logit_filter.apply(row, prefix)
+                token = row.argmax(dim=-1).item()
+                sum_logprob += np.float32(F.log_softmax(row, dim=-1)[0, token].item())
+                sequence.append(token)
+                generated += 1
+                matched = j < len(proposals) and token == proposals[j]
+                accepted += matched
+                done = token == eot or generated == task.sample_len or len(sequence) > task.n_ctx
+                if done or not matched:
+                    break
+
+            self.passes += 1
+            self.proposed += len(proposals)
+            self.accepted += accepted
+            count("draft_proposed", len(proposals))
+            count("draft_accepted", accepted)
+            if done:
+                break
+            decoder.truncate(len(sequence) - 1)
+            draft_decoder.truncate(min(draft_decoder.length, len(draft_sequence) + accepted))
+            draft_sequence += [to_draft[token] for token in sequence[len(draft_sequence):]]
+
+        tokens = sequence[task.sample_begin:]
+        if tokens and tokens[-1] == eot:
+            tokens.pop()
+        self.tokens += generated
+        return tokens, sum_logprob, no_speech_prob
+
+    def stats(self):
+        return {
+            "draft_tokens": self.draft_tokens,
+            "decodes": self.decodes,
+            "acceptance_rate": self.accepted / self.proposed if self.proposed else 0.0,
+            "tokens_per_pass": self.tokens / self.passes if self.passes else 0.0,
+        }
+
+
+# Route the model's greedy decodes through a draft model (see SpeculativeDecoder)
+def enable_speculative(model, draft, draft_tokens=DRAFT_TOKENS):
+    model.speculative = SpeculativeDecoder(model, draft, draft_tokens)
+    model.decode = model.speculative
+    return model
+
+
+def _transcribe(model, samples, language):
+    start = time.perf_counter()
+    result = model.transcribe(samples, language=language, temperature=0.0, fp16=False)
+    tokens = [token for segment in result["segments"] for token in segment["tokens"]]
+    return tokens, result["text"], time.perf_counter() - start
+
+
+# Greedy decoding with and without a draft model on a local test set: output
+# equality, decoder tokens per second and end-to-end latency
+if __name__ == "__main__":
+    from audio import SAMPLE_RATE, load_file
+    from evaluation import load_test_set
+
+    parser = argparse.ArgumentParser(description="Compare speculative and plain greedy decoding")
+    parser.add_argument("test_set", help="directory of audio files with matching .txt transcripts")
+    parser.add_argument("--model", default="large")
+    parser.add_argument("--draft", default="base")
+    parser.add_argument("--draft-tokens", type=int, default=DRAFT_TOKENS)
+    parser.add_argument("--language", default=None)
+    parser.add_argument("--json", help="also write the report here")
+    args = parser.parse_args()
+
+    test_set = load_test_set(args.test_set)
+    if not test_set:
+        parser.error(f"no audio files with .txt transcripts in {args.test_set}")
+
+    model = whisper.load_model(args.model, device="cpu")
+    draft = whisper.load_model(args.draft, device="cpu")
+    clips = [(path, load_file(path)) for path, _ in test_set]
+    audio_seconds = sum(len(samples) for _, samples in clips) / SAMPLE_RATE
+    warmup = np.zeros(SAMPLE_RATE, np.float32)
+
+    runs = {}
+    for mode in ("greedy", "speculative"):
+        if mode == "speculative":
+            enable_speculative(model, lambda: draft, args.draft_tokens)
+        _transcribe(model, warmup, "en")
+        runs[mode] = [_transcribe(model, samples, args.language) for _, samples in clips]
+
+    files = []
+    for (path, _), (tokens, text, greedy_s), (spec_tokens, spec_text, spec_s) in zip(
+        clips, runs["greedy"], runs["speculative"]
+    ):
+        files.append({
+            "file": path,
+            "identical": tokens == spec_tokens and text == spec_text,
+            "tokens": len(tokens),
+            "greedy_seconds": greedy_s,
+            "speculative_seconds": spec_s,
+        })
+
+    tokens = sum(f["tokens"] for f in files)
+    report = {"model": args.model, "draft": args.draft, "files": len(files), "audio_seconds": audio_seconds}
+    print(f"{args.model} verifying {args.draft} ({args.draft_tokens} draft tokens) on {len(files)} files")
+    print(f"{'mode':>11} {'latency_s':>9} {'rtf':>6} {'tokens/s':>9}")
+    for mode, key in (("greedy", "greedy_seconds"), ("speculative", "speculative_seconds")):
+        seconds = sum(f[key] for f in files)
+        report[mode] = {
+            "mean_latency_seconds": seconds / len(files),
+            "real_time_factor": seconds / audio_seconds,
+            "tokens_per_second": tokens / seconds,
+        }
+        print(
+            f"{mode:>11} {seconds / len(files):>9.2f} {seconds / audio_seconds:>6.3f} "
+            f"{tokens / seconds:>9.1f}"
+        )
+    stats = model.speculative.stats()
+    identical = sum(f["identical"] for f in files)
+    speedup = report["greedy"]["mean_latency_seconds"] / report["speculative"]["mean_latency_seconds"]
+    print(
+        f"speculative: {speedup:.2f}x faster, {identical}/{len(files)} outputs identical, "
+        f"{stats['acceptance_rate']:.0%} of draft tokens accepted, "
+        f"{stats['tokens_per_pass']:.2f} tokens per decoder pass"
+    )
+    for f in files:
+        if not f["identical"]:
+            print(f"  differs: {f['file']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({**report, "speedup": speedup, "speculative_stats": stats, "per_file": files}, f, indent=2)
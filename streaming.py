@@ -0,0 +1,103 @@
+import threading
+import time
+
+import numpy as np
+
+from audio import SAMPLE_RATE, prepare_audio
+
+# RMS above this counts as speech when timing speech-to-first-words
+SPEECH_RMS = 0.01
+
+
+# Live transcription over a rolling buffer. Each decode covers only the audio after
+# the last committed segment; segments ending stable_seconds before the buffer edge
+# are committed and cut from the buffer, the rest is the unstable tail re-decoded
+# on the next step.
+class StreamingTranscriber:
+    def __init__(self, model, step_seconds=1.0, stable_seconds=1.5, max_buffer_seconds=25.0,
+                 **options):
+        self.model = model
+        self.step_seconds = step_seconds
+        self.stable_seconds = stable_seconds
+        self.max_buffer_seconds = max_buffer_seconds
+        self.options = {**options, "without_timestamps": False}
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.committed = ""
+        self.tail = ""
+        self.language = None
+        self.speech_started_at = None
+        self.first_words_seconds = None
+        self._pending = 0
+
+    @property
+    def text(self):
+        return (self.committed + self.tail).strip()
+
+    def add_chunk(self, sample_rate, data):
+        arrived = time.perf_counter()
+        chunk = prepare_audio(sample_rate, data)
+        if (self.speech_started_at is None and len(chunk)
+                and np.sqrt(np.mean(chunk ** 2)) > SPEECH_RMS):
+            self.speech_started_at = arrived
+
+        self.buffer = np.concatenate([self.buffer, chunk])
+        self._pending += len(chunk)
+        if self._pending >= self.step_seconds * SAMPLE_RATE:
+            self._decode()
+
+        if (self.first_words_seconds is None and self.speech_started_at is not None
+                and self.text):
+            self.first_words_seconds = time.perf_counter() - self.speech_started_at
+        return self.text
+
+    # Decode whatever is left and commit all of it
+    def finish(self):
+        if len(self.buffer):
+            self._decode(final=True)
+        return self.text
+
+    def _decode(self, final=False):
+        self._pending = 0
+        result = self.model.transcribe(self.buffer, **self.options)
+        self.language = result.get("language", self.language)
+        segments = result.get("segments", [])
+        duration = len(self.buffer) / SAMPLE_RATE
+
+        if final:
+            commit = segments
+        elif duration > self.max_buffer_seconds:
+            commit = segments[:-1] or segments
+        else:
+            commit = [s for s in segments[:-1] if s["end"] <= duration - self.stable_seconds]
+
+        if commit:
+            self.committed += "".join(segment["text"] for segment in commit)
+            self.buffer = self.buffer[int(commit[-1]["end"] * SAMPLE_RATE):]
+            segments = segments[len(commit):]
+        elif not segments and duration > self.stable_seconds:
+            # Silence: keep only the recent audio so a word that is just starting survives
+            self.buffer = self.buffer[-int(self.stable_seconds * SAMPLE_RATE):]
+        self.tail = "".join(segment["text"] for segment in segments)
+
+
+# Speech-to-first-words latency across streaming sessions
+class StreamingStats:
+    def __init__(self):
+        self.sessions = 0
+        self.first_words = []
+        self._lock = threading.Lock()
+
+    def record(self, transcriber):
+        with self._lock:
+            self.sessions += 1
+            if transcriber.first_words_seconds is not None:
+                self.first_words.append(transcriber.first_words_seconds)
+
+    def summary(self):
+        with self._lock:
+            latencies = np.array(self.first_words)
+        return {
+            "sessions": self.sessions,
+            "first_words_p50_s": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "first_words_p95_s": float(np.percentile(latencies, 95)) if len(latencies) else None,
+        }
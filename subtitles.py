@@ -0,0 +1,62 @@
+import os
+
+SUBTITLE_FORMATS = ("srt", "vtt")
+
+
+def format_timestamp(seconds, separator=","):
+    milliseconds = int(round(max(seconds, 0.0) * 1000))
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+
+def _cues(segments):
+    for segment in segments:
+        text = segment["text"].strip()
+        if text:
+            yield segment["start"], segment["end"], text.replace("-->", "->")
+
+
+def to_srt(segments):
+    return "\n".join(
+        f"{n}\n{format_timestamp(start)} --> {format_timestamp(end)}\n{text}\n"
+        for n, (start, end, text) in enumerate(_cues(segments), 1)
+    )
+
+
+def to_vtt(segments):
+    cues = "\n".join(
+        f"{format_timestamp(start, '.')} --> {format_timestamp(end, '.')}\n{text}\n"
+        for start, end, text in _cues(segments)
+    )
+    return f"WEBVTT\n\n{cues}"
+
+
+# Plain text or subtitles for one track of a result ("transcript" or "translation")
+def render(result, fmt, track="transcript"):
+    source = result if track == "transcript" else result.get("translation")
+    if source is None:
+        raise ValueError(f"result has no {track}")
+    if fmt == "txt":
+        return source["text"].strip() + "\n"
+    if fmt == "srt":
+        return to_srt(source["segments"])
+    if fmt == "vtt":
+        return to_vtt(source["segments"])
+    raise ValueError(f"unknown format {fmt!r}; use txt, srt or vtt")
+
+
+# transcript.txt/.srt/.vtt (and translation.* when present) written to directory
+def write_outputs(result, directory, stem="transcript"):
+    paths = []
+    tracks = [("transcript", stem)]
+    if result.get("translation") is not None:
+        tracks.append(("translation", f"{stem}.en"))
+    for track, name in tracks:
+        for fmt in ("txt",) + SUBTITLE_FORMATS:
+            path = os.path.join(directory, f"{name}.{fmt}")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(render(result, fmt, track))
+            paths.append(path)
+    return paths
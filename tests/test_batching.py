@@ -0,0 +1,163 @@
+import threading
+
+import numpy as np
+import pytest
+
+import batching
+from batching import BATCH_WINDOW_SAMPLES, BatchScheduler, _Request, split_segments
+
+
+class StubLoader:
+    def __init__(self, done=True):
+        self.done = done
+        self._callbacks = []
+
+    def add_done_callback(self, callback):
+        if self.done:
+            callback()
+        else:
+            self._callbacks.append(callback)
+
+    def finish(self):
+        self.done = True
+        for callback in self._callbacks:
+            callback()
+
+
+# Registry of named stub loaders; get() hands back the model name as the "model"
+class StubRegistry:
+    def __init__(self, **loaders):
+        self.loaders = loaders
+
+    def loader(self, model_name, precision=None):
+        if model_name not in self.loaders:
+            raise ValueError(f"Unknown model '{model_name}'")
+        return self.loaders[model_name]
+
+    def get(self, model_name, precision=None):
+        self.loader(model_name)
+        return model_name
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    ran = []
+
+    def run_batch(model, kind, batch, options, encoder_cache=None):
+        if options.get("fail"):
+            raise RuntimeError("decode failed")
+        ran.append((model, kind, len(batch)))
+        return [{"text": f"{model} {len(samples)}", "segments": []} for samples in batch]
+
+    monkeypatch.setattr(batching, "run_batch", run_batch)
+    return ran
+
+
+def clip(seconds=1.0):
+    return np.zeros(int(seconds * 16000), np.float32)
+
+
+def submit_all(scheduler, requests):
+    # Queued together so they land in one batching window
+    return [scheduler.submit(samples, model, **options) for samples, model, options in requests]
+
+
+def test_requests_with_the_same_key_share_a_batch(batches):
+    scheduler = BatchScheduler(StubRegistry(tiny=StubLoader()), max_wait_ms=200)
+    futures = submit_all(scheduler, [
+        (clip(), "tiny", {"language": "en"}),
+        (clip(2), "tiny", {"language": "en"}),
+        (clip(), "tiny", {"language": "de"}),
+    ])
+    results = [future.result(timeout=5) for future in futures]
+
+    assert [r["text"] for r in results] == ["tiny 16000", "tiny 32000", "tiny 16000"]
+    assert sorted(batches) == [("tiny", "transcribe", 1), ("tiny", "transcribe", 2)]
+    assert scheduler.stats()["requests"] == 3
+
+
+class StubTokenizer:
+    timestamp_begin = 1000
+
+
+def test_split_segments_pairs_timestamps_around_text():
+    # <|0.00|> 1 2 <|1.00|> <|1.20|> 3 <|2.50|> 4 (cut off by the end of the window)
+    tokens = [1000, 1, 2, 1050, 1060, 3, 1125, 4]
+    assert split_segments(StubTokenizer(), tokens, duration=3.0) == [
+        (0.0, 1.0, [1, 2]),
+        (1.2, 2.5, [3]),
+        (2.5, 3.0, [4]),
+    ]
+
+
+def test_split_segments_clamps_to_the_clip_and_keeps_untimed_text():
+    assert split_segments(StubTokenizer(), [1000, 1, 1500], duration=4.0) == [(0.0, 4.0, [1])]
+    assert split_segments(StubTokenizer(), [1, 2], duration=4.0) == [(0.0, 4.0, [1, 2])]
+
+
+def test_long_clips_run_alone_but_language_detection_batches():
+    long = np.zeros(BATCH_WINDOW_SAMPLES + 1, np.float32)
+    assert _Request("transcribe", long, "tiny", {}).key[-1] is False
+    assert _Request("language", long, "tiny", {}).key[-1] is True
+    assert _Request("transcribe", clip(), "tiny", {}, profile=object()).key[-1] is False
+
+
+def test_requests_for_a_loading_model_wait_without_blocking_others(batches):
+    base = StubLoader(done=False)
+    scheduler = BatchScheduler(StubRegistry(tiny=StubLoader(), base=base))
+    waiting = scheduler.submit(clip(), "base")
+    assert scheduler.submit(clip(), "tiny").result(timeout=5)["text"] == "tiny 16000"
+    assert not waiting.done()
+
+    base.finish()
+    assert waiting.result(timeout=5)["text"] == "base 16000"
+
+
+def test_a_failed_model_pass_fails_every_request_in_the_batch(batches):
+    scheduler = BatchScheduler(StubRegistry(tiny=StubLoader()), max_wait_ms=200)
+    futures = submit_all(scheduler, [(clip(), "tiny", {"fail": True})] * 2)
+    for future in futures:
+        with pytest.raises(RuntimeError, match="decode failed"):
+            future.result(timeout=5)
+
+
+def test_a_request_that_cannot_be_grouped_fails_alone(batches):
+    scheduler = BatchScheduler(StubRegistry(tiny=StubLoader()), max_wait_ms=200)
+    bad, good = submit_all(scheduler, [
+        (clip(), "tiny", {"temperature": [0.0, 0.2]}),
+        (clip(), "tiny", {}),
+    ])
+    with pytest.raises(TypeError):
+        bad.result(timeout=5)
+    assert good.result(timeout=5)["text"] == "tiny 16000"
+
+
+def test_the_scheduler_survives_a_broken_registry(batches):
+    class BrokenRegistry(StubRegistry):
+        def loader(self, model_name, precision=None):
+            if model_name == "broken":
+                raise RuntimeError("registry broke")
+            return super().loader(model_name, precision)
+
+    scheduler = BatchScheduler(BrokenRegistry(tiny=StubLoader()))
+    with pytest.raises(RuntimeError, match="registry broke"):
+        scheduler.submit(clip(), "broken").result(timeout=5)
+    assert scheduler.submit(clip(), "tiny").result(timeout=5)["text"] == "tiny 16000"
+    assert scheduler._thread.is_alive()
+
+
+def test_concurrent_callers_all_get_their_own_result(batches):
+    scheduler = BatchScheduler(StubRegistry(tiny=StubLoader()), max_batch_size=4)
+    results = {}
+
+    def call(i):
+        results[i] = scheduler.transcribe(clip(i + 1), "tiny")["text"]
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert results == {i: f"tiny {(i + 1) * 16000}" for i in range(10)}
+    assert max(scheduler.batch_sizes) <= 4
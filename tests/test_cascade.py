@@ -0,0 +1,178 @@
+import numpy as np
+import pytest
+
+import service
+from cascade import CascadeDetector, CascadeModel, escalation_spans, needs_escalation
+from jobs import estimate_cost
+
+SAMPLE_RATE = 16000
+
+
+def segment(start, end, avg_logprob=-0.1, text=" x", **fields):
+    return {
+        "start": start, "end": end, "text": text, "tokens": [1], "avg_logprob": avg_logprob,
+        "compression_ratio": 1.0, "no_speech_prob": 0.0, **fields,
+    }
+
+
+# Transcribes any clip as two halves at the given confidence, and logs every call
+class StubModel:
+    def __init__(self, name, log, avg_logprob=-0.1):
+        self.name = name
+        self.log = log
+        self.avg_logprob = avg_logprob
+
+    def transcribe(self, samples, **options):
+        self.log.append((self.name, "transcribe", len(samples) / SAMPLE_RATE))
+        half = len(samples) / SAMPLE_RATE / 2
+        return {
+            "text": f" {self.name} {self.name}",
+            "language": options.get("language") or "en",
+            "segments": [
+                segment(0.0, half, self.avg_logprob, f" {self.name}"),
+                segment(half, 2 * half, self.avg_logprob, f" {self.name}"),
+            ],
+        }
+
+    def detect_language(self, samples):
+        self.log.append((self.name, "language", len(samples) / SAMPLE_RATE))
+        return {"en": 1.0}
+
+
+def test_needs_escalation_on_any_weak_signal():
+    assert not needs_escalation(segment(0, 1))
+    assert needs_escalation(segment(0, 1, avg_logprob=-0.8))
+    assert needs_escalation(segment(0, 1, compression_ratio=2.5))
+    assert needs_escalation(segment(0, 1, no_speech_prob=0.7))
+    assert not needs_escalation(segment(0, 1, avg_logprob=-0.8), logprob_threshold=-1.0)
+
+
+def test_escalation_spans_cover_the_gaps_and_merge_neighbours():
+    segments = [segment(0.5, 2.0), segment(2.5, 4.0), segment(4.2, 6.0), segment(7.0, 8.0)]
+    assert escalation_spans(segments, [False, False, False, False], 10.0) == []
+    # From the end of the previous segment to the start of the next
+    assert escalation_spans(segments, [False, True, False, False], 10.0) == [(2.0, 4.2)]
+    # The first and last reach the clip's edges; flagged neighbours merge
+    assert escalation_spans(segments, [True, True, False, True], 10.0) == [(0.0, 4.2), (6.0, 10.0)]
+
+
+def test_a_confident_fast_model_costs_only_its_own_pass():
+    log = []
+    model = CascadeModel(StubModel("tiny", log), StubModel("large", log), "tiny", "large")
+    result = model.transcribe(np.zeros(10 * SAMPLE_RATE, np.float32))
+
+    assert log == [("tiny", "transcribe", 10.0)]
+    assert result["text"] == "tiny tiny"
+    summary = result["cascade"]
+    assert summary["escalated_seconds"] == 0
+    assert summary["cost"] == estimate_cost(10, "tiny")
+    assert summary["full_cost"] == estimate_cost(10, "large")
+
+
+def test_only_unsure_spans_go_to_the_accurate_model():
+    log = []
+
+    class HalfSure(StubModel):
+        def transcribe(self, samples, **options):
+            result = super().transcribe(samples, **options)
+            result["segments"][1]["avg_logprob"] = -0.9
+            return result
+
+    model = CascadeModel(HalfSure("tiny", log), StubModel("large", log), "tiny", "large")
+    result = model.transcribe(np.zeros(10 * SAMPLE_RATE, np.float32), language="de")
+
+    assert log == [("tiny", "transcribe", 10.0), ("large", "transcribe", 5.0)]
+    assert [(s["id"], s["start"], s["end"], s["text"]) for s in result["segments"]] == [
+        (0, 0.0, 5.0, " tiny"), (1, 5.0, 7.5, " large"), (2, 7.5, 10.0, " large"),
+    ]
+    summary = result["cascade"]
+    assert (summary["segments"], summary["escalated_segments"], summary["escalated_seconds"]) == (2, 1, 5.0)
+    assert summary["cost"] == estimate_cost(10, "tiny") + estimate_cost(5, "large")
+    assert summary["cost"] < summary["full_cost"]
+
+
+def test_the_detector_counts_one_window_per_call():
+    log = []
+    detector = CascadeDetector(StubModel("tiny", log).detect_language, "tiny", "large")
+    assert detector.add_cost({"cost": 1.0}) == {"cost": 1.0}
+
+    detector(np.zeros(60 * SAMPLE_RATE, np.float32))
+    assert detector.add_cost({"cost": 1.0, "full_cost": 2.0}) == {
+        "cost": 1.0 + estimate_cost(30, "tiny"),
+        "full_cost": 2.0 + estimate_cost(30, "large"),
+    }
+
+
+class StubScheduler:
+    def __init__(self, log, confidence):
+        self.log = log
+        self.confidence = confidence
+
+    def model(self, model_name, profile=None, precision=None):
+        return StubModel(model_name, self.log, self.confidence.get(model_name, -0.1))
+
+
+class StubRegistry:
+    def loader(self, model_name, device=None, precision=None):
+        pass
+
+    def mark_served(self, model_name, device=None, precision=None):
+        pass
+
+
+@pytest.fixture
+def make_service(monkeypatch):
+    monkeypatch.setattr(service, "ModelRegistry", lambda **options: StubRegistry())
+
+    def make(cascade_model, confidence=None):
+        log = []
+        monkeypatch.setattr(
+            service, "BatchScheduler", lambda registry, **options: StubScheduler(log, confidence or {})
+        )
+        return service.TranscriptionService(
+            model_name="tiny", vad=False, cascade_model=cascade_model, job_workers=1
+        ), log
+
+    return make
+
+
+def clip(seconds):
+    return np.full(int(seconds * SAMPLE_RATE), 0.01, np.float32)
+
+
+def test_models_no_larger_than_the_cascade_model_run_alone(make_service):
+    svc, log = make_service("base")
+    for model_name in ("tiny", "base"):
+        result = svc.transcribe(SAMPLE_RATE, clip(8), model_name=model_name)
+        assert "cascade" not in result
+        assert {name for name, _, _ in log} == {model_name}
+        log.clear()
+    assert svc.cascade_stats.summary()["requests"] == 0
+
+
+def test_cascading_a_larger_model_costs_less_than_running_it_alone(make_service):
+    svc, log = make_service("base")
+    result = svc.transcribe(SAMPLE_RATE, clip(8), model_name="small")
+
+    assert log == [("base", "language", 8.0), ("base", "transcribe", 8.0)]
+    summary = result["cascade"]
+    assert summary["fast_model"] == "base"
+    assert summary["cost"] == estimate_cost(16, "base")
+    assert summary["full_cost"] == estimate_cost(16, "small")
+    assert summary["cost"] < summary["full_cost"]
+
+
+def test_an_unsure_fast_model_escalates_everything(make_service):
+    svc, log = make_service("tiny", confidence={"tiny": -0.9})
+    result = svc.transcribe(SAMPLE_RATE, clip(8), model_name="large-v3", language="en")
+
+    assert log == [("tiny", "transcribe", 8.0), ("large-v3", "transcribe", 8.0)]
+    assert result["text"] == "large-v3 large-v3"
+    assert result["cascade"]["cost"] == estimate_cost(8, "tiny") + estimate_cost(8, "large-v3")
+
+
+def test_unknown_models_fail_before_any_model_runs(make_service):
+    svc, log = make_service("base")
+    with pytest.raises(ValueError, match="Unknown model"):
+        svc.transcribe(SAMPLE_RATE, clip(8), model_name="huge")
+    assert log == []
@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+
+from jobs import JobCancelled, JobQueue, estimate_cost
+
+
+# A one-worker queue kept busy by a job that runs until release() is called, so
+# everything submitted meanwhile queues up
+class BusyQueue:
+    def __init__(self, max_wait_seconds=60):
+        self.queue = JobQueue(workers=1, max_wait_seconds=max_wait_seconds)
+        self.gate = threading.Event()
+        started = threading.Event()
+
+        def block(progress):
+            started.set()
+            self.gate.wait(5)
+
+        self.blocker = self.queue.submit(block, 1.0, 0.0)
+        assert started.wait(5)
+        self.order = []
+
+    def submit(self, name, cost):
+        return self.queue.submit(lambda progress: self.order.append(name) or name, cost, cost)
+
+    def release(self, *jobs):
+        self.gate.set()
+        for job in jobs:
+            job.future.result(timeout=5)
+
+
+def test_cheapest_job_runs_first():
+    busy = BusyQueue()
+    jobs = [busy.submit("long", 30), busy.submit("short", 5), busy.submit("medium", 10)]
+    assert [busy.queue.position(job) for job in jobs] == [3, 1, 2]
+
+    busy.release(*jobs)
+    assert busy.order == ["short", "medium", "long"]
+    assert busy.queue.stats()["starvation_promotions"] == 0
+
+
+def test_equal_costs_run_in_submission_order():
+    busy = BusyQueue()
+    jobs = [busy.submit(name, 5) for name in ("a", "b", "c")]
+    busy.release(*jobs)
+    assert busy.order == ["a", "b", "c"]
+
+
+def test_a_job_waiting_past_max_wait_goes_next_whatever_its_cost():
+    busy = BusyQueue(max_wait_seconds=0.2)
+    long = busy.submit("long", 100)
+    time.sleep(0.3)
+    short = busy.submit("short", 1)
+    assert busy.queue.position(long) == 1
+
+    busy.release(long, short)
+    assert busy.order == ["long", "short"]
+    assert busy.queue.stats()["starvation_promotions"] == 1
+
+
+def test_cancelling_a_queued_job_removes_it():
+    busy = BusyQueue()
+    cancelled = busy.submit("cancelled", 1)
+    kept = busy.submit("kept", 2)
+    busy.queue.cancel(cancelled)
+
+    busy.release(kept)
+    assert cancelled.future.cancelled()
+    assert cancelled.state == "cancelled"
+    assert busy.order == ["kept"]
+    assert busy.queue.position(cancelled) is None
+
+
+def test_cancelling_a_running_job_stops_it_at_its_next_progress_call():
+    queue = JobQueue(workers=1)
+    running = threading.Event()
+    proceed = threading.Event()
+
+    def run(progress):
+        progress(1.0)
+        running.set()
+        proceed.wait(5)
+        progress(2.0)
+        return "finished"
+
+    job = queue.submit(run, 4.0, 4.0)
+    assert running.wait(5)
+    assert job.fraction == 0.25
+    queue.cancel(job)
+    proceed.set()
+
+    with pytest.raises(JobCancelled):
+        job.future.result(timeout=5)
+    assert job.state == "cancelled"
+    assert queue.stats()["cancelled"] == 1
+
+
+def test_a_failing_job_is_counted_and_the_worker_carries_on():
+    queue = JobQueue(workers=1)
+
+    def fail(progress):
+        raise ValueError("bad audio")
+
+    failed = queue.submit(fail, 1.0, 1.0)
+    with pytest.raises(ValueError):
+        failed.future.result(timeout=5)
+    assert queue.submit(lambda progress: "ok", 1.0, 1.0).future.result(timeout=5) == "ok"
+    stats = queue.stats()
+    assert (stats["failed"], stats["completed"], stats["running"]) == (1, 1, 0)
+
+
+def test_estimate_cost_scales_with_model_size_and_translation():
+    assert estimate_cost(10, "tiny") == 10
+    assert estimate_cost(10, "large-v3") == 240
+    assert estimate_cost(10, "base", translate=True) == 40
+    # Unknown names are priced like the largest model
+    assert estimate_cost(1, "custom") == 24
@@ -0,0 +1,41 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from workers import _Job, _read_batch, _write_batch
+
+
+def test_a_batch_survives_the_shared_memory_handoff():
+    rng = np.random.default_rng(0)
+    batch = [rng.standard_normal(n).astype(np.float32) for n in (16000, 1, 48000)]
+    shm, lengths = _write_batch(batch)
+    try:
+        clips = _read_batch(shm.name, lengths)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    assert lengths == [16000, 1, 48000]
+    for clip, samples in zip(clips, batch):
+        np.testing.assert_array_equal(clip, samples)
+    # Private copies: nothing keeps the segment mapped
+    assert all(clip.base is not None and clip.base.base is None for clip in clips)
+
+
+def test_empty_clips_and_batches_still_get_a_segment():
+    shm, lengths = _write_batch([np.zeros(0, np.float32)])
+    try:
+        assert [len(clip) for clip in _read_batch(shm.name, lengths)] == [0]
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_releasing_a_job_unlinks_its_segment():
+    shm, lengths = _write_batch([np.ones(10, np.float32)])
+    job = _Job(("transcribe", "tiny", shm.name, lengths, {}, False, None), shm)
+    job.release()
+    job.release()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=job.message[2])
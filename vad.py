@@ -0,0 +1,99 @@
+import numpy as np
+
+from audio import SAMPLE_RATE
+
+FRAME_SECONDS = 0.03
+# Speech must be this far above the clip's noise floor (or simply loud, for clips
+# with no pauses to estimate the floor from), and above an absolute floor
+ENERGY_MARGIN_DB = 10.0
+LOUD_DB = -35.0
+MIN_ENERGY_DB = -50.0
+# Noise tends towards a flat spectrum, voiced speech doesn't
+MAX_FLATNESS = 0.4
+# Keep this much audio around speech, and only cut silences longer than min_silence
+PAD_SECONDS = 0.2
+MIN_SILENCE_SECONDS = 0.6
+MIN_SPEECH_SECONDS = 0.1
+
+
+# Per-frame speech mask from short-time energy and spectral flatness
+def speech_frames(samples, frame_seconds=FRAME_SECONDS):
+    frame = int(frame_seconds * SAMPLE_RATE)
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return np.zeros(0, dtype=bool), frame
+
+    frames = samples[:n_frames * frame].reshape(n_frames, frame)
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    noise_floor = np.percentile(energy_db, 10)
+    threshold = max(min(noise_floor + ENERGY_MARGIN_DB, LOUD_DB), MIN_ENERGY_DB)
+    loud = energy_db > threshold
+
+    power = np.abs(np.fft.rfft(frames * np.hanning(frame), axis=1)) ** 2 + 1e-10
+    flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+    return loud & (flatness < MAX_FLATNESS), frame
+
+
+# Speech regions of a 16 kHz clip as [start, end) sample intervals
+def detect_speech(samples, pad_seconds=PAD_SECONDS, min_silence_seconds=MIN_SILENCE_SECONDS,
+                  min_speech_seconds=MIN_SPEECH_SECONDS):
+    mask, frame = speech_frames(samples)
+    if not mask.any():
+        return SpeechMap([], len(samples))
+
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], mask.astype(np.int8), [0]])))
+    starts = np.maximum(edges[0::2] * frame - int(pad_seconds * SAMPLE_RATE), 0)
+    ends = np.minimum(edges[1::2] * frame + int(pad_seconds * SAMPLE_RATE), len(samples))
+
+    # Only cut silences longer than min_silence_seconds; merge regions across shorter gaps
+    gaps = starts[1:] - ends[:-1]
+    split = np.concatenate([[True], gaps >= min_silence_seconds * SAMPLE_RATE])
+    starts = starts[split]
+    ends = ends[np.concatenate([split[1:], [True]])]
+
+    keep = (ends - starts) >= min_speech_seconds * SAMPLE_RATE
+    intervals = [(int(s), int(e)) for s, e in zip(starts[keep], ends[keep])]
+    return SpeechMap(intervals, len(samples))
+
+
+# Maps between the original clip and the compacted, silence-free audio sent to the model
+class SpeechMap:
+    def __init__(self, intervals, total_samples):
+        self.intervals = intervals
+        self.total_samples = total_samples
+        lengths = np.array([end - start for start, end in intervals], dtype=np.int64)
+        self._offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+    def __bool__(self):
+        return bool(self.intervals)
+
+    @property
+    def speech_samples(self):
+        return int(self._offsets[-1])
+
+    @property
+    def skipped_seconds(self):
+        return (self.total_samples - self.speech_samples) / SAMPLE_RATE
+
+    def compact(self, samples):
+        if len(self.intervals) == 1 and self.intervals[0] == (0, len(samples)):
+            return samples
+        return np.concatenate([samples[start:end] for start, end in self.intervals])
+
+    # Time in the compacted audio -> time in the original clip
+    def to_original(self, seconds):
+        position = seconds * SAMPLE_RATE
+        index = int(np.searchsorted(self._offsets, position, side="right")) - 1
+        index = min(max(index, 0), len(self.intervals) - 1)
+        start, _ = self.intervals[index]
+        return (start + position - self._offsets[index]) / SAMPLE_RATE
+
+    # Rewrite segment (and word) timestamps of a transcribe() result in place
+    def remap(self, result):
+        for segment in result.get("segments", []):
+            segment["start"] = self.to_original(segment["start"])
+            segment["end"] = self.to_original(segment["end"])
+            for word in segment.get("words", []):
+                word["start"] = self.to_original(word["start"])
+                word["end"] = self.to_original(word["end"])
+        return result
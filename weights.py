@@ -0,0 +1,146 @@
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import torch
+import whisper
+from torch import nn
+from whisper.model import ModelDimensions, Whisper
+
+MMAP_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "whisper-mmap")
+DTYPES = {"fp32": torch.float32, "fp16": torch.float16}
+
+
+def mmap_path(model_name, precision="fp32", cache_dir=None):
+    return os.path.join(cache_dir or MMAP_CACHE_DIR, f"{model_name}-{precision}.pt")
+
+
+# Rewrite a Whisper checkpoint as weights already in the serving dtype, plus the
+# non-persistent buffers (causal mask, alignment heads) that the checkpoint leaves
+# for the constructor to build, so loading needs no compute at all
+def convert_weights(model_name, precision="fp32", cache_dir=None):
+    path = mmap_path(model_name, precision, cache_dir)
+    model = whisper.load_model(model_name, device="cpu").to(DTYPES[precision])
+    state = model.state_dict()
+    buffers = {
+        name: (buffer.to_dense(), buffer.is_sparse)
+        for name, buffer in model.named_buffers() if name not in state
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    torch.save({"dims": vars(model.dims), "state": state, "buffers": buffers}, tmp)
+    os.replace(tmp, path)
+    return path
+
+
+# Layers whose constructors randomly initialize weights. Skipping that leaves their
+# storage allocated but never touched, so it costs neither time nor resident memory
+# before load_state_dict(assign=True) swaps in the mapped tensors. (Building on the
+# meta device instead pulls in torch's Python reference ops: ~2 s and 150 MB.)
+_INITIALIZED_LAYERS = (nn.Linear, nn.Conv1d, nn.Embedding)
+# The patch is process-wide: models loading concurrently (e.g. a model and its draft)
+# take turns, or one could save the other's no-op and restore it for good
+_skip_init_lock = threading.Lock()
+
+
+@contextmanager
+def skip_init():
+    with _skip_init_lock:
+        originals = {cls: cls.reset_parameters for cls in _INITIALIZED_LAYERS}
+        for cls in originals:
+            cls.reset_parameters = lambda self: None
+        try:
+            yield
+        finally:
+            for cls, reset in originals.items():
+                cls.reset_parameters = reset
+
+
+# Model whose weights are a read-only memory map of the converted file (written on
+# first use). Pages come from the OS page cache, so loading is near-instant once
+# the file is cached and every process on the machine shares one copy of the
+# weights. Pages are mapped copy-on-write, so nothing can modify the file.
+def load_mmapped(model_name, precision="fp32", device="cpu", cache_dir=None):
+    path = mmap_path(model_name, precision, cache_dir)
+    if not os.path.exists(path):
+        convert_weights(model_name, precision, cache_dir)
+    checkpoint = torch.load(path, mmap=True, weights_only=True, map_location="cpu")
+    with skip_init():
+        model = Whisper(ModelDimensions(**checkpoint["dims"]))
+    model.load_state_dict(checkpoint["state"], assign=True)
+    for name, (buffer, sparse) in checkpoint["buffers"].items():
+        owner, _, leaf = name.rpartition(".")
+        module = model.get_submodule(owner) if owner else model
+        module.register_buffer(leaf, buffer.to_sparse() if sparse else buffer, persistent=False)
+    return model.to(device)
+
+
+# Resident and proportional set size in MB. PSS splits shared pages between the
+# processes mapping them, so it shows what each worker really costs.
+def memory_mb():
+    usage = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    usage[key.lower()] = int(value.split()[0]) / 1024
+    except OSError:
+        import resource
+
+        usage["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return usage
+
+
+# One worker: load, run a short decode (which touches every weight page) and report
+# memory while all workers of the run are still alive
+def _measure(model_name, loader, barrier):
+    start = time.perf_counter()
+    if loader == "mmap":
+        model = load_mmapped(model_name)
+    else:
+        model = whisper.load_model(model_name, device="cpu")
+    load_seconds = time.perf_counter() - start
+    model.transcribe(np.zeros(16000, np.float32), temperature=0.0, fp16=False)
+    barrier.wait()
+    report = {"loader": loader, "load_seconds": load_seconds, **memory_mb()}
+    barrier.wait()
+    return report
+
+
+# Checkpoint loading vs memory-mapped weights: start-up time and per-worker memory
+# with N workers holding the same model
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare checkpoint and memory-mapped weight loading")
+    parser.add_argument("--model", default="small")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--json", help="also write the report here")
+    args = parser.parse_args()
+
+    # Convert up front so the mmap run measures a normal cached start
+    if not os.path.exists(mmap_path(args.model)):
+        convert_weights(args.model)
+
+    context = multiprocessing.get_context("spawn")
+    reports = []
+    for loader in ("checkpoint", "mmap"):
+        with context.Manager() as manager, context.Pool(args.workers) as pool:
+            barrier = manager.Barrier(args.workers)
+            reports.extend(pool.starmap(_measure, [(args.model, loader, barrier)] * args.workers))
+
+    print(f"{args.model}, {args.workers} workers")
+    print(f"{'loader':>10} {'load_s':>7} {'rss_mb':>8} {'pss_mb':>8}")
+    for loader in ("checkpoint", "mmap"):
+        rows = [r for r in reports if r["loader"] == loader]
+        load = sum(r["load_seconds"] for r in rows) / len(rows)
+        rss = sum(r["rss"] for r in rows) / len(rows)
+        pss = sum(r.get("pss", r["rss"]) for r in rows) / len(rows)
+        print(f"{loader:>10} {load:>7.2f} {rss:>8.0f} {pss:>8.0f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
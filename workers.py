@@ -0,0 +1,368 @@
+import cProfile
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import numpy as np
+import whisper
+
+from batching import run_batch
+from cache import EncoderCache
+from metrics import StageTimer, active_timer
+from models import PROCESS_START, default_device, init_worker, worker_registry
+from speculative import DRAFT_TOKENS
+
+# How often a waiting supervisor checks that its worker is still alive
+POLL_SECONDS = 0.5
+# Longest wait before respawning a worker that keeps dying on start-up
+MAX_RESTART_DELAY = 30.0
+
+
+# A batch's clips back to back in a new shared-memory segment, and their lengths.
+# The caller owns the segment: close and unlink it once the worker has read it.
+def _write_batch(batch):
+    lengths = [len(samples) for samples in batch]
+    shm = shared_memory.SharedMemory(create=True, size=max(1, 4 * sum(lengths)))
+    flat = np.ndarray((sum(lengths),), np.float32, buffer=shm.buf)
+    offset = 0
+    for samples in batch:
+        flat[offset:offset + len(samples)] = samples
+        offset += len(samples)
+    del flat
+    return shm, lengths
+
+
+# Clips of a batch copied out of the parent's shared-memory segment. The copy is
+# private to this process, so the mel and encoder caches never pin the segment.
+def _read_batch(shm_name, lengths):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        view = np.ndarray((sum(lengths),), np.float32, buffer=shm.buf)
+        flat = view.copy()
+        del view
+    finally:
+        shm.close()
+    offsets = np.cumsum([0] + list(lengths))
+    return [flat[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def _worker_health(encoder_cache):
+    return {
+        "pid": os.getpid(),
+        "models": worker_registry().health()["models"],
+        "encoder_cache": encoder_cache.stats() if encoder_cache else None,
+    }
+
+
+def _worker_main(conn, threads, cpus, preload, precision, mmap_weights, draft_model, draft_tokens,
+                 encoder_cache_mb):
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    init_worker(
+        threads, precision=precision, mmap_weights=mmap_weights, draft_model=draft_model,
+        draft_tokens=draft_tokens,
+    )
+    for model_name in preload:
+        try:
+            worker_registry().get(model_name)
+        except Exception as e:
+            # Reported through health/status; the worker still serves other models
+            print(f"⚠️ Worker {os.getpid()} could not preload '{model_name}': {e}")
+    encoder_cache = EncoderCache(encoder_cache_mb) if encoder_cache_mb else None
+    conn.send(("ready", None, _worker_health(encoder_cache)))
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        kind, model_name, shm_name, lengths, options, profile, precision = job
+        try:
+            batch = _read_batch(shm_name, lengths)
+            model = worker_registry().get(model_name, precision=precision)
+            timer = StageTimer()
+            profiler = cProfile.Profile() if profile else None
+            if profiler is not None:
+                profiler.enable()
+            try:
+                with active_timer(timer):
+                    results = run_batch(model, kind, batch, options, encoder_cache)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+            stats = None
+            if profiler is not None:
+                profiler.create_stats()
+                stats = profiler.stats
+            reply = ("ok", (results, timer.stages, timer.counts, stats))
+        except Exception as e:
+            reply = ("error", e)
+        health = _worker_health(encoder_cache)
+        try:
+            conn.send((*reply, health))
+        except Exception as e:
+            # The result or exception didn't pickle; report that instead
+            conn.send(("error", RuntimeError(f"{type(e).__name__}: {e}"), health))
+
+
+class _Job:
+    __slots__ = ("message", "shm", "future")
+
+    def __init__(self, message, shm):
+        self.message = message
+        self.shm = shm
+        self.future = Future()
+
+    def release(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+class _Slot:
+    def __init__(self, index, cpus):
+        self.index = index
+        self.cpus = cpus
+        self.process = None
+        self.conn = None
+        self.health = None
+        self.busy_since = None
+        self.jobs = 0
+        self.restarts = 0
+        self.ready = threading.Event()
+
+
+# Inference worker processes, each holding its own models, encoder cache and torch
+# threads, optionally pinned to its own CPUs. Batches are handed over in one
+# shared-memory segment rather than pickled, and any idle worker takes the next one.
+# With mmap_weights the workers share one page-cache copy of each model's weights,
+# and with a draft_model each worker decodes speculatively (see speculative.py).
+#
+# A supervisor thread per worker watches its process: a worker that dies or runs a
+# batch for longer than job_timeout seconds is killed and respawned, and only the
+# batch it was running fails.
+#
+# Stands in for the service's ModelRegistry (loader/status/mark_served/health), so the
+# UI and /health report the workers' models while this process loads none.
+class InferencePool:
+    def __init__(self, workers=2, threads_per_worker=None, cpu_affinity=False, preload=(),
+                 precision="fp32", job_timeout=600, encoder_cache_mb=256, mmap_weights=False,
+                 draft_model=None, draft_tokens=DRAFT_TOKENS):
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+        cpus = cpus or list(range(os.cpu_count() or 1))
+        self.workers = workers
+        self.threads = threads_per_worker or max(1, len(cpus) // workers)
+        self.precision = precision
+        self.job_timeout = job_timeout
+        self.first_request_seconds = None
+        self._args = (tuple(preload), precision, mmap_weights, draft_model, draft_tokens, encoder_cache_mb)
+        self._context = multiprocessing.get_context("spawn")
+        self._jobs = queue.Queue()
+        self._closed = False
+        self._slots = []
+        for index in range(workers):
+            pinned = None
+            if cpu_affinity:
+                pinned = {cpus[(index * self.threads + k) % len(cpus)] for k in range(self.threads)}
+            self._slots.append(_Slot(index, pinned))
+        self._threads = [
+            threading.Thread(target=self._supervise, args=(slot,), name=f"inference-worker-{slot.index}",
+                             daemon=True)
+            for slot in self._slots
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def fp16(self):
+        return self.precision == "fp16" and default_device() != "cpu"
+
+    # Future for (results, stages, counts, cProfile stats or None) of one batch;
+    # precision overrides the workers' own for this batch
+    def submit(self, kind, model_name, batch, options, profile=False, precision=None):
+        shm, lengths = _write_batch(batch)
+        job = _Job((kind, model_name, shm.name, lengths, options, profile, precision), shm)
+        if self._closed:
+            job.release()
+            raise RuntimeError("Inference pool is shut down")
+        self._jobs.put(job)
+        return job.future
+
+    # Block until every worker has started (and loaded its preload models)
+    def wait_ready(self, timeout=None):
+        for slot in self._slots:
+            if not slot.ready.wait(timeout):
+                raise TimeoutError(f"Inference worker {slot.index} is still starting")
+        return self
+
+    def _supervise(self, slot):
+        delay = 1.0
+        while not self._closed:
+            if not self._spawn(slot):
+                time.sleep(delay)
+                delay = min(2 * delay, MAX_RESTART_DELAY)
+                continue
+            delay = 1.0
+            if not self._serve(slot):
+                return
+
+    def _spawn(self, slot):
+        parent, child = self._context.Pipe()
+        slot.process = self._context.Process(
+            target=_worker_main, args=(child, self.threads, slot.cpus, *self._args),
+            name=f"inference-worker-{slot.index}", daemon=True,
+        )
+        slot.process.start()
+        child.close()
+        slot.conn = parent
+        while slot.process.is_alive():
+            if parent.poll(POLL_SECONDS):
+                try:
+                    _, _, slot.health = parent.recv()
+                except (EOFError, OSError):
+                    break
+                slot.ready.set()
+                return True
+        self._kill(slot)
+        print(f"⚠️ Inference worker {slot.index} exited during start-up (code {slot.process.exitcode})")
+        return False
+
+    # Runs jobs on the slot's worker; False once the pool is shut down, True when
+    # the worker has to be replaced
+    def _serve(self, slot):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                self._stop(slot)
+                return False
+            if not slot.process.is_alive():
+                # Died while idle: hand the batch to another worker and replace this one
+                self._jobs.put(job)
+                self._kill(slot)
+                slot.restarts += 1
+                print(f"⚠️ Inference worker {slot.index} exited (code {slot.process.exitcode}); restarting it")
+                return True
+            if not job.future.set_running_or_notify_cancel():
+                job.release()
+                continue
+            slot.busy_since = time.monotonic()
+            try:
+                reply = self._call(slot, job)
+            finally:
+                slot.busy_since = None
+                job.release()
+            slot.jobs += 1
+
+            if reply is None:
+                reason = (
+                    f"crashed (exit code {slot.process.exitcode})" if not slot.process.is_alive()
+                    else f"hung for over {self.job_timeout:.0f}s"
+                )
+                self._kill(slot)
+                slot.restarts += 1
+                print(f"⚠️ Inference worker {slot.index} {reason}; restarting it")
+                job.future.set_exception(RuntimeError(f"Inference worker {reason}"))
+                return True
+            status, payload, slot.health = reply
+            if status == "ok":
+                job.future.set_result(payload)
+            else:
+                job.future.set_exception(payload)
+
+    # The worker's reply, or None if it died or timed out
+    def _call(self, slot, job):
+        try:
+            slot.conn.send(job.message)
+        except OSError:
+            return None
+        deadline = time.monotonic() + self.job_timeout
+        while time.monotonic() < deadline:
+            if slot.conn.poll(POLL_SECONDS):
+                try:
+                    return slot.conn.recv()
+                except (EOFError, OSError):
+                    return None
+            if not slot.process.is_alive():
+                return None
+        return None
+
+    def _kill(self, slot):
+        slot.ready.clear()
+        if slot.process.is_alive():
+            slot.process.kill()
+        slot.process.join()
+        slot.conn.close()
+
+    def _stop(self, slot):
+        try:
+            slot.conn.send(None)
+        except OSError:
+            pass
+        slot.process.join(5)
+        self._kill(slot)
+
+    def shutdown(self):
+        self._closed = True
+        for _ in self._slots:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    # ModelRegistry-compatible surface for the service and the UI. Workers load
+    # models on first use, so loader() only validates the name.
+    def loader(self, model_name, device=None, precision=None):
+        if model_name not in whisper.available_models():
+            raise ValueError(f"Unknown model '{model_name}'")
+
+    def mark_served(self, model_name, device=None, precision=None):
+        if self.first_request_seconds is None:
+            self.first_request_seconds = time.perf_counter() - PROCESS_START
+            print(f"Cold start to first served request: {self.first_request_seconds:.1f}s")
+
+    def status(self, model_name, device=None, precision=None):
+        started = [slot for slot in self._slots if slot.ready.is_set()]
+        if not started:
+            return f"⏳ Starting {self.workers} inference workers..."
+        models = [
+            m for slot in started for m in slot.health["models"] if m["model"] == model_name
+        ]
+        failed = [m for m in models if m["stage"] == "failed"]
+        if failed:
+            return f"❌ Model '{model_name}' failed to load: {failed[0]['error']}"
+        ready = sum(m["ready"] for m in models)
+        if not ready:
+            return f"💤 Model '{model_name}' not loaded (loads on first use in each worker)"
+        return f"🟢 Model '{model_name}' ready in {ready}/{self.workers} inference workers"
+
+    def health(self):
+        models, workers = [], []
+        for slot in self._slots:
+            health = slot.health or {"pid": None, "models": [], "encoder_cache": None}
+            models.extend({**m, "worker": slot.index} for m in health["models"])
+            busy = slot.busy_since
+            workers.append({
+                "worker": slot.index,
+                "pid": health["pid"],
+                "ready": slot.ready.is_set(),
+                "cpus": sorted(slot.cpus) if slot.cpus else None,
+                "threads": self.threads,
+                "jobs": slot.jobs,
+                "restarts": slot.restarts,
+                "busy_seconds": None if busy is None else round(time.monotonic() - busy, 1),
+                "encoder_cache": health["encoder_cache"],
+            })
+        return {
+            "budget_mb": None,
+            "resident_mb": round(sum(m["resident_mb"] for m in models if m["ready"]), 1),
+            "evictions": 0,
+            "models": models,
+            "workers": workers,
+            "queued_batches": self._jobs.qsize(),
+        }